@@ -3,20 +3,15 @@ import sys
 
 
 from sentence_classifier.utils.config import Config
-from sentence_classifier.utils.one_hot_encoding import OneHotEncoder
-from sentence_classifier.utils.vocab import VocabUtils
-from sentence_classifier.preprocessing.dataloading import DatasetQuestions
-from sentence_classifier.preprocessing.reader import load
-from sentence_classifier.models.model import Model
-from sentence_classifier.utils.one_hot_labels import OneHotLabels
-from sentence_classifier.preprocessing.tokenisation import parse_tokens
 
-from torch.utils.data import DataLoader
-import torch
+from typing import Optional, TYPE_CHECKING
 
-from typing import Callable
+if TYPE_CHECKING:
+    from sentence_classifier.models.model import Model
 
 
+SAVED_MODEL_DIR = "../data/saved_models/model"
+
 # Rules used during tokenisation.
 tokenisation_rules = {
     "TOKENISE_QUOTES": True,
@@ -32,62 +27,55 @@ tokenisation_rules = {
 }
 
 
-def train_model(model: Model, training_data_file_path: str, loss_fn: Callable,
-                num_epochs: int, optimizer: torch.optim.Optimizer):
-
-    torch.manual_seed(42)
-    model.train()
-
-    questions, labels = load(training_data_file_path)
-    one_hot_labels = OneHotLabels.from_labels_json_file("../data/labels.json")
+def test_model(model: 'Model', test_dataset_file_path: str, batch_size: Optional[int] = None) -> float:
+    """
+    Given a trained model, runs it against a test dataset and reports the accuracy and F1 scores, and the one-vs-rest
+    ROC AUC, micro and macro, with bootstrap confidence intervals. The test file is streamed in batches; only the
+    label log-probabilities are kept, for the ROC curves, not the questions
+    :param model:
+    :param batch_size: the number of questions run at once, EVALUATION_BATCH_SIZE by default
+    :return: the accuracy
+    """
+    import torch
 
-    for epoch in range(num_epochs):
-        for count in range(len(questions)):
-            question = questions[count]
-            label = labels[count]
+    from sentence_classifier.analysis import roc
+    from sentence_classifier.models.training import EVALUATION_BATCH_SIZE, evaluate_log_probabilities
 
-            yhat = model(parse_tokens(question))
+    metrics = roc.StreamingMetrics(model.classifier.output_dim)
+    label_idxs, log_probabilities = [], []
+    for batch_label_idxs, batch_log_probabilities in evaluate_log_probabilities(
+            model, test_dataset_file_path, batch_size=batch_size if batch_size is not None else EVALUATION_BATCH_SIZE):
+        metrics.update(batch_label_idxs, batch_log_probabilities)
+        label_idxs.append(batch_label_idxs)
+        log_probabilities.append(batch_log_probabilities)
 
-            loss = loss_fn(yhat.reshape(1, 50), torch.LongTensor([one_hot_labels.idx_for_label(label)]))
-            loss.backward()
-            optimizer.step()
-            optimizer.zero_grad()
+    analysis = metrics.report()
+    curves = roc.roc_auc(torch.cat(label_idxs), torch.cat(log_probabilities), num_bootstrap=roc.BOOTSTRAP_RESAMPLES)
 
-    model.train(False)
+    print(f'End-to-end test accuracy: {analysis["accuracy"] * 100}%')
+    print(f'F1: {analysis["f1"]:.4f} (micro), {analysis["macro_f1"]:.4f} (macro)')
+    print(f'ROC AUC: {curves["micro_auc"]:.4f} (micro, 95% CI {curves["micro_auc_ci"][0]:.4f}-'
+          f'{curves["micro_auc_ci"][1]:.4f}), {curves["macro_auc"]:.4f} (macro, 95% CI '
+          f'{curves["macro_auc_ci"][0]:.4f}-{curves["macro_auc_ci"][1]:.4f})')
+    return analysis["accuracy"]
 
 
-def test_model(model: Model, test_dataset_file_path: str) -> float:
-    # TODO: report model RoC metrics instead of just accuracy
+def save_model(model: 'Model', save_model_dir: str, config: Optional[Config] = None) -> str:
     """
-    Given a trained model, runs it against a test dataset and reports the accuracy
-    :param model:
-    :return:
+    Saves the model as a bundle (see sentence_classifier.models.bundle), with its embedding table stored once in an
+    "embeddings" directory next to it
+    :param config: the config the model was trained with, kept in the bundle for reference
+    :return: the bundle directory
     """
-    one_hot_labels = OneHotLabels.from_labels_json_file("../data/labels.json")
-    test_questions, test_labels = load(test_dataset_file_path)
+    from sentence_classifier.models.bundle import save_model_bundle
 
-    correct_predictions = 0
-    for count in range(len(test_questions)):
-        test_question = test_questions[count]
-        test_label = test_labels[count]
+    return save_model_bundle(model, save_model_dir, config=config)
 
-        predicted_log_probabilities = model(parse_tokens(test_question))
-        predicted_label = one_hot_labels.label_for_idx(int(torch.argmax(predicted_log_probabilities)))
 
-        correct_predictions = correct_predictions + 1 if predicted_label == test_label else correct_predictions
+def load_model(save_model_dir: str) -> 'Model':
+    from sentence_classifier.models.bundle import load_model_bundle
 
-    accuracy = correct_predictions / len(test_questions)
-    print(f'End-to-end test accuracy: {accuracy * 100}%')
-    return accuracy
-
-
-def save_model(model: Model, save_model_file_path: str) -> str:
-    torch.save(model, save_model_file_path)
-    return save_model_file_path
-
-
-def load_model(save_model_file_path: str) -> Model:
-    return torch.load(save_model_file_path)
+    return load_model_bundle(save_model_dir).model
 
 
 class ArgException(Exception):
@@ -99,6 +87,10 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--train', action='store_true', help='Run the code to train a model')
     parser.add_argument('--test', action='store_true', help='Run the code to test a model')
+    parser.add_argument('--predict', metavar='QUESTIONS_FILE',
+                        help='Classify a file of one question per line, writing the predictions to path_eval_result')
+    parser.add_argument('--batch-size', type=int, help='The number of questions classified at once')
+    parser.add_argument('--top-k', type=int, help='The number of most likely labels written per prediction')
     parser.add_argument('--config', nargs='?', default='../data/config.ini')
     args = parser.parse_args(sys.argv[1:])
 
@@ -106,14 +98,40 @@ if __name__ == "__main__":
     config = Config.from_config_file(config_file)
 
     if args.train:
+        import numpy as np
+        import torch
+
+        from sentence_classifier.models.training import train_model_from_config, training_padding_efficiency
+
+        # seeded before the model is built, so random frozen embeddings are the same every run and so are the keys
+        # of their cached sentence features
+        torch.manual_seed(42)
+        np.random.seed(42)
         model = Config.build_model_from_config(config_file)
 
-        train_model(model, config.path_train, torch.nn.NLLLoss(reduction="mean"),
-                    config.epochs, torch.optim.Adam(model.parameters(), lr=config.lr))
+        efficiency = training_padding_efficiency(model, config)
+        if efficiency is not None:
+            print(f'Padding efficiency: {efficiency * 100:.1f}%')
+
+        train_model_from_config(model, config)
 
-        save_model(model, "../data/saved_models/model.bin")
+        save_model(model, SAVED_MODEL_DIR, config)
     elif args.test:
-        model = load_model("../data/saved_models/model.bin")
-        test_model(model, config.path_test)
+        model = load_model(SAVED_MODEL_DIR)
+        test_model(model, config.path_test, args.batch_size)
+    elif args.predict:
+        from sentence_classifier.models.bundle import load_model_bundle
+        from sentence_classifier.models.prediction import write_predictions, PREDICTION_TOP_K
+        from sentence_classifier.models.training import EVALUATION_BATCH_SIZE
+
+        if config.path_eval_result is None:
+            raise ArgException("--predict needs path_eval_result in the config")
+
+        bundle = load_model_bundle(SAVED_MODEL_DIR)
+        num_questions = write_predictions(bundle.model, args.predict, config.path_eval_result, bundle.one_hot_labels,
+                                          bundle.tokenisation_rules,
+                                          args.batch_size if args.batch_size is not None else EVALUATION_BATCH_SIZE,
+                                          args.top_k if args.top_k is not None else PREDICTION_TOP_K)
+        print(f'Wrote the predictions for {num_questions} questions to {config.path_eval_result}')
     else:
-        raise ArgException("Argument --train or --test must be passed")
+        raise ArgException("Argument --train, --test or --predict must be passed")
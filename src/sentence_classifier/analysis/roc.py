@@ -1,113 +1,343 @@
+import warnings
+
 import numpy as np
 
+from typing import Any, Dict, Optional, Sequence, Tuple
+
 
 """
 This module deals with analysing the predicted results of a classifier.
 
+analyse takes string labels. analyse_idxs takes integer label ids, or the classifier's label log-probabilities in place
+of its predicted ids, and does all of its work as array operations: the confusion matrix is a single bincount and
+every score is a reduction over it. StreamingMetrics builds the same analysis a batch at a time, and can be merged with
+the StreamingMetrics of other batches or processes, as its whole state is the confusion matrix.
+
+roc_auc takes the classifier's label log-probabilities and gives the one-vs-rest ROC curve and AUC of every class, plus
+micro and macro AUC. Each class's scores are sorted once; the curve is read off cumulative sums at the ends of runs of
+tied scores, so no work is done per threshold in Python. Bootstrap confidence intervals reuse those sorts: a resample
+is a column of multiplicities of the original items, and a block of resamples is scored as one 2D cumulative sum.
+
 Usage:
     clf.fit(X, y)
-    analysis = roc.analsis(val_y, clf.predict(val_X))
+    analysis = roc.analyse(val_y, clf.predict(val_X))
+    analysis = roc.analyse_idxs(val_label_idxs, model(question_idxs, lengths))
+
+    metrics = roc.StreamingMetrics(num_classes)
+    for question_idxs, lengths, label_idxs in data_loader:
+        metrics.update(label_idxs, model(question_idxs, lengths))
+    analysis = metrics.report()
+
+    curves = roc.roc_auc(val_label_idxs, model(question_idxs, lengths), num_bootstrap=1000)
 """
 
 
+# The default number of resamples roc_auc draws for its bootstrap confidence intervals.
+BOOTSTRAP_RESAMPLES = 1000
+
+# The most elements of the (resamples, items) arrays roc_auc builds at once while bootstrapping, bounding its memory.
+BOOTSTRAP_CHUNK_ELEMENTS = 2 ** 22
+
+
+class StreamingMetrics:
+    """
+    Accumulates the confusion matrix of a classifier's predictions batch by batch, so its analysis never needs all the
+    predictions at once. Accumulators of disjoint predictions, e.g. from parallel workers, are merged by adding their
+    confusion matrices.
+    """
+
+    def __init__(self, num_classes: int):
+        self.num_classes = num_classes
+        self.conf_matrix = np.zeros((num_classes, num_classes), dtype=np.int64)
+
+    def update(self, true_label_idxs: Any, predicted: Any) -> 'StreamingMetrics':
+        """
+        Add a batch of predictions.
+
+        Args:
+            true_label_idxs: The batch's true label ids.
+            predicted: The batch's predicted label ids, or its label log-probabilities, as analyse_idxs accepts.
+
+        Returns:
+            This accumulator.
+        """
+        true_label_idxs, predicted_label_idxs = to_label_idxs(true_label_idxs, predicted)
+        self.conf_matrix += confusion_matrix(true_label_idxs, predicted_label_idxs, self.num_classes)
+        return self
+
+    def merge(self, other: 'StreamingMetrics') -> 'StreamingMetrics':
+        """
+        Add the predictions accumulated by another accumulator over the same classes.
+
+        Returns:
+            This accumulator.
+        """
+        if other.num_classes != self.num_classes:
+            raise ValueError(f'Cannot merge metrics over {other.num_classes} classes into metrics over '
+                             f'{self.num_classes}')
+        self.conf_matrix += other.conf_matrix
+        return self
+
+    def __iadd__(self, other: 'StreamingMetrics') -> 'StreamingMetrics':
+        return self.merge(other)
+
+    def __add__(self, other: 'StreamingMetrics') -> 'StreamingMetrics':
+        return StreamingMetrics(self.num_classes).merge(self).merge(other)
+
+    def __len__(self):
+        return int(self.conf_matrix.sum())
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Returns:
+            The analysis of analyse_idxs over every prediction accumulated so far.
+        """
+        return analyse_conf_matrix(self.conf_matrix.copy())
+
+
 def analyse(true_labels: list, predicted_labels: list) -> dict:
     """
     Analyise accuracy and F1 score of the predicted labels.
 
-    This function will analyise the difference between the true labels and predicted labels. This function creates a
-    confusion matrix and runs analysis over the confusion matrix such as calculating the recall, precision and F1 score.
+    This function will analyise the difference between the true labels and predicted labels. It maps the labels to
+    indexes, in order of first appearance, and analyses those with analyse_idxs.
 
     Args:
         true_labels: The true labels of the data.
         predicted_labels: The predicted labels as given by the classifier
 
     Returns:
-        A dictionary of analytic data structured as such:
+        The analysis of analyse_idxs, plus:
             {
-                "accuracy": The accuracy of the classifier - how many labels were correctly predicted.
-                "f1": The F1 score of the classifier.
-                "precision": The precision in results.
-                "recall": The recal of the classifier.
-                "confusion": The confusion matrix generated.
+                "labels": The label of each row and column of the confusion matrix and of each per-class score.
             }
     """
     # Map classifications to indexes
     classification_indexes = __create_classification_indexes(true_labels, predicted_labels)
 
-    # Build confusion matrix
-    conf_matrix = __build_conf_matrix(classification_indexes, true_labels, predicted_labels)
+    analysis = analyse_idxs(__to_idxs(classification_indexes, true_labels),
+                            __to_idxs(classification_indexes, predicted_labels), len(classification_indexes))
+    analysis["labels"] = list(classification_indexes)
+    return analysis
+
+
+def analyse_idxs(true_label_idxs: Any, predicted: Any, num_classes: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Analyse integer label predictions in a single pass of array operations.
+
+    Args:
+        true_label_idxs: The (n,) true label ids, as an array, list or tensor.
+        predicted: Either the (n,) predicted label ids, or the (n, num_classes) label log-probabilities (or any other
+            scores) of the classifier, whose row-wise argmax is the prediction.
+        num_classes: The number of labels. By default the width of the log-probabilities, or one more than the
+            largest label id given.
+
+    Returns:
+        A dictionary of analytic data structured as such:
+            {
+                "accuracy": The accuracy of the classifier - how many labels were correctly predicted.
+                "f1": The micro averaged F1 score of the classifier.
+                "precision": The micro averaged precision in results.
+                "recall": The micro averaged recall of the classifier.
+                "macro_f1", "macro_precision", "macro_recall": The unweighted means of the per-class scores, over
+                    the classes that were either true or predicted at least once.
+                "per_class": {"precision", "recall", "f1", "support"}, each a (num_classes,) array; a score that is
+                    0 / 0 is 0.
+                "confusion": The (num_classes, num_classes) confusion matrix, predicted labels by true labels.
+            }
+    """
+    predicted = __as_array(predicted)
+    if num_classes is None and predicted.ndim == 2:
+        num_classes = predicted.shape[1]
+    true_label_idxs, predicted_label_idxs = to_label_idxs(true_label_idxs, predicted)
+
+    if num_classes is None:
+        num_classes = int(max(true_label_idxs.max(initial=-1), predicted_label_idxs.max(initial=-1))) + 1
+
+    return analyse_conf_matrix(confusion_matrix(true_label_idxs, predicted_label_idxs, num_classes))
+
+
+def analyse_conf_matrix(conf_matrix: np.ndarray) -> Dict[str, Any]:
+    """
+    Analyse a confusion matrix, as built by confusion_matrix.
+
+    Args:
+        conf_matrix: The (num_classes, num_classes) confusion matrix, predicted labels by true labels.
 
-    # Calc Tps, Fps, Tns, Fns
-    tp, fp, fn, tn = __decompose_conf_matrix(conf_matrix, len(true_labels))
+    Returns:
+        The analysis of analyse_idxs.
+    """
+    tp, fp, fn, _ = __decompose_conf_matrix(conf_matrix)
 
     # TODO Talk in report about why we did micro averaging. There is a large class imabalanace so we needed a score
     # Calculate micro averaging scores
-    micro_average_precision = np.sum(tp) / (np.sum(tp) + np.sum(fp))
-    micro_average_recall = np.sum(tp) / (np.sum(tp) + np.sum(fn))
-    f1 = (2 * micro_average_recall * micro_average_precision) / (micro_average_recall + micro_average_precision)
+    micro_average_precision = __divide(tp.sum(), tp.sum() + fp.sum())
+    micro_average_recall = __divide(tp.sum(), tp.sum() + fn.sum())
+    f1 = __divide(2 * micro_average_recall * micro_average_precision, micro_average_recall + micro_average_precision)
 
-    accuracy = 0
-    for i in range(len(true_labels)):
-        accuracy += int(true_labels[i] == predicted_labels[i])
+    precision = __divide(tp, tp + fp)
+    recall = __divide(tp, tp + fn)
+    per_class_f1 = __divide(2 * precision * recall, precision + recall)
+    # classes that never appear say nothing about the classifier, so they are left out of the macro averages
+    present = (tp + fp + fn) > 0
 
     return {
-        "accuracy": accuracy / len(true_labels),
-        "f1": f1,
-        "precision": micro_average_precision,
-        "recall": micro_average_recall,
+        "accuracy": float(__divide(tp.sum(), conf_matrix.sum())),
+        "f1": float(f1),
+        "precision": float(micro_average_precision),
+        "recall": float(micro_average_recall),
+        "macro_f1": float(per_class_f1[present].mean()) if present.any() else 0.0,
+        "macro_precision": float(precision[present].mean()) if present.any() else 0.0,
+        "macro_recall": float(recall[present].mean()) if present.any() else 0.0,
+        "per_class": {
+            "precision": precision,
+            "recall": recall,
+            "f1": per_class_f1,
+            "support": tp + fn,
+        },
         "confusion": conf_matrix
     }
 
 
-def __create_classification_indexes(true_labels: list, predicted_labels: list) -> dict:
+def confusion_matrix(true_label_idxs: np.ndarray, predicted_label_idxs: np.ndarray, num_classes: int) -> np.ndarray:
     """
-    Create the classification indexes based on the given labels.
+    Calculate the confusion matrix of integer label predictions.
 
-    This function will extract all unique labels from all the given classes and puts them into the classification
-    indexes.
+    Args:
+        true_label_idxs: The (n,) true label ids.
+        predicted_label_idxs: The (n,) predicted label ids.
+        num_classes: The number of labels.
+
+    Returns:
+        The (num_classes, num_classes) int64 confusion matrix, whose [p, t] entry counts the items of true label t that
+        were predicted as p.
+    """
+    return np.bincount(predicted_label_idxs * num_classes + true_label_idxs,
+                       minlength=num_classes * num_classes).reshape(num_classes, num_classes)
+
+
+def to_label_idxs(true_label_idxs: Any, predicted: Any) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convert true labels and predictions, in any of the forms analyse_idxs accepts, to label id arrays.
 
     Args:
-        true_labels: The true labels of the data.
-        predicted_labels: The predicted labels of the data.
+        true_label_idxs: The (n,) true label ids, as an array, list or tensor.
+        predicted: Either the (n,) predicted label ids, or the (n, num_classes) label scores of the classifier.
 
     Returns:
-        The mapping of given labels to indexes within a confusion matrix.
+        The (n,) int64 true and predicted label ids, taking the row-wise argmax of predicted if it is 2D.
+    """
+    true_label_idxs = __as_array(true_label_idxs).astype(np.int64, copy=False).ravel()
+    predicted = __as_array(predicted)
+    if predicted.ndim == 2:
+        predicted = np.argmax(predicted, axis=1)
+    return true_label_idxs, predicted.astype(np.int64, copy=False).ravel()
+
+
+def roc_auc(true_label_idxs: Any, log_probabilities: Any, num_bootstrap: int = 0, confidence: float = 0.95,
+            seed: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Calculate the one-vs-rest ROC curve and AUC of every class from the classifier's label scores.
+
+    A class's curve has a point per distinct score: the rates of predicting the class for every item whose score for
+    it is at least that threshold. Ties are kept together, so a threshold never splits items of equal score.
+
+    Args:
+        true_label_idxs: The (n,) true label ids, as an array, list or tensor.
+        log_probabilities: The (n, num_classes) label log-probabilities (or any other scores) of the classifier.
+        num_bootstrap: The number of bootstrap resamples to draw for confidence intervals, 0 for none.
+        confidence: The coverage of the confidence intervals.
+        seed: The seed of the resampling.
+
+    Returns:
+        A dictionary of analytic data structured as such:
+            {
+                "auc": The (num_classes,) one-vs-rest AUC of each class; NaN for a class that is never, or always,
+                    the true label, as it has no curve.
+                "macro_auc": The unweighted mean AUC of the classes that have one.
+                "micro_auc": The AUC of every (item, class) pair pooled, i.e. of the classifier's scores as a whole.
+                "curves": A {"fpr", "tpr", "thresholds"} dictionary of arrays per class, starting from the point
+                    (0, 0) at an infinite threshold, with thresholds descending.
+                "micro_curve": The same, for the pooled (item, class) pairs.
+            }
+        and, when num_bootstrap is given, percentile bootstrap intervals as (low, high) pairs:
+            {
+                "auc_ci": A (num_classes, 2) array, NaN for the classes without an AUC.
+                "macro_auc_ci", "micro_auc_ci": Tuples.
+            }
     """
-    classification_indexes = {}
-    for classes in true_labels:
-        if classes not in classification_indexes:
-            classification_indexes[classes] = len(classification_indexes)
-    for classes in predicted_labels:
-        if classes not in classification_indexes:
-            classification_indexes[classes] = len(classification_indexes)
-    return classification_indexes
+    scores = __as_array(log_probabilities).astype(np.float64, copy=False)
+    true_label_idxs = __as_array(true_label_idxs).astype(np.int64, copy=False).ravel()
+    num_items, num_classes = scores.shape
+    positives = true_label_idxs[:, None] == np.arange(num_classes)
+
+    # the one sort of each class, kept for the bootstrap; the pooled pairs are sorted as one more "class"
+    rankings = [__rank(scores[:, label_idx], positives[:, label_idx]) for label_idx in range(num_classes)]
+    rankings.append(__rank(scores.ravel(), positives.ravel()))
+
+    curves = []
+    aucs = np.empty(num_classes + 1)
+    for ranking_idx, (order, sorted_positives, run_ends, thresholds) in enumerate(rankings):
+        tps, fps = __cumulative_counts(sorted_positives, run_ends, np.ones(len(order)))
+        aucs[ranking_idx] = __auc(tps, fps)
+        curves.append({
+            "fpr": __divide(fps, fps[-1]),
+            "tpr": __divide(tps, tps[-1]),
+            "thresholds": np.concatenate([[np.inf], thresholds]),
+        })
+
+    analysis = {
+        "auc": aucs[:num_classes],
+        "macro_auc": __nanmean(aucs[:num_classes]),
+        "micro_auc": float(aucs[num_classes]),
+        "curves": curves[:num_classes],
+        "micro_curve": curves[num_classes],
+    }
+
+    if num_bootstrap > 0:
+        resampled_aucs = __bootstrap_aucs(rankings, num_items, num_classes, num_bootstrap,
+                                          np.random.default_rng(seed))
+        tail = (1 - confidence) / 2 * 100
+        with warnings.catch_warnings():
+            # classes without an AUC have none in any resample either
+            warnings.simplefilter("ignore", RuntimeWarning)
+            resampled_macro_aucs = np.nanmean(resampled_aucs[:, :num_classes], axis=1)
+            auc_ci = np.nanpercentile(resampled_aucs[:, :num_classes], [tail, 100 - tail], axis=0).T
+            macro_auc_ci = np.nanpercentile(resampled_macro_aucs, [tail, 100 - tail])
+        micro_auc_ci = np.nanpercentile(resampled_aucs[:, num_classes], [tail, 100 - tail])
 
+        auc_ci[np.isnan(analysis["auc"])] = np.nan
+        analysis["auc_ci"] = auc_ci
+        analysis["macro_auc_ci"] = (float(macro_auc_ci[0]), float(macro_auc_ci[1]))
+        analysis["micro_auc_ci"] = (float(micro_auc_ci[0]), float(micro_auc_ci[1]))
 
-def __build_conf_matrix(class_indicies: dict, true_labels: list, predicted_labels: list) -> np.ndarray:
+    return analysis
+
+
+def __create_classification_indexes(true_labels: Sequence, predicted_labels: Sequence) -> dict:
     """
-    Calculate the confusion matrix from the given predictions.
+    Create the classification indexes based on the given labels.
 
-    This function will calculate the confusion matrix given the true labels and estimated labels.
+    This function will extract all unique labels from all the given classes and puts them into the classification
+    indexes, in order of first appearance.
 
     Args:
-        class_indicies: A dictionary which maps string labels to indexes in the conf matrix.
         true_labels: The true labels of the data.
         predicted_labels: The predicted labels of the data.
 
     Returns:
-        Return the confusion matrix based upon the given labels.
+        The mapping of given labels to indexes within a confusion matrix.
     """
-    conf_matrix = np.zeros((len(class_indicies), len(class_indicies)))
+    labels = dict.fromkeys(true_labels)
+    labels.update(dict.fromkeys(predicted_labels))
+    return dict((label, idx) for idx, label in enumerate(labels))
 
-    for i in range(len(true_labels)):
-        true_class_index = class_indicies[true_labels[i]]
-        pred_class_index = class_indicies[predicted_labels[i]]
-        conf_matrix[pred_class_index, true_class_index] += 1
 
-    return conf_matrix
+def __to_idxs(classification_indexes: dict, labels: Sequence) -> np.ndarray:
+    return np.fromiter(map(classification_indexes.__getitem__, labels), dtype=np.int64, count=len(labels))
 
 
-def __decompose_conf_matrix(conf_matrix: np.ndarray, n_items: int) -> tuple:
+def __decompose_conf_matrix(conf_matrix: np.ndarray) -> tuple:
     """
     Extract TP, TN, FP & FN from the given confusion matrix.
 
@@ -115,29 +345,125 @@ def __decompose_conf_matrix(conf_matrix: np.ndarray, n_items: int) -> tuple:
 
     Args:
         conf_matrix:
-            The confusion matrix.
-        n_items:
-            The total number of items in the dataset
-            # TODO May not be neccessary as should be included in conf_matrix.
+            The confusion matrix, predicted labels by true labels.
 
     Returns:
-        The True positives, False positives, True negatives and False negatives from the conf matrix for each class.
+        The True positives, False positives, False negatives and True negatives from the conf matrix for each class.
     """
-    n_classes = len(conf_matrix)
-
-    # Setup arrays for varible.
     tp = np.diag(conf_matrix)
-    fp = np.zeros(n_classes)
-    fn = np.zeros(n_classes)
-    tn = np.array([n_items for _ in range(n_classes)])
+    # everything predicted as a class but not of it, and everything of a class but not predicted as it
+    fp = conf_matrix.sum(axis=1) - tp
+    fn = conf_matrix.sum(axis=0) - tp
+    tn = conf_matrix.sum() - tp - fp - fn
 
-    # Iterate through to find the FP and FN rate.
-    for prediction_classification in range(n_classes):
-        for true_classification in range(n_classes):
-            if true_classification != prediction_classification:
-                fp[prediction_classification] += conf_matrix[prediction_classification, true_classification]
-                fn[true_classification] += conf_matrix[prediction_classification, true_classification]
+    return tp, fp, fn, tn
 
-    tn = tn - fn - tp - fp
 
-    return tp, fp, fn, tn
+def __rank(scores: np.ndarray, positives: np.ndarray) -> tuple:
+    """
+    Sort items by descending score, and find where the thresholds between distinct scores fall.
+
+    Args:
+        scores: The (m,) scores of the items.
+        positives: The (m,) booleans of which items are of the class.
+
+    Returns:
+        The sorting order, the items' positives in that order, the sorted index of the last item of each run of tied
+        scores, and the score of each run.
+    """
+    order = np.argsort(-scores, kind="stable")
+    sorted_scores = scores[order]
+    run_ends = np.append(np.flatnonzero(sorted_scores[1:] != sorted_scores[:-1]), len(order) - 1)
+    return order, positives[order], run_ends, sorted_scores[run_ends]
+
+
+def __cumulative_counts(sorted_positives: np.ndarray, run_ends: np.ndarray, weights: np.ndarray) -> tuple:
+    """
+    Count the true and false positives at every threshold, weighting each item.
+
+    Args:
+        sorted_positives: The (m,) positives of the items in descending score order.
+        run_ends: The index of the last item of each run of tied scores.
+        weights: The (m, ...) weights of the items in the same order, e.g. their multiplicities in resamples. Items
+            are the first axis, so each step of a cumulative sum adds a contiguous row.
+
+    Returns:
+        The (runs + 1, ...) true and false positive counts, from 0 at an infinite threshold.
+    """
+    zeros = np.zeros((1,) + weights.shape[1:], dtype=weights.dtype)
+    # the positives are a small part of a class's items, so their running total is taken over them alone, and
+    # looked up by the number of positives at or above each threshold
+    positive_totals = np.concatenate([zeros, np.cumsum(weights[sorted_positives], axis=0)])
+    tps = positive_totals[np.cumsum(sorted_positives)[run_ends]]
+    fps = np.cumsum(weights, axis=0)[run_ends] - tps
+    return np.concatenate([zeros, tps]), np.concatenate([zeros, fps])
+
+
+def __auc(tps: np.ndarray, fps: np.ndarray):
+    """
+    Calculate the area under ROC curves by the trapezoidal rule, along the first axis.
+
+    Args:
+        tps: The (points, ...) true positive counts of the curves.
+        fps: The (points, ...) false positive counts of the curves.
+
+    Returns:
+        The areas, NaN where a curve has no positives or no negatives.
+    """
+    area = np.sum(np.diff(fps, axis=0) * (tps[1:] + tps[:-1]), axis=0) / 2
+    normaliser = tps[-1] * fps[-1]
+    return np.divide(area, normaliser, out=np.full_like(area, np.nan), where=normaliser != 0)
+
+
+def __bootstrap_aucs(rankings: list, num_items: int, num_classes: int, num_bootstrap: int,
+                     rng: np.random.Generator) -> np.ndarray:
+    """
+    Calculate the AUCs of bootstrap resamples of the items, reusing the sorts of the items' scores.
+
+    Args:
+        rankings: The __rank of each class, then of the pooled (item, class) pairs.
+        num_items: The number of items.
+        num_classes: The number of classes.
+        num_bootstrap: The number of resamples.
+        rng: The random generator of the resamples.
+
+    Returns:
+        The (num_bootstrap, num_classes + 1) AUCs of each class, then the micro AUC, of each resample.
+    """
+    resampled_aucs = np.empty((num_bootstrap, num_classes + 1))
+    # the pooled pairs are the widest arrays built, at num_items * num_classes elements per resample
+    chunk_size = max(1, BOOTSTRAP_CHUNK_ELEMENTS // (num_items * num_classes))
+    for chunk_start in range(0, num_bootstrap, chunk_size):
+        chunk_resamples = min(chunk_size, num_bootstrap - chunk_start)
+        # the multiplicity of each item in each resample, as one bincount of its draws
+        draws = rng.integers(0, num_items, (chunk_resamples, num_items))
+        draws += np.arange(chunk_resamples)[:, None] * num_items
+        weights = np.ascontiguousarray(np.bincount(draws.ravel(), minlength=chunk_resamples * num_items)
+                                       .reshape(chunk_resamples, num_items).T)
+        # pooled pair i * num_classes + c is item i
+        pair_weights = np.repeat(weights, num_classes, axis=0)
+
+        for ranking_idx, (order, sorted_positives, run_ends, _) in enumerate(rankings):
+            item_weights = weights if ranking_idx < num_classes else pair_weights
+            resampled_aucs[chunk_start:chunk_start + chunk_resamples, ranking_idx] = \
+                __auc(*__cumulative_counts(sorted_positives, run_ends, item_weights[order]))
+
+    return resampled_aucs
+
+
+def __nanmean(values: np.ndarray) -> float:
+    defined = ~np.isnan(values)
+    return float(values[defined].mean()) if defined.any() else float("nan")
+
+
+def __divide(numerator, denominator):
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator * denominator), where=denominator != 0)
+
+
+def __as_array(values: Any) -> np.ndarray:
+    # torch tensors, including ones that require grad or live on a GPU, without importing torch here
+    if hasattr(values, "detach"):
+        values = values.detach().cpu().numpy()
+    return np.asarray(values)
@@ -5,6 +5,7 @@ import numpy as np
 import torch
 import torch.nn as nn
 import torch.optim as optim
+from torch.nn.utils.rnn import pack_padded_sequence
 
 from sentence_classifier.preprocessing.tokenisation.tokeniser import parse_tokens
 from sentence_classifier.preprocessing.reader import load
@@ -13,57 +14,75 @@ from sentence_classifier.preprocessing.reader import load
 class BiLSTM(nn.Module):
     def __init__(self, embedding_dim, hidden_dim,
                  bidirectional: Optional[bool] = True,
-                 combine_hidden: Optional[str] = "sum"):
+                 combine_hidden: Optional[str] = "sum",
+                 num_layers: Optional[int] = 1):
         super(BiLSTM, self).__init__()
         self.hidden_dim = hidden_dim
+        self.combine_hidden = combine_hidden
 
         # The LSTM takes word embeddings as inputs, and outputs hidden states
         # with dimensionality hidden_dim.
-        self.lstm = nn.LSTM(embedding_dim, hidden_dim, bidirectional=bidirectional)
-        self.hidden_state_combiner = self.hidden_state_adder_fn() if combine_hidden == "sum" else self.hidden_state_concat_fn
+        self.lstm = nn.LSTM(embedding_dim, hidden_dim, num_layers=num_layers, bidirectional=bidirectional)
+        self.hidden_state_combiner = self.hidden_state_adder_fn() if combine_hidden == "sum" else self.hidden_state_concat_fn()
         self.output_dim = hidden_dim*2 if bidirectional and combine_hidden != "sum" else hidden_dim
 
     @staticmethod
     def hidden_state_adder_fn() -> Callable[[torch.FloatTensor], torch.FloatTensor]:
-        adder_fn = lambda hidden_states_tensor: hidden_states_tensor[0,:,:] + hidden_states_tensor[1,:,:]
-        return adder_fn
+        """
+        :return: a fn that sums the (num_directions, batch_size, hidden_dim) final hidden states of each direction
+        """
+        return add_hidden_states
 
     @staticmethod
     def hidden_state_concat_fn() -> Callable[[torch.FloatTensor], torch.FloatTensor]:
-        concat_fn = lambda hidden_states_tensor: torch.cat([hidden_states_tensor[0,:,:], hidden_states_tensor[1,:,:]])
-        return concat_fn
+        """
+        :return: a fn that concatenates the (num_directions, batch_size, hidden_dim) final hidden states of each
+        direction into (batch_size, num_directions * hidden_dim)
+        """
+        return concat_hidden_states
 
-    def get_final_hidden_state(self, hidden_states: torch.LongTensor) -> torch.LongTensor:
+    def get_final_hidden_state(self, hidden_states: torch.FloatTensor) -> torch.FloatTensor:
         """
         Extracts the final hidden state, which is what we want to use as the sentence representation
-        :param hidden_states:
-        :return: the final hidden_state in the complicated hidden_state tensor returned after a pass through nn.LSTM()
+        :param hidden_states: the (num_layers * num_directions, batch_size, hidden_dim) hn returned by nn.LSTM()
+        :return: the (num_directions, batch_size, hidden_dim) final hidden states of the last layer
         """
         num_layers = self.lstm.num_layers
         num_directions = 2 if self.lstm.bidirectional else 1
-        batch_size = 1 # TODO: fix once we support batched inputs
+        batch_size = hidden_states.size(1)
         hidden_size = self.hidden_dim
 
-        final_hidden_state = hidden_states.view(num_layers, num_directions, batch_size, hidden_size)
+        final_hidden_state = hidden_states.view(num_layers, num_directions, batch_size, hidden_size)[-1]
         return final_hidden_state
 
-    def forward(self, sentence_word_embeddings: torch.FloatTensor) -> torch.FloatTensor:
+    def forward(self, sentence_word_embeddings: torch.FloatTensor,
+                lengths: Optional[torch.LongTensor] = None) -> torch.FloatTensor:
         """
-        :param sentence_word_embeddings: A 3D tensor with dims (batch_size, embedding_size, sequence_length)
+        :param sentence_word_embeddings: A 3D tensor with dims (sequence_length, batch_size, embedding_size)
         representing a batch of sentences that have each been transformed into a (padded) sequence of word
         embeddings
+        :param lengths: the unpadded length of each sentence in the batch, needed whenever the batch is padded
         :return: A 2D tensor with dims (batch_size, sentence_embedding_size) representing the batch of word-embedding
         sentences each transformed into a single vector (sentence representation)
         """
-        # need to reshape these single inputs to be "batches" with size 1
-        # TODO: undo the below reshaping once we have everything coming in already batched
-        # reshaped = sentence_word_embeddings.view([1] + list(sentence_word_embeddings.size()))
-        reshaped = sentence_word_embeddings
-        output, (hn, cn) = self.lstm(reshaped)
-        final_hidden_state = self.hidden_state_combiner(hn)
+        lstm_input = sentence_word_embeddings
+        if lengths is not None:
+            # packing stops the LSTM from stepping over the padding, so hn is the state at each sentence's real end
+            lstm_input = pack_padded_sequence(sentence_word_embeddings, lengths.cpu(), enforce_sorted=False)
+        output, (hn, cn) = self.lstm(lstm_input)
+        final_hidden_state = self.hidden_state_combiner(self.get_final_hidden_state(hn))
         return final_hidden_state
 
 
+# the hidden state combiners are module-level functions rather than lambdas so that a BiLSTM can be pickled
+def add_hidden_states(hidden_states_tensor: torch.FloatTensor) -> torch.FloatTensor:
+    return torch.sum(hidden_states_tensor, 0)
+
+
+def concat_hidden_states(hidden_states_tensor: torch.FloatTensor) -> torch.FloatTensor:
+    return torch.cat(list(hidden_states_tensor), dim=1)
+
+
 if __name__ == "__main__":
     """
     Train BiLSTM as an auto encoder.
@@ -3,14 +3,63 @@ from torch import sum
 
 import torch
 
+from typing import Optional
+
+from sentence_classifier.models.embedding import WordEmbeddings
+
 
 class BagOfWords(nn.Module):
 
     def __init__(self):
         super(BagOfWords, self).__init__()
 
-    def forward(self, x: torch.Tensor):
+    def forward(self, x: torch.Tensor, lengths: Optional[torch.LongTensor] = None):
+        """
+        :param x: a 3D tensor with dims (num_words, batch_size, embedding_length)
+        :param lengths: the unpadded length of each sentence in the batch; when given, padding positions are left
+        out of the average
+        :return: a 2D tensor with dims (batch_size, embedding_length)
+        """
         num_words, batch_size, embedding_length = x.size()
-        x = sum(x, 0) / num_words  # sums the cols of tensor x
+        if lengths is None:
+            x = sum(x, 0) / num_words  # sums the cols of tensor x
+            return x
+
+        mask = torch.arange(num_words, device=x.device).unsqueeze(1) < lengths.to(x.device).unsqueeze(0)
+        x = sum(x * mask.unsqueeze(2).to(x.dtype), 0) / lengths.to(x.device).clamp(min=1).unsqueeze(1).to(x.dtype)
 
         return x
+
+
+class EmbeddingBagOfWords(nn.Module):
+    """
+    A bag-of-words sentence embedder fused with the word embedding lookup. It goes straight from padded word ids to
+    averaged sentence vectors with nn.EmbeddingBag, so the per-word embedding tensor is never materialised.
+    """
+
+    def __init__(self, word_embeddings: WordEmbeddings):
+        super(EmbeddingBagOfWords, self).__init__()
+
+        weight = word_embeddings.embedding_layer.weight
+        self.embedding_bag = nn.EmbeddingBag(weight.size(0), weight.size(1), mode="mean", _weight=weight)
+        # share the word embeddings' parameter itself (not a copy), so fine-tuning updates the one table
+        self.embedding_bag.weight = weight
+        self.output_dim = weight.size(1)
+
+    def forward(self, x: torch.LongTensor, lengths: Optional[torch.LongTensor] = None):
+        """
+        :param x: a 2D tensor of word ids with dims (batch_size, padded_sentence_length)
+        :param lengths: the unpadded length of each sentence in the batch; when given, padding positions are left
+        out of the average
+        :return: a 2D tensor with dims (batch_size, embedding_length)
+        """
+        if lengths is None:
+            return self.embedding_bag(x)
+
+        batch_size, num_words = x.size()
+        lengths = lengths.to(x.device)
+        mask = torch.arange(num_words, device=x.device).unsqueeze(0) < lengths.unsqueeze(1)
+        # the real tokens of every sentence back to back, with each sentence's bag starting at its offset
+        offsets = torch.cumsum(lengths, 0) - lengths
+
+        return self.embedding_bag(x[mask], offsets)
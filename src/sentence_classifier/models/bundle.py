@@ -0,0 +1,250 @@
+import dataclasses
+import hashlib
+import io
+import json
+import os
+import weakref
+from dataclasses import dataclass
+
+import numpy as np
+import torch
+
+from typing import Any, Dict, Optional
+
+from sentence_classifier.models.bagofwords import BagOfWords, EmbeddingBagOfWords
+from sentence_classifier.models.BiLSTM import BiLSTM
+from sentence_classifier.models.embedding import WordEmbeddings, BINARY_EMBEDDINGS_SUFFIX, \
+    BINARY_EMBEDDINGS_VOCAB_SUFFIX
+from sentence_classifier.models.model import Model
+from sentence_classifier.preprocessing.tokenisation.tokeniser import fill_rules
+from sentence_classifier.utils.config import Config
+from sentence_classifier.utils.one_hot_labels import OneHotLabels
+
+
+"""
+A model bundle is a directory holding everything about a trained model except its word embedding table:
+
+    bundle.json     the model's architecture, tokenisation rules and label map, the config it was trained with (if
+                    known), and a reference to its embedding table
+    parameters.pt   the state_dict of everything but the embedding table
+
+Embedding tables are kept in a separate directory of binary embedding stores named after the sha256 of their words and
+weights, so every bundle with the same table (e.g. the members of an ensemble over frozen GloVe) references one file,
+which is memory-mapped on load.
+
+Usage:
+    save_model_bundle(model, "../data/saved_models/model", config=config)
+    bundle = load_model_bundle("../data/saved_models/model")
+    bundle.model(...)
+"""
+
+
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_FILE_NAME = "bundle.json"
+PARAMETERS_FILE_NAME = "parameters.pt"
+EMBEDDINGS_DIR_NAME = "embeddings"
+LABELS_JSON_FILE = "../data/labels.json"
+
+# The state_dict entries of the embedding table, which is saved in an embedding store instead.
+EMBEDDING_TABLE_PARAMETERS = ["word_embeddings.embedding_layer.weight", "sentence_embeddings.embedding_bag.weight"]
+
+# Frozen embedding tables loaded in this process, by digest, so bundles that share a table share it in memory too.
+# A table is dropped once no loaded model uses it.
+_loaded_frozen_word_embeddings: 'weakref.WeakValueDictionary[str, WordEmbeddings]' = weakref.WeakValueDictionary()
+
+
+@dataclass
+class ModelBundle:
+    model: Model
+    tokenisation_rules: dict
+    one_hot_labels: OneHotLabels
+    config: Optional[Dict[str, Any]]
+    bundle_dir: str
+    embeddings_digest: str
+    # the sha256 of the bundle's files, which differs between any two bundles of different models
+    digest: str
+
+
+def save_model_bundle(model: Model, bundle_dir: str, embeddings_dir: Optional[str] = None,
+                      config: Optional[Config] = None, tokenisation_rules: Optional[dict] = None,
+                      labels_json_file_path: Optional[str] = LABELS_JSON_FILE) -> str:
+    """
+    Saves a model as a bundle
+    :param embeddings_dir: the directory of content-addressed embedding stores, by default an "embeddings" directory
+    next to the bundle, so bundles saved side by side share it
+    :param config: the config the model was trained with, kept for reference
+    :param tokenisation_rules: the rules the model's inputs are tokenised with (None for the default rules)
+    :return: the bundle directory
+    """
+    embeddings_dir = embeddings_dir if embeddings_dir is not None \
+        else os.path.join(os.path.dirname(os.path.abspath(bundle_dir)), EMBEDDINGS_DIR_NAME)
+    os.makedirs(bundle_dir, exist_ok=True)
+
+    embeddings_file_path, embeddings_digest = save_embeddings_store(model.word_embeddings, embeddings_dir)
+    parameters = dict((name, tensor) for name, tensor in model.state_dict().items()
+                      if name not in EMBEDDING_TABLE_PARAMETERS)
+    write_atomically(os.path.join(bundle_dir, PARAMETERS_FILE_NAME),
+                     lambda partial_file_path: torch.save(parameters, partial_file_path))
+
+    bundle = {
+        "format": BUNDLE_FORMAT_VERSION,
+        "model": model_architecture(model),
+        "tokenisation_rules": fill_rules(dict(tokenisation_rules or {})),
+        "labels": OneHotLabels.from_labels_json_file(labels_json_file_path).label_dict,
+        "config": config_dict(config) if config is not None else None,
+        "embeddings": {
+            # relative, so a directory of bundles and their embeddings can be moved as a whole
+            "path": os.path.relpath(embeddings_file_path, bundle_dir),
+            "digest": embeddings_digest,
+        },
+    }
+    write_atomically(os.path.join(bundle_dir, BUNDLE_FILE_NAME),
+                     lambda partial_file_path: write_json(bundle, partial_file_path))
+
+    return bundle_dir
+
+
+def load_model_bundle(bundle_dir: str) -> ModelBundle:
+    """
+    Rebuilds a bundle's model through Model.Builder, with its embedding table memory-mapped from its store. Frozen
+    tables are only loaded once per process, however many bundles reference them
+    """
+    with open(os.path.join(bundle_dir, BUNDLE_FILE_NAME), "rb") as bundle_file:
+        bundle_json = bundle_file.read()
+    bundle = json.loads(bundle_json)
+    if bundle.get("format") != BUNDLE_FORMAT_VERSION:
+        raise ValueError(f'{bundle_dir} is not a version {BUNDLE_FORMAT_VERSION} model bundle')
+
+    architecture = bundle["model"]
+    word_embeddings = load_embeddings_store(os.path.join(bundle_dir, bundle["embeddings"]["path"]),
+                                            bundle["embeddings"]["digest"], architecture["freeze_word_embeddings"])
+
+    model_builder = Model.Builder().with_word_embeddings(word_embeddings)
+    if architecture["sentence_embedder"] == "bow":
+        model_builder.with_bow_sentence_embedder(fused=architecture["fuse_bow"])
+    else:
+        model_builder.with_bilstm_sentence_embedder(architecture["bilstm_input_dim"], architecture["bilstm_hidden_dim"],
+                                                    architecture["bilstm_num_layers"],
+                                                    architecture["bilstm_combine_hidden"])
+    model = model_builder.with_classifier(architecture["classifier_input_dim"]).build()
+
+    with open(os.path.join(bundle_dir, PARAMETERS_FILE_NAME), "rb") as parameters_file:
+        parameters_bytes = parameters_file.read()
+    parameters = torch.load(io.BytesIO(parameters_bytes))
+    missing_parameters, unexpected_parameters = model.load_state_dict(parameters, strict=False)
+    if unexpected_parameters or set(missing_parameters) - set(EMBEDDING_TABLE_PARAMETERS):
+        raise ValueError(f'The parameters of {bundle_dir} do not match its model, missing: {missing_parameters}, '
+                         f'unexpected: {unexpected_parameters}')
+    model.train(False)
+
+    # bundle.json holds the embeddings digest, so this covers the embedding table too
+    digest = hashlib.sha256(bundle_json + parameters_bytes).hexdigest()
+    return ModelBundle(model, bundle["tokenisation_rules"], OneHotLabels(bundle["labels"]), bundle["config"],
+                       bundle_dir, bundle["embeddings"]["digest"], digest)
+
+
+def model_architecture(model: Model) -> Dict[str, Any]:
+    """
+    :return: what Model.Builder needs to rebuild the model, named as in Config where Config has the field
+    """
+    sentence_embeddings = model.sentence_embeddings
+    architecture = {
+        "freeze_word_embeddings": not model.word_embeddings.embedding_layer.weight.requires_grad,
+        "word_embedding_dim": model.word_embeddings.embedding_layer.embedding_dim,
+        "classifier_input_dim": model.classifier.input_dim,
+    }
+
+    if isinstance(sentence_embeddings, (BagOfWords, EmbeddingBagOfWords)):
+        architecture["sentence_embedder"] = "bow"
+        architecture["fuse_bow"] = isinstance(sentence_embeddings, EmbeddingBagOfWords)
+    elif isinstance(sentence_embeddings, BiLSTM):
+        architecture["sentence_embedder"] = "bilstm"
+        architecture["bilstm_input_dim"] = sentence_embeddings.lstm.input_size
+        architecture["bilstm_hidden_dim"] = sentence_embeddings.hidden_dim
+        architecture["bilstm_num_layers"] = sentence_embeddings.lstm.num_layers
+        architecture["bilstm_combine_hidden"] = sentence_embeddings.combine_hidden
+    else:
+        raise ValueError(f'Cannot bundle a {type(sentence_embeddings).__name__} sentence embedder')
+
+    return architecture
+
+
+def embeddings_digest(word_embeddings: WordEmbeddings) -> str:
+    """
+    :return: the sha256 of an embedding table's words, in row order, and weights
+    """
+    digest = hashlib.sha256()
+    digest.update("\n".join(word_embeddings.vocab).encode())
+    weight = word_embeddings.embedding_layer.weight.detach()
+    digest.update(str(tuple(weight.size())).encode())
+    digest.update(np.ascontiguousarray(weight.numpy(), dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+
+def save_embeddings_store(word_embeddings: WordEmbeddings, embeddings_dir: str):
+    """
+    Writes an embedding table to its content-addressed binary store, unless a store with the same digest exists
+    :return: the path of the store's .npy matrix and the digest
+    """
+    digest = embeddings_digest(word_embeddings)
+    embeddings_file_path = os.path.join(embeddings_dir, f"{digest}{BINARY_EMBEDDINGS_SUFFIX}")
+    if os.path.exists(embeddings_file_path):
+        return embeddings_file_path, digest
+
+    os.makedirs(embeddings_dir, exist_ok=True)
+    # the vocab goes first, so a store whose matrix exists is always complete
+    write_atomically(embeddings_file_path + BINARY_EMBEDDINGS_VOCAB_SUFFIX,
+                     lambda partial_file_path: write_lines(word_embeddings.vocab, partial_file_path))
+    weight = word_embeddings.embedding_layer.weight.detach().numpy()
+    write_atomically(embeddings_file_path,
+                     lambda partial_file_path: write_npy(np.ascontiguousarray(weight, dtype=np.float32),
+                                                         partial_file_path))
+
+    return embeddings_file_path, digest
+
+
+def load_embeddings_store(embeddings_file_path: str, digest: str, freeze: bool) -> WordEmbeddings:
+    if not freeze:
+        # fine-tuning writes to the table, so each model needs its own (copy-on-write) mapping
+        word_embeddings = WordEmbeddings.from_binary_embeddings_file(embeddings_file_path, freeze=False)
+        word_embeddings.source = f"sha256:{digest}"
+        return word_embeddings
+
+    word_embeddings = _loaded_frozen_word_embeddings.get(digest)
+    if word_embeddings is None:
+        word_embeddings = WordEmbeddings.from_binary_embeddings_file(embeddings_file_path)
+        # the store is content-addressed, so its digest identifies the table wherever it is copied
+        word_embeddings.source = f"sha256:{digest}"
+        _loaded_frozen_word_embeddings[digest] = word_embeddings
+    return word_embeddings
+
+
+def config_dict(config: Config) -> Dict[str, Any]:
+    # ensemble member configs are bundled with the members themselves
+    return dict((name, value) for name, value in dataclasses.asdict(config).items() if name != "ensemble_configs")
+
+
+def write_atomically(file_path: str, write_fn):
+    """
+    Calls write_fn with a temporary path next to file_path and then renames it into place, so readers never see a
+    partial file
+    """
+    partial_file_path = f"{file_path}.{os.getpid()}.partial"
+    write_fn(partial_file_path)
+    os.replace(partial_file_path, file_path)
+
+
+def write_json(obj: Any, file_path: str):
+    with open(file_path, "w") as json_file:
+        json.dump(obj, json_file, indent=2)
+
+
+def write_npy(array: np.ndarray, file_path: str):
+    # np.save given a file object, rather than a path, does not append .npy to the name
+    with open(file_path, "wb") as npy_file:
+        np.save(npy_file, array)
+
+
+def write_lines(lines, file_path: str):
+    with open(file_path, "w") as lines_file:
+        lines_file.writelines(f"{line}\n" for line in lines)
@@ -1,9 +1,10 @@
+import torch
 import torch.nn as nn
 from torch import sigmoid, log_softmax
-from torch.tensor import Tensor
+from torch import Tensor
 
 
-from typing import Optional
+from typing import List, Optional
 
 
 class ClassifierNN(nn.Module):
@@ -28,3 +29,40 @@ class ClassifierNN(nn.Module):
 
         return x
 
+
+
+class StackedClassifiers(nn.Module):
+    """
+    Several ClassifierNNs with the same input dim evaluated together. Their layers' weights are stacked, so each layer
+    of every classifier is a single batched matmul rather than one matmul per classifier
+    """
+
+    def __init__(self, classifiers: List[ClassifierNN]):
+        super(StackedClassifiers, self).__init__()
+
+        self.input_dim = classifiers[0].input_dim
+        self.output_dim = classifiers[0].output_dim
+        if any(classifier.input_dim != self.input_dim for classifier in classifiers):
+            raise ValueError('stacked classifiers must all have the same input dim')
+
+        # (num_classifiers, in_features, out_features) weights and (num_classifiers, 1, out_features) biases
+        self.weights = nn.ParameterList()
+        self.biases = nn.ParameterList()
+        for layer_name in ["fc1", "fc2", "fc3"]:
+            layers = [getattr(classifier, layer_name) for classifier in classifiers]
+            self.weights.append(nn.Parameter(torch.stack([layer.weight.detach().t() for layer in layers]),
+                                             requires_grad=False))
+            self.biases.append(nn.Parameter(torch.stack([layer.bias.detach().unsqueeze(0) for layer in layers]),
+                                            requires_grad=False))
+
+    def forward(self, x: Tensor):
+        """
+        :param x: a 3D tensor with dims (num_classifiers, batch_size, input_dim) holding each classifier's input
+        :return: a 3D tensor of label log-probabilities with dims (num_classifiers, batch_size, num_labels)
+        """
+        x = sigmoid(torch.baddbmm(self.biases[0], x, self.weights[0]))
+        x = sigmoid(torch.baddbmm(self.biases[1], x, self.weights[1]))
+        x = torch.baddbmm(self.biases[2], x, self.weights[2])
+        x = log_softmax(x, dim=2)
+
+        return x
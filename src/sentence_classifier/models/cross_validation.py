@@ -0,0 +1,104 @@
+import argparse
+import dataclasses
+import os
+import sys
+import tempfile
+from dataclasses import dataclass
+
+import numpy as np
+import torch
+
+from typing import Any, Dict, List, Optional
+
+from sentence_classifier.analysis.roc import StreamingMetrics
+from sentence_classifier.models.hyper_tuning import trial_pool
+from sentence_classifier.models.training import train_model_from_config, evaluate_metrics
+from sentence_classifier.preprocessing.reader import load, write_questions_subset
+from sentence_classifier.utils.config import Config
+from sentence_classifier.utils.kfold import StratifiedKFold
+
+
+# The metrics of roc.analyse_idxs that are averaged over the folds.
+CROSS_VALIDATION_METRICS = ["accuracy", "f1", "precision", "recall", "macro_f1"]
+
+
+@dataclass
+class CrossValidationResult:
+    fold_metrics: List[Dict[str, Any]]
+    mean: Dict[str, float]
+    std: Dict[str, float]
+    # the metrics of every fold's predictions taken together
+    pooled: Dict[str, Any]
+
+
+def cross_validate(config: Config, k: Optional[int] = 5, seed: Optional[int] = 0, num_workers: Optional[int] = None,
+                   threads_per_worker: Optional[int] = None) -> CrossValidationResult:
+    """
+    Stratified k-fold cross-validation of a config over its training file. Each fold trains a model from the config on
+    the other folds and scores it with roc.analyse_idxs on its own, in a worker process of its own, with all folds run
+    concurrently
+    :param seed: the seed of the fold shuffle; the models of fold i are also initialised from seed + i
+    :param num_workers: the number of folds run at once, all cores by default
+    :param threads_per_worker: the torch threads of each fold, by default the cores shared out between the workers
+    :return: the roc.analyse_idxs metrics of every fold, the mean and sample standard deviation of the scalar ones,
+    and the metrics of all the folds' predictions pooled
+    """
+    _, labels = load(config.path_train)
+    folds = list(StratifiedKFold(labels, k, seed=seed))
+
+    with tempfile.TemporaryDirectory() as folds_dir, trial_pool(k, num_workers, threads_per_worker) as pool:
+        fold_args = [(config, fold, train_idxs, val_idxs, folds_dir, seed + fold)
+                     for fold, (train_idxs, val_idxs) in enumerate(folds)]
+        fold_streaming_metrics = pool.map(run_fold_args, fold_args)
+
+    fold_metrics = [streaming_metrics.report() for streaming_metrics in fold_streaming_metrics]
+    # the folds partition the training file, so merging their confusion matrices scores every question once
+    pooled_metrics = sum(fold_streaming_metrics[1:], fold_streaming_metrics[0])
+    scores = dict((metric, np.array([metrics[metric] for metrics in fold_metrics], dtype=np.float64))
+                  for metric in CROSS_VALIDATION_METRICS)
+    return CrossValidationResult(fold_metrics,
+                                 dict((metric, float(values.mean())) for metric, values in scores.items()),
+                                 dict((metric, float(values.std(ddof=1)) if k > 1 else 0.0)
+                                      for metric, values in scores.items()),
+                                 pooled_metrics.report())
+
+
+def run_fold(config: Config, fold: int, train_idxs: np.ndarray, val_idxs: np.ndarray, folds_dir: str,
+             seed: int) -> StreamingMetrics:
+    """
+    Trains a model from the config on the train_idxs questions of its training file, and analyses its predictions for
+    the val_idxs questions
+    :return: the metrics of the fold's predictions
+    """
+    train_file_path = os.path.join(folds_dir, f"fold-{fold}-train.txt")
+    val_file_path = os.path.join(folds_dir, f"fold-{fold}-val.txt")
+    write_questions_subset(config.path_train, train_idxs, train_file_path)
+    write_questions_subset(config.path_train, val_idxs, val_file_path)
+
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    # the held out fold is what gets scored, so it is not also used for early stopping
+    fold_config = dataclasses.replace(config, path_train=train_file_path, path_dev=None)
+    model = Config.build_model(fold_config)
+    train_model_from_config(model, fold_config)
+
+    return evaluate_metrics(model, val_file_path, config.path_corpus_cache)
+
+
+def run_fold_args(args) -> StreamingMetrics:
+    return run_fold(*args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', default='../data/config.ini')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, help='The number of folds run at once')
+    parser.add_argument('--threads-per-worker', type=int)
+    args = parser.parse_args(sys.argv[1:])
+
+    result = cross_validate(Config.from_config_file(args.config), args.folds, args.seed, args.workers,
+                            args.threads_per_worker)
+    for metric in CROSS_VALIDATION_METRICS:
+        print(f'{metric}: {result.mean[metric]:.4f} +/- {result.std[metric]:.4f} (pooled {result.pooled[metric]:.4f})')
@@ -1,20 +1,38 @@
+import argparse
+import os
+import sys
+
 import numpy as np
 from torch import nn
 
 import torch
 
 
-from typing import Iterable, Dict, List, Optional
+from typing import Iterable, Dict, List, Optional, Tuple, Union
+
+
+# A binary embeddings store is a float32 matrix saved as <store>.npy with the words of its rows, one per line and in
+# row order, in <store>.npy.vocab
+BINARY_EMBEDDINGS_SUFFIX = ".npy"
+BINARY_EMBEDDINGS_VOCAB_SUFFIX = ".vocab"
 
 
 class WordEmbeddings(nn.Module):
 
-    def __init__(self, vocab: Iterable[str], embeddings: List[torch.FloatTensor], freeze: bool):
+    def __init__(self, vocab: Iterable[str], embeddings: Union[List[torch.FloatTensor], torch.FloatTensor],
+                 freeze: bool, source: Optional[str] = None):
+        """
+        :param source: identifies where the embedding table came from (its file, or the seed it was drawn with), so
+        caches of things computed from the table can be keyed without hashing it; None if unknown
+        """
         super(WordEmbeddings, self).__init__()
 
         self.vocab = vocab
+        self.source = source
         self.word_idx_dict = self.construct_word_idx_dict(vocab)
-        self.embedding_layer = nn.Embedding.from_pretrained(torch.stack(embeddings), freeze=freeze)
+        # an already-stacked matrix (e.g. a memory-mapped one) is used as the embedding weight as-is, without a copy
+        embedding_matrix = embeddings if isinstance(embeddings, torch.Tensor) else torch.stack(embeddings)
+        self.embedding_layer = nn.Embedding.from_pretrained(embedding_matrix, freeze=freeze)
 
     @staticmethod
     def from_embeddings_file(embeddings_file_path: str, freeze: Optional[bool] = True) -> 'WordEmbeddings':
@@ -37,20 +55,40 @@ class WordEmbeddings(nn.Module):
                 vocab.append(word)
                 pretrained_embeddings.append(float_str_to_float_tensor(line.split("\t")[1]))
 
-        return WordEmbeddings(vocab, pretrained_embeddings, freeze)
+        return WordEmbeddings(vocab, pretrained_embeddings, freeze, file_source(embeddings_file_path))
+
+    @staticmethod
+    def from_binary_embeddings_file(binary_embeddings_file_path: str,
+                                    freeze: Optional[bool] = True) -> 'WordEmbeddings':
+        """
+        Memory-maps a binary embeddings store written by convert_embeddings_file. The mapping is copy-on-write, so
+        processes loading the same store share its page-cache pages and fine-tuning never writes back to the file
+        :param freeze: freeze vs. fine-tune these embeddings
+        :param binary_embeddings_file_path: path to the .npy matrix of the store
+        :return: a WordEmbeddings model/layer whose embedding weight is backed by the mapped file
+        """
+        vocab, embedding_matrix = load_binary_embeddings(binary_embeddings_file_path)
+        return WordEmbeddings(vocab, torch.from_numpy(embedding_matrix), freeze,
+                              file_source(binary_embeddings_file_path))
 
     @staticmethod
-    def from_random_embedding(vocab: Iterable[str], emb_dim: int, freeze: Optional[bool] = True) -> 'WordEmbeddings':
+    def from_random_embedding(vocab: Iterable[str], emb_dim: int, freeze: Optional[bool] = True,
+                              seed: Optional[int] = None) -> 'WordEmbeddings':
         """
         This uses the provided vocab and creates randomly-initialised embeddings for each word
         :param freeze: freeze vs. fine-tune these embeddings
         :param emb_dim:
         :param vocab:
+        :param seed: the seed the embeddings are drawn with; by default it is drawn from numpy's global random state,
+        so seeding that (np.random.seed) makes the embeddings reproducible
         :return: a WordEmbeddings model/layer that uses the provided vocab with random
         """
+        vocab = list(vocab)
+        if seed is None:
+            seed = int(np.random.randint(2 ** 31))
 
-        random_embeddings = [torch.FloatTensor(np.random.uniform(size=emb_dim)) for word in vocab]
-        return WordEmbeddings(vocab, random_embeddings, freeze)
+        random_embeddings = np.random.default_rng(seed).uniform(size=(len(vocab), emb_dim)).astype(np.float32)
+        return WordEmbeddings(vocab, torch.from_numpy(random_embeddings), freeze, f"random:{seed}:{emb_dim}")
 
     @staticmethod
     def construct_vocab_from_embeddings_file(embeddings_file_path: str) -> Iterable[str]:
@@ -66,10 +104,11 @@ class WordEmbeddings(nn.Module):
     @staticmethod
     def construct_word_idx_dict(vocab: Iterable[str]) -> Dict[str, int]:
         word_idx_dict = {}
-        vocab_set = set(vocab)
 
-        for idx, word in enumerate(vocab_set):
-            word_idx_dict[word] = idx
+        # words map to their row in the embedding matrix; the first row wins for any repeated word
+        for idx, word in enumerate(vocab):
+            if word not in word_idx_dict:
+                word_idx_dict[word] = idx
 
         return word_idx_dict
 
@@ -82,12 +121,48 @@ class WordEmbeddings(nn.Module):
     def sentence_to_idx_tensor(self, sentence: List[str]) -> torch.LongTensor:
         return torch.LongTensor([self.idx_for_word(word) for word in sentence]).reshape(len(sentence), 1)
 
-    def forward(self, sentence: List[str]):
-        # TODO: this needs to take a 2d IntTensor/LongTensor as input with dimensions (batch_size, padded_sentence_length)
-        x = self.embedding_layer(self.sentence_to_idx_tensor(sentence))
+    def sentences_to_padded_idx_tensor(self, sentences: List[List[str]]) -> Tuple[torch.LongTensor, torch.LongTensor]:
+        """
+        :param sentences: a batch of tokenised sentences
+        :return: a (batch_size, padded_sentence_length) tensor of word ids padded with 0, and a (batch_size,) tensor
+        of the unpadded sentence lengths
+        """
+        lengths = torch.LongTensor([len(sentence) for sentence in sentences])
+        idx_tensor = torch.zeros(len(sentences), int(lengths.max()) if len(sentences) > 0 else 0, dtype=torch.long)
+        for row, sentence in enumerate(sentences):
+            idx_tensor[row, :len(sentence)] = torch.LongTensor([self.idx_for_word(word) for word in sentence])
+
+        return idx_tensor, lengths
+
+    def forward(self, x: Union[List[str], torch.LongTensor]):
+        """
+        :param x: either a single tokenised sentence, or a 2D LongTensor of word ids with dims
+        (batch_size, padded_sentence_length)
+        :return: a 3D tensor with dims (sentence_length, batch_size, embedding_dim)
+        """
+        if isinstance(x, torch.Tensor):
+            return self.embedding_layer(x).transpose(0, 1)
+
+        x = self.embedding_layer(self.sentence_to_idx_tensor(x))
         return x
 
 
+def file_source(embeddings_file_path: str) -> str:
+    """
+    Identify an embeddings file by its path, size and modification time, which change whenever it is rewritten.
+
+    Reading the file's stat is free, whereas hashing its contents would cost as much as reading a GloVe-sized table.
+
+    Args:
+        embeddings_file_path: A path to a text or binary embeddings file.
+
+    Returns:
+        The WordEmbeddings source of the file's table.
+    """
+    stat = os.stat(embeddings_file_path)
+    return f"file:{os.path.realpath(embeddings_file_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
 def load_glove(path):
     """
     Load pretrained GloVe word embedding from specified path.
@@ -102,6 +177,10 @@ def load_glove(path):
     Returns:
         A tuple of the word embedding dictionary and an integer size of each word embedding.
     """
+    if path.endswith(BINARY_EMBEDDINGS_SUFFIX):
+        words, vectors = load_binary_embeddings(path)
+        return {w: vectors[idx] for idx, w in enumerate(words)}, vectors.shape[1]
+
     words, vectors, word2idx, idx = [], [], {}, 0
     with open(path) as f:
         for l in f:
@@ -110,7 +189,7 @@ def load_glove(path):
             words.append(word)
             word2idx[word] = idx
             idx+=1
-            vect = np.array(line[1:]).astype(np.float)
+            vect = np.array(line[1:]).astype(np.float64)
             vectors.append(vect)
     
     glove = {w: vectors[word2idx[w]] for w in words}
@@ -118,6 +197,57 @@ def load_glove(path):
     return glove, vectors[0].shape[0]
 
 
+def convert_embeddings_file(embeddings_file_path: str, binary_embeddings_file_path: str) -> str:
+    """
+    Converts a text embeddings file into a binary embeddings store.
+
+    Reads the tab-separated embeddings file (the format read by WordEmbeddings.from_embeddings_file) once and writes
+    its vectors as a float32 matrix to binary_embeddings_file_path, and its words, in row order, to a vocab index
+    alongside it. The store can then be memory-mapped by load_binary_embeddings instead of re-parsing the text.
+
+    Args:
+        embeddings_file_path: A path to the text embeddings file.
+        binary_embeddings_file_path: The path of the .npy matrix to write.
+
+    Returns:
+        The path of the written matrix.
+    """
+    if not binary_embeddings_file_path.endswith(BINARY_EMBEDDINGS_SUFFIX):
+        binary_embeddings_file_path += BINARY_EMBEDDINGS_SUFFIX
+
+    words, vectors = [], []
+    with open(embeddings_file_path, "r") as embeddings_file:
+        for line in embeddings_file:
+            word, vector_str = line.rstrip("\n").split("\t", 1)
+            words.append(word)
+            vectors.append(np.array(vector_str.split(), dtype=np.float32))
+
+    np.save(binary_embeddings_file_path, np.stack(vectors))
+    with open(binary_embeddings_file_path + BINARY_EMBEDDINGS_VOCAB_SUFFIX, "w") as vocab_file:
+        vocab_file.writelines(f"{word}\n" for word in words)
+
+    return binary_embeddings_file_path
+
+
+def load_binary_embeddings(binary_embeddings_file_path: str) -> Tuple[List[str], np.ndarray]:
+    """
+    Load a binary embeddings store written by convert_embeddings_file.
+
+    The matrix is memory-mapped copy-on-write rather than read, so loading is independent of the table size and the
+    pages are shared by every process mapping the same file.
+
+    Args:
+        binary_embeddings_file_path: The path of the .npy matrix of the store.
+
+    Returns:
+        A tuple of the words in row order and the (num_words, embedding_dim) float32 matrix.
+    """
+    with open(binary_embeddings_file_path + BINARY_EMBEDDINGS_VOCAB_SUFFIX, "r") as vocab_file:
+        words = [line.rstrip("\n") for line in vocab_file]
+
+    return words, np.load(binary_embeddings_file_path, mmap_mode="c")
+
+
 def embed(sentences, embedding_path): 
     """
     Embeds the provided list of sentences into the GloVe embedding space.
@@ -158,4 +288,11 @@ def embed(sentences, embedding_path):
 
     return embeddings
 
-    
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a text embeddings file into a memory-mappable binary store")
+    parser.add_argument('embeddings_file', help='tab-separated text embeddings file, e.g. ../data/glove.small.txt')
+    parser.add_argument('binary_embeddings_file', help='the .npy file to write, e.g. ../data/glove.small.npy')
+    args = parser.parse_args(sys.argv[1:])
+
+    print(convert_embeddings_file(args.embeddings_file, args.binary_embeddings_file))
@@ -1,113 +1,305 @@
+import argparse
+import dataclasses
+import hashlib
+import itertools
+import os
+import sys
+import tempfile
+import uuid
+
 import numpy as np
-import torch
-from torch import nn
 
-from sentence_classifier.analysis import roc
-from sentence_classifier.models.model import Model
-from sentence_classifier.preprocessing.reader import load
-from sentence_classifier.preprocessing.tokenisation import parse_tokens
-from sentence_classifier.utils.one_hot_labels import OneHotLabels
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+from sentence_classifier.preprocessing.reader import load, stream, write_questions_subset
+from sentence_classifier.preprocessing.tokenisation import Tokeniser
+from sentence_classifier.utils.config import Config
 
+if TYPE_CHECKING:
+    import torch
+    from sentence_classifier.models.bundle import ModelBundle
+    from sentence_classifier.models.classifier_nn import StackedClassifiers
+    from sentence_classifier.models.embedding import WordEmbeddings
+    from sentence_classifier.models.model import Model
+    from sentence_classifier.utils.one_hot_labels import OneHotLabels
 
-REPEATS = 1
-CLASSES = 50
 
-TRAIN_FILE_PATH = "../data/train-og.txt"
 TEST_FILE_PATH = "../data/test.txt"
 LABELS_JSON_FILE = "../data/labels.json"
 
-X, Y = load(TRAIN_FILE_PATH)
-test_X, test_Y = load(TEST_FILE_PATH)
+ENSEMBLE_WEIGHTS_DIR = "../data/saved_models/ensemble_weights"
+ENSEMBLE_SIZE = 5
 
 
-def load_model(save_model_file_path: str) -> Model:
-    return torch.load(save_model_file_path)
+def load_model(save_model_dir: str) -> 'Model':
+    from sentence_classifier.models.bundle import load_model_bundle
+
+    return load_model_bundle(save_model_dir).model
 
 
 class Ensemble:
-    def __init__(self):
-        self.models = [load_model(f"../data/saved_models/ensemble_weights/weights-{i + 1}.pth") for i in range(5)]
-        self.one_hot_labels = OneHotLabels.from_labels_json_file(LABELS_JSON_FILE)
+    def __init__(self, models: Optional[List['Model']] = None, model_key: Optional[str] = None,
+                 one_hot_labels: Optional['OneHotLabels'] = None, tokenisation_rules: Optional[dict] = None):
+        """
+        :param models: the member models, by default the ENSEMBLE_SIZE models saved in ENSEMBLE_WEIGHTS_DIR, with the
+        labels and tokenisation rules they were bundled with
+        :param model_key: identifies the ensemble to prediction caches, by default a key unique to this ensemble
+        :param one_hot_labels: the labels of the members' outputs, by default those in LABELS_JSON_FILE
+        :param tokenisation_rules: the rules the members' inputs are tokenised with (None for the default rules)
+        """
+        from sentence_classifier.models.classifier_nn import StackedClassifiers
+        from sentence_classifier.utils.one_hot_labels import OneHotLabels
 
-    def predict(self, question):
-        average_tensors = []
+        if models is None:
+            member_bundles = Ensemble.load_member_bundles()
+            models, model_key = [bundle.model for bundle in member_bundles], members_key(member_bundles)
+            one_hot_labels, tokenisation_rules = members_labels_and_rules(member_bundles)
+        self.models = models
+        self.model_key = model_key if model_key is not None else uuid.uuid4().hex
         for model in self.models:
-            yhat = model(parse_tokens(question))
-            average_tensors.append(torch.squeeze(yhat).detach().numpy())
-        averages = np.array(average_tensors)
-        averages = np.mean(averages, axis=0)
-        vote = np.argmax(averages)
+            model.train(False)
+        self.one_hot_labels = one_hot_labels if one_hot_labels is not None \
+            else OneHotLabels.from_labels_json_file(LABELS_JSON_FILE)
+        self.tokeniser = Tokeniser.for_rules(tokenisation_rules)
+
+        # members with the same word embeddings (e.g. the same frozen GloVe table) share a single lookup
+        self.word_embeddings: List['WordEmbeddings'] = []
+        self.member_word_embeddings: List[int] = []
+        for model in self.models:
+            shared = [idx for idx, word_embeddings in enumerate(self.word_embeddings)
+                      if same_word_embeddings(word_embeddings, model.word_embeddings)]
+            if len(shared) == 0:
+                self.word_embeddings.append(model.word_embeddings)
+                shared = [len(self.word_embeddings) - 1]
+            self.member_word_embeddings.append(shared[0])
+
+        # the members' classifiers are stacked, one stack per classifier input dim, and run as batched matmuls
+        self.stacked_classifiers: List[Tuple[List[int], 'StackedClassifiers']] = []
+        for input_dim in dict.fromkeys(model.classifier.input_dim for model in self.models):
+            members = [member for member, model in enumerate(self.models) if model.classifier.input_dim == input_dim]
+            self.stacked_classifiers.append((members, StackedClassifiers([self.models[member].classifier
+                                                                          for member in members])))
+
+    @staticmethod
+    def load_members(weights_dir: Optional[str] = ENSEMBLE_WEIGHTS_DIR,
+                     num_members: Optional[int] = ENSEMBLE_SIZE) -> List['Model']:
+        return [bundle.model for bundle in Ensemble.load_member_bundles(weights_dir, num_members)]
+
+    @staticmethod
+    def load_member_bundles(weights_dir: Optional[str] = ENSEMBLE_WEIGHTS_DIR,
+                            num_members: Optional[int] = ENSEMBLE_SIZE) -> List['ModelBundle']:
+        from sentence_classifier.models.bundle import load_model_bundle
+
+        # members bundled over the same frozen table (e.g. GloVe) are given the one in-memory copy of it
+        return [load_model_bundle(member_bundle_dir(weights_dir, member)) for member in range(num_members)]
+
+    @staticmethod
+    def from_bundles(weights_dir: Optional[str] = ENSEMBLE_WEIGHTS_DIR,
+                     num_members: Optional[int] = ENSEMBLE_SIZE) -> 'Ensemble':
+        """
+        :return: the ensemble of the members saved in weights_dir, keyed on their bundles, with the labels and
+        tokenisation rules they were bundled with
+        """
+        member_bundles = Ensemble.load_member_bundles(weights_dir, num_members)
+        return Ensemble([bundle.model for bundle in member_bundles], members_key(member_bundles),
+                        *members_labels_and_rules(member_bundles))
+
+    def predict(self, question: List[str]) -> str:
+        return self.predict_batch([question])[0]
+
+    def predict_batch(self, questions: List[List[str]]) -> List[str]:
+        """
+        :param questions: untokenised questions, as read by reader.load
+        :return: the predicted label of each question
+        """
+        import torch
+
+        votes = torch.argmax(self.log_probabilities(questions), dim=1)
+        return [self.one_hot_labels.label_for_idx(vote) for vote in votes.tolist()]
+
+    def log_probabilities(self, questions: List[List[str]]) -> 'torch.FloatTensor':
+        """
+        Tokenises the questions once and runs every member over them as a batch
+        :param questions: untokenised questions, as read by reader.load
+        :return: a 2D tensor with dims (num_questions, num_labels) of the members' label log-probabilities averaged
+        """
+        return self.tokenised_log_probabilities(self.tokeniser.tokenise_batch(questions))
+
+    def tokenised_log_probabilities(self, tokenised_questions: List[List[str]]) -> 'torch.FloatTensor':
+        """
+        :param tokenised_questions: questions already tokenised by self.tokeniser
+        :return: a 2D tensor with dims (num_questions, num_labels) of the members' label log-probabilities averaged
+        """
+        import torch
+
+        with torch.no_grad():
+            sentence_representations = self.sentence_representations(tokenised_questions)
+
+            log_probabilities = None
+            for members, stacked_classifiers in self.stacked_classifiers:
+                stacked_log_probabilities = stacked_classifiers(torch.stack([sentence_representations[member]
+                                                                             for member in members]))
+                summed_log_probabilities = torch.sum(stacked_log_probabilities, 0)
+                log_probabilities = summed_log_probabilities if log_probabilities is None \
+                    else log_probabilities + summed_log_probabilities
+
+        return log_probabilities / len(self.models)
+
+    def sentence_representations(self, tokenised_questions: List[List[str]]) -> List['torch.FloatTensor']:
+        """
+        :return: each member's (num_questions, sentence_embedding_dim) sentence representations, looking words up
+        once per distinct word embeddings and computing bag-of-words representations once per distinct word
+        embeddings too, as bag-of-words has no weights of its own
+        """
+        from sentence_classifier.models.bagofwords import BagOfWords, EmbeddingBagOfWords
+
+        sentence_representations = [None] * len(self.models)
+
+        for word_embeddings_idx, word_embeddings in enumerate(self.word_embeddings):
+            idxs, lengths = word_embeddings.sentences_to_padded_idx_tensor(tokenised_questions)
+            embedded, bag_of_words = None, None
+
+            for member, model in enumerate(self.models):
+                if self.member_word_embeddings[member] != word_embeddings_idx:
+                    continue
+
+                if isinstance(model.sentence_embeddings, (BagOfWords, EmbeddingBagOfWords)):
+                    if bag_of_words is None:
+                        bag_of_words = model.sentence_representation(idxs, lengths)
+                    sentence_representations[member] = bag_of_words
+                else:
+                    if embedded is None:
+                        embedded = word_embeddings(idxs)
+                    sentence_representations[member] = model.sentence_embeddings(embedded, lengths)
+
+        return sentence_representations
+
+
+def train_ensemble(config: Config, num_members: Optional[int] = ENSEMBLE_SIZE,
+                   weights_dir: Optional[str] = ENSEMBLE_WEIGHTS_DIR, seed: Optional[int] = 0,
+                   num_workers: Optional[int] = None, threads_per_worker: Optional[int] = None) -> List[str]:
+    """
+    Trains the members of a bagging ensemble concurrently, each in its own worker process on its own bootstrap
+    resample of the config's training file, and saves them where Ensemble loads them from.
 
-        return self.one_hot_labels.label_for_idx(vote)
+    A GloVe text file is converted once into a binary store that every member memory-maps, so all of them read one
+    copy of the table from the page cache rather than each parsing and holding its own
+    :param seed: the seed the members' independent bootstrap and initialisation seeds are drawn from
+    :param num_workers: the number of members trained at once, all cores by default
+    :param threads_per_worker: the torch threads of each member, by default the cores shared out between the workers
+    :return: the members' bundle directories
+    """
+    from sentence_classifier.models.embedding import BINARY_EMBEDDINGS_SUFFIX, convert_embeddings_file
+    from sentence_classifier.models.hyper_tuning import trial_pool
+
+    os.makedirs(weights_dir, exist_ok=True)
+    member_seeds = [int(member_seed.generate_state(1)[0])
+                    for member_seed in np.random.SeedSequence(seed).spawn(num_members)]
+
+    with tempfile.TemporaryDirectory() as bootstrap_dir:
+        if config.word_embeddings == "glove" and not config.path_word_embeddings.endswith(BINARY_EMBEDDINGS_SUFFIX):
+            config = dataclasses.replace(config, path_word_embeddings=convert_embeddings_file(
+                config.path_word_embeddings, os.path.join(bootstrap_dir, f"word-embeddings{BINARY_EMBEDDINGS_SUFFIX}")))
+
+        with trial_pool(num_members, num_workers, threads_per_worker) as pool:
+            member_args = [(config, member, member_seed, bootstrap_dir, weights_dir)
+                           for member, member_seed in enumerate(member_seeds)]
+            return pool.map(train_member_args, member_args)
+
+
+def train_member(config: Config, member: int, seed: int, bootstrap_dir: str, weights_dir: str) -> str:
+    """
+    Trains one ensemble member from the config on a bootstrap resample of its training file, drawn with seed, and
+    bundles it in weights_dir, where all the members share one "embeddings" directory
+    :return: the member's bundle directory
+    """
+    import torch
+    from sentence_classifier.models.bundle import save_model_bundle
+    from sentence_classifier.models.training import train_model_from_config
+
+    _, labels = load(config.path_train)
+    bootstrap_file_path = write_questions_subset(config.path_train, bootstrap_sample(len(labels), seed),
+                                                 os.path.join(bootstrap_dir, f"bootstrap-{member}.txt"))
+
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    member_config = dataclasses.replace(config, path_train=bootstrap_file_path)
+    model = Config.build_model(member_config)
+    train_model_from_config(model, member_config)
+
+    return save_model_bundle(model, member_bundle_dir(weights_dir, member), config=member_config)
+
+
+def train_member_args(args) -> str:
+    return train_member(*args)
+
+
+def bootstrap_sample(num_questions: int, seed: int) -> np.ndarray:
+    """
+    :return: num_questions question indices drawn uniformly with replacement
+    """
+    return np.random.default_rng(seed).integers(0, num_questions, size=num_questions)
+
+
+def member_bundle_dir(weights_dir: str, member: int) -> str:
+    # members are numbered from 1 in their directory names
+    return os.path.join(weights_dir, f"member-{member + 1}")
+
+
+def members_key(member_bundles: List['ModelBundle']) -> str:
+    return hashlib.sha256("\n".join(bundle.digest for bundle in member_bundles).encode()).hexdigest()
+
+
+def members_labels_and_rules(member_bundles: List['ModelBundle']) -> Tuple['OneHotLabels', dict]:
+    """
+    :return: the labels and tokenisation rules the members were bundled with, which the ensemble shares, as it
+    tokenises each question once for all of them and averages their outputs label by label
+    """
+    one_hot_labels, tokenisation_rules = member_bundles[0].one_hot_labels, member_bundles[0].tokenisation_rules
+    for member, bundle in enumerate(member_bundles[1:], 2):
+        if list(bundle.one_hot_labels.label_dict.items()) != list(one_hot_labels.label_dict.items()):
+            raise ValueError(f'Ensemble member {member} ({bundle.bundle_dir}) has different labels to member 1')
+        if bundle.tokenisation_rules != tokenisation_rules:
+            raise ValueError(f'Ensemble member {member} ({bundle.bundle_dir}) has different tokenisation rules to '
+                             f'member 1')
+
+    return one_hot_labels, tokenisation_rules
+
+
+def same_word_embeddings(word_embeddings: 'WordEmbeddings', other_word_embeddings: 'WordEmbeddings') -> bool:
+    import torch
+
+    weight, other_weight = word_embeddings.embedding_layer.weight, other_word_embeddings.embedding_layer.weight
+    if word_embeddings is other_word_embeddings:
+        return True
+
+    return (word_embeddings.word_idx_dict == other_word_embeddings.word_idx_dict
+            and weight.size() == other_weight.size() and torch.equal(weight, other_weight))
 
 
 if __name__ == "__main__":
-    ensemble = Ensemble()
-
-    print(roc.analyse(test_Y, [
-        ensemble.predict(test_question)
-        for test_question in test_X
-    ])["f1"])
-
-
-    # one_hot_labels = OneHotLabels.from_labels_json_file(LABELS_JSON_FILE)
-    #
-    # def train_model(model, loss_fn, optimizer, epochs=20):
-    #     for epoch in range(epochs):
-    #         avg_loss = []
-    #         for count in range(len(X)):
-    #             model.train()
-    #
-    #             yhat = model(parse_tokens(X[count]))
-    #
-    #             loss = loss_fn(yhat.reshape(1, CLASSES), torch.LongTensor([one_hot_labels.idx_for_label(Y[count])]))
-    #             loss.backward()
-    #             optimizer.step()
-    #             optimizer.zero_grad()
-    #
-    #             avg_loss.append(loss.detach().numpy())
-    #
-    #             print("\rEpochs: {}, Step: {}/{}, Loss: {}".format(
-    #                 epoch + 1, count + 1, len(X), np.mean(avg_loss)
-    #             ), end="")
-    #
-    #     return roc.analyse(test_Y, [
-    #         one_hot_labels.label_for_idx(torch.argmax(model(parse_tokens(test_question))))
-    #         for test_question in test_X
-    #     ])["f1"]
-    #
-    #
-    # def bootstrap_dataset():
-    #     X, Y = load(TRAIN_FILE_PATH)
-    #     replacees = np.random.choice(len(X), len(X) // 5)
-    #     replacements = np.random.choice(len(X), len(X) // 5)
-    #     for i in range(len(replacees)):
-    #         X[replacees[i]] = X[replacements[i]]
-    #         Y[replacees[i]] = Y[replacements[i]]
-    #
-    #     return X, Y
-    #
-    #
-    # def save_model(model: Model, save_model_file_path: str) -> str:
-    #     torch.save(model, save_model_file_path)
-    #     return save_model_file_path
-    #
-    #
-    # for i in range(5):
-    #     X, Y = bootstrap_dataset()
-    #
-    #     model = (Model.Builder()
-    #                 .with_glove_word_embeddings("../data/glove.small.txt")
-    #                 .with_bow_sentence_embedder()
-    #                 .with_classifier(300)
-    #                 .build())
-    #     loss_fn = nn.NLLLoss(reduction="mean")
-    #     optimizer = torch.optim.Adam(model.parameters(), lr=0.002)
-    #
-    #     results = train_model(model, loss_fn, optimizer)
-    #
-    #     save_model(model,  f"../data/saved_models/ensemble_weights/weights-{i + 1}.pth")
-    #
-    #     print("\rLr: {}: {}".format(i,
-    #         np.mean(results)
-    #     ))
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--train', action='store_true', help='Train the ensemble members rather than test them')
+    parser.add_argument('--config', default='../data/config.ini', help='The config every member is trained with')
+    parser.add_argument('--members', type=int, default=ENSEMBLE_SIZE)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, help='The number of members trained at once')
+    parser.add_argument('--threads-per-worker', type=int)
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.train:
+        for bundle_dir in train_ensemble(Config.from_config_file(args.config), args.members, seed=args.seed,
+                                         num_workers=args.workers, threads_per_worker=args.threads_per_worker):
+            print(f'Saved {bundle_dir}')
+    else:
+        from sentence_classifier.analysis.roc import StreamingMetrics
+        from sentence_classifier.models.training import EVALUATION_BATCH_SIZE
+
+        ensemble = Ensemble.from_bundles(num_members=args.members)
+        metrics = StreamingMetrics(len(ensemble.one_hot_labels.label_dict))
+        test_questions = stream(TEST_FILE_PATH)
+        for batch in iter(lambda: list(itertools.islice(test_questions, EVALUATION_BATCH_SIZE)), []):
+            metrics.update([ensemble.one_hot_labels.idx_for_label(label) for label, _ in batch],
+                           ensemble.log_probabilities([question for _, question in batch]))
+
+        print(metrics.report()["f1"])
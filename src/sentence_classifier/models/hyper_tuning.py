@@ -1,85 +1,427 @@
+import argparse
+import csv
+import dataclasses
+import hashlib
+import itertools
+import json
+import multiprocessing
+import multiprocessing.pool
+import os
+import resource
+import sys
+import tempfile
+import time
+import traceback
+from dataclasses import dataclass
+
 import numpy as np
-import torch
-from torch import nn
 
-from sentence_classifier.analysis import roc
-from sentence_classifier.models.model import Model
-from sentence_classifier.preprocessing.reader import load
-from sentence_classifier.preprocessing.tokenisation import parse_tokens
-from sentence_classifier.utils.one_hot_labels import OneHotLabels
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union, TYPE_CHECKING
 
+from sentence_classifier.utils.config import Config, ConfigurationException
 
-REPEATS = 1
-CLASSES = 50
+if TYPE_CHECKING:
+    import torch
+    from sentence_classifier.models.model import Model
 
-TRAIN_FILE_PATH = "../data/train.txt"
-VAL_FILE_PATH = "../data/dev.txt"
-TEST_FILE_PATH = "../data/test.txt"
-LABELS_JSON_FILE = "../data/labels.json"
 
-X, Y = load(TRAIN_FILE_PATH)
-val_X, val_Y = load(TEST_FILE_PATH)
+RESULTS_FILE_PATH = "../data/hyper_tuning_results.csv"
 
-one_hot_labels = OneHotLabels.from_labels_json_file(LABELS_JSON_FILE)
+# Config fields that are checked with the same parsers Config.from_config_file uses.
+CHOICE_FIELD_PARSERS = {
+    "word_embeddings": Config.parse_word_embedding_config,
+    "tune_word_embeddings": Config.parse_train_word_embedding_config,
+    "sentence_embedder": Config.parse_sentence_embedder_config,
+    "bilstm_combine_hidden": Config.parse_bilstm_combine_hidden_config,
+}
 
 
-def train_model(model, loss_fn, optimizer, repeat, epochs=10):
-    for epoch in range(epochs):
-        avg_loss = []
-        for count in range(len(X)):
-            model.train()
+@dataclass
+class LogUniform:
+    """
+    A continuous search dimension sampled uniformly in log space, e.g. LogUniform(1e-4, 1e-1) for a learning rate.
+    Only random search can sample it
+    """
+    low: float
+    high: float
 
-            question = X[count]
-            label = Y[count]
+    def sample(self, rng: np.random.Generator) -> float:
+        return float(np.exp(rng.uniform(np.log(self.low), np.log(self.high))))
 
-            yhat = model(parse_tokens(question))
 
-            loss = loss_fn(yhat.reshape(1, CLASSES), torch.LongTensor([one_hot_labels.idx_for_label(label)]))
-            loss.backward()
-            optimizer.step()
-            optimizer.zero_grad()
+# Config field -> the values to try, or a LogUniform for random search.
+SearchSpace = Dict[str, Union[Sequence[Any], LogUniform]]
 
-            avg_loss.append(loss.detach().numpy())
+DEFAULT_SEARCH_SPACE: SearchSpace = {
+    "lr": [0.01, 0.001],
+    "sentence_embedder": ["bow", "bilstm"],
+    "bilstm_hidden_dim": [150, 300],
+    "tune_word_embeddings": ["freeze", "tune"],
+}
 
-            print("\rExperiment: {}, Epochs: {}, Step: {}/{}, Loss: {}".format(
-                repeat + 1, epoch + 1, count + 1, len(X), np.mean(avg_loss)
-            ), end="")
+# Config fields only the BiLSTM sentence embedder uses, so a bow trial ignores them.
+BILSTM_FIELDS = ["bilstm_input_dim", "bilstm_hidden_dim", "bilstm_num_layers", "bilstm_combine_hidden"]
 
-    return roc.analyse(val_Y, [
-        one_hot_labels.label_for_idx(torch.argmax(model(parse_tokens(test_question))))
-        for test_question in val_X
-    ])["f1"]
 
+@dataclass
+class TrialResult:
+    trial: int
+    params: Dict[str, Any]
+    f1: Optional[float]
+    accuracy: Optional[float]
+    wall_time: float
+    peak_memory_mb: float
+    error: Optional[str] = None
+    epochs: Optional[int] = None
 
-def build_model(model_type="bow"):
-    if model_type == "bow":
-        return (Model.Builder()
-                .with_glove_word_embeddings("../data/glove.small.txt")
-                .with_bow_sentence_embedder()
-                .with_classifier(300)
-                .build())
 
-    elif model_type == "bilstm":
-        return (Model.Builder()
-                .with_glove_word_embeddings("../data/glove.small.txt")
-                .with_bilstm_sentence_embedder(300, 300)
-                .with_classifier(300)
-                .build())
+def grid_trials(search_space: SearchSpace, base_config: Optional[Config] = None) -> List[Dict[str, Any]]:
+    """
+    :param base_config: the config the trials start from, whose sentence embedder is used when it is not searched
+    :return: the params of every combination of the search space's values that builds a different model; params the
+    trial's sentence embedder ignores are dropped (see normalise_params), and the duplicates that leaves are run once
+    """
+    for name, values in search_space.items():
+        if isinstance(values, LogUniform):
+            raise ConfigurationException(f'{name} is continuous, so it can only be searched randomly')
 
-    raise Exception("Please specify a model from {'bow', 'bilstm'}")
+    names = list(search_space.keys())
+    trials = [normalise_params(dict(zip(names, values)), base_config)
+              for values in itertools.product(*search_space.values())]
+    # every trial's params are in search space order, so equal trials have equal items
+    return list(dict((tuple(params.items()), params) for params in trials).values())
 
 
-if __name__ == "__main__":
-    for lr in [0.001]:
-        results = []
-        for repeat in range(REPEATS):
-            model = build_model("bilstm")
+def random_trials(search_space: SearchSpace, num_trials: int, seed: Optional[int] = 0,
+                  base_config: Optional[Config] = None) -> List[Dict[str, Any]]:
+    """
+    :param base_config: the config the trials start from, as for grid_trials
+    :return: the params of num_trials trials, each drawing every value independently from its dimension, without the
+    params the trial's sentence embedder ignores
+    """
+    rng = np.random.default_rng(seed)
+    trials = []
+    for _ in range(num_trials):
+        trials.append(normalise_params(dict((name, values.sample(rng) if isinstance(values, LogUniform)
+                                             else values[rng.integers(len(values))])
+                                            for name, values in search_space.items()), base_config))
+    return trials
+
+
+def normalise_params(params: Dict[str, Any], base_config: Optional[Config] = None) -> Dict[str, Any]:
+    """
+    :param base_config: the config the trial starts from, whose sentence embedder is used when params has none
+    :return: the params without the BiLSTM fields if the trial's sentence embedder is bow, as they would only make
+    trials that build the same model look different
+    """
+    sentence_embedder = params.get("sentence_embedder",
+                                   base_config.sentence_embedder if base_config is not None else None)
+    if sentence_embedder != "bow":
+        return params
+    return dict((name, value) for name, value in params.items() if name not in BILSTM_FIELDS)
+
+
+def trial_config(base_config: Config, params: Dict[str, Any]) -> Config:
+    """
+    Overrides fields of the base config with a trial's params. The dims that have to agree with the searched ones,
+    the bilstm input dim and the classifier input dim, are derived unless they are searched themselves
+    """
+    field_names = set(field.name for field in dataclasses.fields(Config))
+    for name, value in params.items():
+        if name not in field_names:
+            raise ConfigurationException(f'{name} is not a config field')
+        if name in CHOICE_FIELD_PARSERS:
+            CHOICE_FIELD_PARSERS[name](value)
+
+    config = dataclasses.replace(base_config, **params)
+
+    derived = {}
+    if "bilstm_input_dim" not in params:
+        derived["bilstm_input_dim"] = config.word_embedding_dim
+    if "classifier_input_dim" not in params:
+        if config.sentence_embedder == "bow":
+            derived["classifier_input_dim"] = config.word_embedding_dim
+        else:
+            num_directions = 2 if config.bilstm_combine_hidden == "concat" else 1
+            derived["classifier_input_dim"] = config.bilstm_hidden_dim * num_directions
+
+    return dataclasses.replace(config, **derived)
+
+
+def run_trial(base_config: Config, params: Dict[str, Any], trial: Optional[int] = 0) -> TrialResult:
+    """
+    Builds and trains the model of one trial, and scores it on the config's dev file (its test file without one).
+    A trial that fails is reported with its error rather than raised, so one bad config does not end a search
+    """
+    from sentence_classifier.models.training import train_model_from_config
+
+    start_time = time.perf_counter()
+    epochs = None
+    try:
+        config = trial_config(base_config, params)
+        epochs = config.epochs
+        model = Config.build_model(config)
+        train_model_from_config(model, config)
+
+        f1, accuracy = evaluate_trial(model, config)
+        error = None
+    except Exception:
+        f1, accuracy, error = None, None, format_trial_error()
+
+    return TrialResult(trial, params, f1, accuracy, time.perf_counter() - start_time, peak_memory_mb(), error, epochs)
+
+
+def run_search(base_config: Config, trials: List[Dict[str, Any]], results_file_path: str,
+               num_workers: Optional[int] = None, threads_per_worker: Optional[int] = None) -> List[TrialResult]:
+    """
+    Runs trials concurrently, each in a fresh worker process so its peak memory is its own, and writes a row of the
+    results table to results_file_path as each one finishes
+    :param num_workers: the number of trials run at once, all cores by default
+    :param threads_per_worker: the torch threads of each trial, by default the cores shared out between the workers
+    so concurrent trials do not oversubscribe them
+    :return: the results, best F1 first
+    """
+    param_names = list(dict.fromkeys(name for params in trials for name in params))
+    results = []
+
+    with open(results_file_path, "w", newline="") as results_file, \
+            trial_pool(len(trials), num_workers, threads_per_worker) as pool:
+        writer = csv.writer(results_file)
+        writer.writerow(results_header(param_names))
+
+        trial_args = [(base_config, params, trial) for trial, params in enumerate(trials)]
+        for result in pool.imap_unordered(run_trial_args, trial_args):
+            results.append(result)
+            writer.writerow(results_row(result, param_names))
+            results_file.flush()
+            print(f'Trial {result.trial} ({len(results)}/{len(trials)}): {result.params} F1: {result.f1}'
+                  + (f' failed: {result.error}' if result.error else ""))
+
+    return rank_results(results)
+
+
+def run_halving_trial(base_config: Config, params: Dict[str, Any], trial: int, epochs: int,
+                      checkpoint_dir: str) -> TrialResult:
+    """
+    Trains a trial up to a total of epochs epochs and scores it on the dev file, like run_trial. If the trial has a
+    checkpoint from a smaller budget, it carries on from there rather than starting over, and it checkpoints its
+    trainable parameters and optimiser state once trained. A checkpoint from a bigger budget, e.g. left by an earlier
+    search with more epochs, is not used, so the trial is scored on exactly epochs epochs like the rest of its rung;
+    it is kept for the rung whose budget it reaches
+    """
+    import torch
+    from sentence_classifier.models.training import train_model_from_config, restore_parameters
+
+    start_time = time.perf_counter()
+    try:
+        config = trial_config(base_config, params)
+        if "epochs" in params:
+            raise ConfigurationException('epochs is the budget successive halving hands out, so it cannot be searched')
+
+        # seeding the build means a resumed trial rebuilds the same frozen weights, so only trainable ones are saved
+        torch.manual_seed(trial)
+        np.random.seed(trial)
+        model = Config.build_model(config)
+        optimizer = torch.optim.Adam(model.parameters(), lr=config.lr)
+
+        checkpoint_file_path = trial_checkpoint_file_path(checkpoint_dir, config, trial)
+        epochs_trained = 0
+        checkpoint_past_budget = False
+        if os.path.exists(checkpoint_file_path):
+            checkpoint = torch.load(checkpoint_file_path)
+            checkpoint_past_budget = checkpoint["epochs"] > epochs
+            if not checkpoint_past_budget:
+                restore_parameters(model, checkpoint["parameters"])
+                optimizer.load_state_dict(checkpoint["optimizer"])
+                epochs_trained = checkpoint["epochs"]
+
+        if epochs > epochs_trained:
+            # successive halving does its own dev set evaluation between rungs
+            train_model_from_config(model, dataclasses.replace(config, epochs=epochs - epochs_trained, path_dev=None),
+                                    optimizer)
+            if not checkpoint_past_budget:
+                save_trial_checkpoint(checkpoint_file_path, model, optimizer, epochs)
+
+        f1, accuracy = evaluate_trial(model, config)
+        error = None
+    except Exception:
+        f1, accuracy, error = None, None, format_trial_error()
+
+    return TrialResult(trial, params, f1, accuracy, time.perf_counter() - start_time, peak_memory_mb(), error, epochs)
+
+
+def successive_halving(base_config: Config, trials: List[Dict[str, Any]], results_file_path: str,
+                       checkpoint_dir: str, min_epochs: Optional[int] = 1, reduction_factor: Optional[int] = 3,
+                       num_workers: Optional[int] = None,
+                       threads_per_worker: Optional[int] = None) -> List[TrialResult]:
+    """
+    Successive halving: every trial is trained for min_epochs and scored on the dev file, then only the best
+    1 / reduction_factor of them are promoted to reduction_factor times the epochs, and so on up to the base config's
+    epochs. Promoted trials resume from their checkpoints. Each rung's trials run concurrently as in run_search, and
+    every rung's results are written to the results table
+    :param checkpoint_dir: where trial checkpoints are kept; they are keyed on the trial's config, so a search that
+    is run again resumes rather than retrains
+    :return: the results of the trials of the last rung, best F1 first
+    """
+    param_names = list(dict.fromkeys(name for params in trials for name in params))
+    os.makedirs(checkpoint_dir, exist_ok=True)
+
+    active_trials = list(enumerate(trials))
+    epochs = min(min_epochs, base_config.epochs)
+    with open(results_file_path, "w", newline="") as results_file, \
+            trial_pool(len(trials), num_workers, threads_per_worker) as pool:
+        writer = csv.writer(results_file)
+        writer.writerow(results_header(param_names))
+
+        while True:
+            results = []
+            trial_args = [(base_config, params, trial, epochs, checkpoint_dir) for trial, params in active_trials]
+            for result in pool.imap_unordered(run_halving_trial_args, trial_args):
+                results.append(result)
+                writer.writerow(results_row(result, param_names))
+                results_file.flush()
+                print(f'Epochs {epochs}, trial {result.trial} ({len(results)}/{len(active_trials)}): '
+                      f'{result.params} F1: {result.f1}' + (f' failed: {result.error}' if result.error else ""))
+
+            ranked_results = rank_results(results)
+            promoted_results = [result for result in ranked_results if result.error is None][
+                               :max(1, len(active_trials) // reduction_factor)]
+            if epochs >= base_config.epochs or len(promoted_results) == 0:
+                return ranked_results
+
+            active_trials = [(result.trial, result.params) for result in promoted_results]
+            # once there is a single trial left there is nothing to prune, so it goes straight to the full budget
+            epochs = base_config.epochs if len(promoted_results) == 1 \
+                else min(epochs * reduction_factor, base_config.epochs)
 
-            loss_fn = nn.NLLLoss(reduction="mean")
-            optimizer = torch.optim.Adam(model.parameters(), lr=lr)
 
-            results.append(train_model(model, loss_fn, optimizer, repeat))
+def evaluate_trial(model: 'Model', config: Config) -> Tuple[float, float]:
+    """
+    :return: the F1 score and accuracy of a trained model on the config's dev file, or its test file without one
+    """
+    from sentence_classifier.models.training import evaluate_metrics
+
+    analysis = evaluate_metrics(model, config.path_dev if config.path_dev is not None else config.path_test,
+                                config.path_corpus_cache).report()
+    return analysis["f1"], analysis["accuracy"]
+
+
+def trial_checkpoint_file_path(checkpoint_dir: str, config: Config, trial: int) -> str:
+    # the budget is the only thing that changes between a trial's rungs, so it is left out of the key
+    config_digest = hashlib.sha256(repr(dataclasses.replace(config, epochs=0)).encode()).hexdigest()
+    return os.path.join(checkpoint_dir, f"trial-{trial}-{config_digest[:16]}.pt")
+
+
+def save_trial_checkpoint(checkpoint_file_path: str, model: 'Model', optimizer: 'torch.optim.Optimizer',
+                          epochs: int):
+    import torch
+    from sentence_classifier.models.training import trainable_parameters
+
+    partial_file_path = f"{checkpoint_file_path}.{os.getpid()}.partial"
+    torch.save({"parameters": trainable_parameters(model), "optimizer": optimizer.state_dict(), "epochs": epochs},
+               partial_file_path)
+    os.replace(partial_file_path, checkpoint_file_path)
+
+
+def trial_pool(num_trials: int, num_workers: Optional[int] = None,
+               threads_per_worker: Optional[int] = None) -> multiprocessing.pool.Pool:
+    """
+    :param num_workers: the number of trials run at once, all cores by default
+    :param threads_per_worker: the torch threads of each trial, by default the cores shared out between the workers
+    so concurrent trials do not oversubscribe them
+    """
+    num_cores = os.cpu_count() or 1
+    num_workers = num_workers if num_workers is not None else min(num_cores, num_trials)
+    num_workers = max(num_workers, 1)
+    threads_per_worker = threads_per_worker if threads_per_worker is not None else max(1, num_cores // num_workers)
+
+    # trials are spawned rather than forked, and each gets a fresh process, so no trial inherits another's memory
+    return multiprocessing.get_context("spawn").Pool(num_workers, limit_torch_threads, (threads_per_worker,),
+                                                     maxtasksperchild=1)
+
+
+def results_header(param_names: List[str]) -> List[str]:
+    return ["trial"] + param_names + ["epochs", "f1", "accuracy", "wall_time_s", "peak_memory_mb", "error"]
+
+
+def results_row(result: TrialResult, param_names: List[str]) -> List[Any]:
+    return [result.trial] + [result.params.get(name, "") for name in param_names] + \
+           [result.epochs, result.f1, result.accuracy, f'{result.wall_time:.1f}', f'{result.peak_memory_mb:.1f}',
+            result.error or ""]
+
+
+def rank_results(results: List[TrialResult]) -> List[TrialResult]:
+    return sorted(results, key=lambda result: -1 if result.f1 is None else result.f1, reverse=True)
+
+
+def format_trial_error() -> str:
+    return traceback.format_exc(limit=1).strip().splitlines()[-1]
+
+
+def run_trial_args(args) -> TrialResult:
+    return run_trial(*args)
+
+
+def run_halving_trial_args(args) -> TrialResult:
+    return run_halving_trial(*args)
+
+
+def limit_torch_threads(num_threads: int):
+    import torch
+
+    torch.set_num_threads(num_threads)
+
+
+def peak_memory_mb() -> float:
+    """
+    :return: the peak resident memory of this process so far
+    """
+    # ru_maxrss is in kilobytes on linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1 << 20) if sys.platform == "darwin" else max_rss / (1 << 10)
+
+
+def load_search_space(search_space_file_path: str) -> SearchSpace:
+    """
+    Reads a search space from a json object of config field -> list of values, where a field can instead be
+    {"log_uniform": [low, high]}
+    """
+    with open(search_space_file_path) as search_space_file:
+        search_space = json.load(search_space_file)
+
+    return dict((name, LogUniform(*values["log_uniform"]) if isinstance(values, dict) else values)
+                for name, values in search_space.items())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', default='../data/config.ini', help='The config every trial starts from')
+    parser.add_argument('--search-space', help='A json search space file, the default search space otherwise')
+    parser.add_argument('--random', type=int, help='Run this many randomly sampled trials instead of the grid')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, help='The number of trials run at once')
+    parser.add_argument('--threads-per-worker', type=int)
+    parser.add_argument('--results', default=RESULTS_FILE_PATH, help='Where the results table is written')
+    parser.add_argument('--halving', action='store_true',
+                        help='Prune trials by successive halving, up to the config\'s epochs')
+    parser.add_argument('--min-epochs', type=int, default=1, help='The epochs every trial starts with when halving')
+    parser.add_argument('--reduction-factor', type=int, default=3,
+                        help='When halving, the fraction of trials promoted from each rung is 1 / this')
+    parser.add_argument('--checkpoints', help='Where halving keeps trial checkpoints, a temporary directory if unset')
+    args = parser.parse_args(sys.argv[1:])
+
+    search_space = load_search_space(args.search_space) if args.search_space else DEFAULT_SEARCH_SPACE
+    base_config = Config.from_config_file(args.config)
+    trials = random_trials(search_space, args.random, args.seed, base_config) if args.random \
+        else grid_trials(search_space, base_config)
 
-        print("\rLr: {}: {}".format(
-            lr, np.mean(results)
-        ))
+    if args.halving and args.checkpoints is not None:
+        results = successive_halving(base_config, trials, args.results, args.checkpoints, args.min_epochs,
+                                     args.reduction_factor, args.workers, args.threads_per_worker)
+    elif args.halving:
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            results = successive_halving(base_config, trials, args.results, checkpoint_dir, args.min_epochs,
+                                         args.reduction_factor, args.workers, args.threads_per_worker)
+    else:
+        results = run_search(base_config, trials, args.results, args.workers, args.threads_per_worker)
+    print(f'Best: {results[0].params} F1: {results[0].f1}')
@@ -1,15 +1,17 @@
 from torch import nn
 
+import torch
+
 from typing import Optional, Union
 
 
-from sentence_classifier.models.embedding import WordEmbeddings
-from sentence_classifier.models.bagofwords import BagOfWords
+from sentence_classifier.models.embedding import WordEmbeddings, BINARY_EMBEDDINGS_SUFFIX
+from sentence_classifier.models.bagofwords import BagOfWords, EmbeddingBagOfWords
 from sentence_classifier.models.BiLSTM import BiLSTM
 from sentence_classifier.models.classifier_nn import ClassifierNN
 from sentence_classifier.utils.vocab import VocabUtils
 
-SentenceEmbedder = Union[BagOfWords, BiLSTM]
+SentenceEmbedder = Union[BagOfWords, EmbeddingBagOfWords, BiLSTM]
 
 
 class ModelBuildError(Exception):
@@ -28,21 +30,55 @@ class Model(nn.Module):
         self.sentence_embeddings = sentence_embeddings
         self.classifier = classifier
 
-    def forward(self, x):
-        x = self.word_embeddings(x)
-        x = self.sentence_embeddings(x)
+    def forward(self, x, lengths: Optional[torch.LongTensor] = None):
+        """
+        :param x: either a single tokenised sentence, or a 2D LongTensor of word ids with dims
+        (batch_size, padded_sentence_length)
+        :param lengths: the unpadded length of each sentence when x is a padded batch
+        :return: a 2D tensor of label log-probabilities with dims (batch_size, num_labels)
+        """
+        x = self.sentence_representation(x, lengths)
         x = self.classifier(x)
 
         return x
 
+    def sentence_representation(self, x, lengths: Optional[torch.LongTensor] = None) -> torch.FloatTensor:
+        """
+        Runs everything before the classifier
+        :return: a 2D tensor of sentence representations with dims (batch_size, sentence_embedding_dim)
+        """
+        if isinstance(self.sentence_embeddings, EmbeddingBagOfWords):
+            # the fused bag-of-words embedder looks the word ids up itself
+            if not isinstance(x, torch.Tensor):
+                x = self.word_embeddings.sentence_to_idx_tensor(x).reshape(1, -1)
+            return self.sentence_embeddings(x, lengths)
+
+        x = self.word_embeddings(x)
+        return self.sentence_embeddings(x, lengths)
+
     class Builder:
         def __init__(self):
             self.word_embeddings: Optional[WordEmbeddings] = None
             self.sentence_embeddings: Optional[SentenceEmbedder] = None
             self.classifer: Optional[ClassifierNN] = None
+            self.fuse_bow = False
 
         def with_glove_word_embeddings(self, embeddings_file_path: str, freeze: Optional[bool] = True) -> 'Model.Builder':
-            word_embeddings = WordEmbeddings.from_embeddings_file(embeddings_file_path, freeze=freeze)
+            """
+            Uses the pretrained embeddings in either a text embeddings file or, if the path ends in .npy, a binary
+            store written by embedding.convert_embeddings_file, which is memory-mapped instead of parsed
+            """
+            if embeddings_file_path.endswith(BINARY_EMBEDDINGS_SUFFIX):
+                word_embeddings = WordEmbeddings.from_binary_embeddings_file(embeddings_file_path, freeze=freeze)
+            else:
+                word_embeddings = WordEmbeddings.from_embeddings_file(embeddings_file_path, freeze=freeze)
+            self.word_embeddings = word_embeddings
+            return self
+
+        def with_word_embeddings(self, word_embeddings: WordEmbeddings) -> 'Model.Builder':
+            """
+            Uses already-loaded word embeddings, e.g. ones shared with other models
+            """
             self.word_embeddings = word_embeddings
             return self
 
@@ -55,13 +91,23 @@ class Model(nn.Module):
             self.word_embeddings = word_embeddings
             return self
 
-        def with_bow_sentence_embedder(self) -> 'Model.Builder':
+        def with_bow_sentence_embedder(self, fused: Optional[bool] = True) -> 'Model.Builder':
+            """
+            Uses a bag-of-words sentence embedder. Unless fused is False, the model is built with an
+            EmbeddingBagOfWords that shares the word embeddings' table and averages straight from the word ids
+            """
             bow = BagOfWords()
             self.sentence_embeddings = bow
+            self.fuse_bow = fused
             return self
 
-        def with_bilstm_sentence_embedder(self, emb_dim, hidden_dim) -> 'Model.Builder':
-            bilstm = BiLSTM(emb_dim, hidden_dim)
+        def with_bilstm_sentence_embedder(self, emb_dim, hidden_dim, num_layers: Optional[int] = 1,
+                                          combine_hidden: Optional[str] = "sum") -> 'Model.Builder':
+            """
+            Uses a BiLSTM sentence embedder with num_layers stacked layers, whose final forward and backward hidden
+            states are combined by "sum" (hidden_dim outputs) or "concat" (2 * hidden_dim outputs)
+            """
+            bilstm = BiLSTM(emb_dim, hidden_dim, combine_hidden=combine_hidden, num_layers=num_layers)
             self.sentence_embeddings = bilstm
             return self
 
@@ -81,7 +127,12 @@ class Model(nn.Module):
                 self.check_word_embedding_sentence_embedding_dim_match()
                 self.check_sentence_embedder_classifier_input_dim_match()
 
-                model = Model(self.word_embeddings, self.sentence_embeddings, self.classifer)
+                sentence_embeddings = self.sentence_embeddings
+                if self.fuse_bow and isinstance(sentence_embeddings, BagOfWords):
+                    # fused here rather than in with_bow_sentence_embedder so it always uses the final word embeddings
+                    sentence_embeddings = EmbeddingBagOfWords(self.word_embeddings)
+
+                model = Model(self.word_embeddings, sentence_embeddings, self.classifer)
                 return model
 
         def check_word_embedding_sentence_embedding_dim_match(self) -> None:
@@ -0,0 +1,132 @@
+import itertools
+import os
+import uuid
+
+import torch
+
+from typing import Iterable, Iterator, List, Optional, TYPE_CHECKING
+
+from sentence_classifier.models.model import Model
+from sentence_classifier.models.training import EVALUATION_BATCH_SIZE
+from sentence_classifier.preprocessing.reader import stream_questions
+from sentence_classifier.preprocessing.tokenisation import Tokeniser
+from sentence_classifier.utils.one_hot_labels import OneHotLabels
+
+if TYPE_CHECKING:
+    from sentence_classifier.models.bundle import ModelBundle
+
+
+# The number of most likely labels written with each prediction.
+PREDICTION_TOP_K = 3
+
+
+class ModelPredictor:
+    """
+    Gives a single model the predict_batch and log_probabilities methods of Ensemble, so either can be served
+    """
+
+    def __init__(self, model: Model, one_hot_labels: Optional[OneHotLabels] = None,
+                 tokenisation_rules: Optional[dict] = None, model_key: Optional[str] = None):
+        """
+        :param one_hot_labels: the model's label map, only needed by predict_batch
+        :param tokenisation_rules: the rules the model was trained with (None for the default rules)
+        :param model_key: identifies the model to prediction caches, by default a key unique to this predictor
+        """
+        self.model = model
+        self.model.train(False)
+        self.one_hot_labels = one_hot_labels
+        self.tokeniser = Tokeniser.for_rules(tokenisation_rules)
+        self.model_key = model_key if model_key is not None else uuid.uuid4().hex
+
+    @staticmethod
+    def from_bundle(bundle: 'ModelBundle') -> 'ModelPredictor':
+        return ModelPredictor(bundle.model, bundle.one_hot_labels, bundle.tokenisation_rules, bundle.digest)
+
+    def predict_batch(self, questions: List[List[str]]) -> List[str]:
+        """
+        :param questions: untokenised questions, as read by reader.load
+        :return: the predicted label of each question
+        """
+        predicted_label_idxs = torch.argmax(self.log_probabilities(questions), dim=1)
+        return [self.one_hot_labels.label_for_idx(idx) for idx in predicted_label_idxs.tolist()]
+
+    def log_probabilities(self, questions: List[List[str]]) -> torch.FloatTensor:
+        """
+        :param questions: untokenised questions, as read by reader.load
+        :return: a 2D tensor with dims (num_questions, num_labels) of the label log-probabilities
+        """
+        return self.tokenised_log_probabilities(self.tokeniser.tokenise_batch(questions))
+
+    def tokenised_log_probabilities(self, tokenised_questions: List[List[str]]) -> torch.FloatTensor:
+        """
+        :param tokenised_questions: questions already tokenised by self.tokeniser
+        :return: a 2D tensor with dims (num_questions, num_labels) of the label log-probabilities
+        """
+        question_idxs, lengths = self.model.word_embeddings.sentences_to_padded_idx_tensor(tokenised_questions)
+        with torch.inference_mode():
+            return self.model(question_idxs, lengths)
+
+
+def predict_log_probabilities(model: Model, questions: Iterable[List[str]], tokenisation_rules: Optional[dict] = None,
+                              batch_size: Optional[int] = EVALUATION_BATCH_SIZE) -> Iterator[torch.FloatTensor]:
+    """
+    Runs the model under inference mode over questions batch_size at a time, tokenising each batch as it is taken from
+    questions, so only one batch of questions is ever held in memory
+    :param questions: untokenised questions, e.g. from reader.stream_questions
+    :param tokenisation_rules: the rules the model was trained with (None for the default rules)
+    :return: a (batch_size, num_labels) tensor of label log-probabilities per batch, the last one possibly smaller
+    """
+    predictor = ModelPredictor(model, tokenisation_rules=tokenisation_rules)
+    questions = iter(questions)
+
+    for batch in iter(lambda: list(itertools.islice(questions, batch_size)), []):
+        yield predictor.log_probabilities(batch)
+
+
+def write_predictions(model: Model, questions_file_path: str, eval_result_file_path: str,
+                      one_hot_labels: OneHotLabels, tokenisation_rules: Optional[dict] = None,
+                      batch_size: Optional[int] = EVALUATION_BATCH_SIZE, top_k: Optional[int] = PREDICTION_TOP_K,
+                      labelled: Optional[bool] = False) -> int:
+    """
+    Classifies every question of a questions file, streaming it through the model in batches and writing each batch's
+    predictions as soon as it is run. The result file has a line per question, in file order, of the predicted label
+    followed by the top_k most likely labels and their log-probabilities, all tab-separated. It is written under a
+    temporary name and renamed into place once complete
+    :param questions_file_path: a file of one question per line, as read by reader.stream_questions
+    :param labelled: whether each question starts with its question type, as in the training and test files
+    :return: the number of questions classified
+    """
+    top_k = min(top_k, len(one_hot_labels.label_dict))
+    eval_result_dir = os.path.dirname(eval_result_file_path)
+    if eval_result_dir:
+        os.makedirs(eval_result_dir, exist_ok=True)
+
+    num_questions = 0
+    partial_file_path = f"{eval_result_file_path}.{os.getpid()}.partial"
+    try:
+        with open(partial_file_path, "w") as eval_result_file:
+            for log_probabilities in predict_log_probabilities(model, stream_questions(questions_file_path,
+                                                                                       labelled=labelled),
+                                                               tokenisation_rules, batch_size):
+                top_log_probabilities, top_label_idxs = torch.topk(log_probabilities, top_k, dim=1)
+                eval_result_file.writelines(
+                    prediction_line([one_hot_labels.label_for_idx(idx) for idx in label_idxs],
+                                    question_log_probabilities)
+                    for label_idxs, question_log_probabilities in zip(top_label_idxs.tolist(),
+                                                                      top_log_probabilities.tolist()))
+                num_questions += len(log_probabilities)
+    except BaseException:
+        # a failed run leaves neither a result file nor its partial one behind
+        os.remove(partial_file_path)
+        raise
+
+    os.replace(partial_file_path, eval_result_file_path)
+    return num_questions
+
+
+def prediction_line(labels: List[str], log_probabilities: List[float]) -> str:
+    """
+    :param labels: the top-k labels of a question, most likely first
+    """
+    return "\t".join([labels[0]] + [f"{label}\t{log_probability:.6f}"
+                                    for label, log_probability in zip(labels, log_probabilities)]) + "\n"
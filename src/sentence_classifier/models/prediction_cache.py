@@ -0,0 +1,149 @@
+import time
+from collections import OrderedDict
+
+import torch
+
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, Union
+
+from sentence_classifier.models.ensemble import Ensemble
+from sentence_classifier.models.prediction import ModelPredictor
+
+
+# The default most predictions held by a PredictionCache.
+PREDICTION_CACHE_SIZE = 100000
+
+
+class PredictionCache:
+    """
+    A bounded LRU cache of predictions, whose entries can also expire a fixed time after they are stored. It belongs
+    to one model at a time: binding it to a different model, e.g. after a new bundle is loaded, empties it.
+
+    Usage:
+        cache = PredictionCache(max_size=10000, ttl=3600)
+        predictor = CachedPredictor(ModelPredictor.from_bundle(bundle), cache)
+        predictor.log_probabilities(questions)
+        cache.stats()
+    """
+
+    def __init__(self, max_size: Optional[int] = PREDICTION_CACHE_SIZE, ttl: Optional[float] = None,
+                 clock: Optional[Callable[[], float]] = time.monotonic):
+        """
+        :param max_size: the most entries held; storing another evicts the least recently used
+        :param ttl: the seconds an entry is kept for, None for no expiry
+        :param clock: the time source of the ttl
+        """
+        if max_size < 1:
+            raise ValueError("A prediction cache must hold at least one entry")
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.model_key: Optional[str] = None
+        # key -> (expiry time, value), least recently used first
+        self.entries: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def bind(self, model_key: str):
+        """
+        Makes the cache hold the predictions of the model identified by model_key, emptying it if it held another's
+        """
+        if model_key != self.model_key:
+            if self.model_key is not None:
+                self.invalidations += 1
+            self.clear()
+            self.model_key = model_key
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires, value = entry
+        if expires <= self.clock():
+            del self.entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        self.entries[key] = (self.clock() + self.ttl if self.ttl is not None else float("inf"), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+class CachedPredictor:
+    """
+    Puts a PredictionCache in front of a ModelPredictor or an Ensemble. Questions are looked up by their tokenised
+    form, so questions that only differ in ways the tokenisation rules normalise away share an entry, and only the
+    questions missing from the cache are run through the model, once each however often they repeat in a batch
+    """
+
+    def __init__(self, predictor: Union[ModelPredictor, Ensemble], cache: Optional[PredictionCache] = None):
+        """
+        :param cache: the cache to use, which is emptied if it held the predictions of another model
+        """
+        self.predictor = predictor
+        self.one_hot_labels = predictor.one_hot_labels
+        self.tokeniser = predictor.tokeniser
+        self.model_key = predictor.model_key
+        self.cache = cache if cache is not None else PredictionCache()
+        self.cache.bind(self.model_key)
+
+    def predict_batch(self, questions: List[List[str]]) -> List[str]:
+        predicted_label_idxs = torch.argmax(self.log_probabilities(questions), dim=1)
+        return [self.one_hot_labels.label_for_idx(idx) for idx in predicted_label_idxs.tolist()]
+
+    def log_probabilities(self, questions: List[List[str]]) -> torch.FloatTensor:
+        return self.tokenised_log_probabilities(self.tokeniser.tokenise_batch(questions))
+
+    def tokenised_log_probabilities(self, tokenised_questions: List[List[str]]) -> torch.FloatTensor:
+        """
+        :param tokenised_questions: questions already tokenised by self.tokeniser
+        :return: a 2D tensor with dims (num_questions, num_labels) of the label log-probabilities
+        """
+        # another predictor may have bound the cache to its model since
+        self.cache.bind(self.model_key)
+
+        keys = [tuple(tokenised_question) for tokenised_question in tokenised_questions]
+        # each distinct question is looked up, and on a miss run through the model, once however often it repeats in
+        # the batch, so the cache's stats count questions rather than copies
+        rows = dict((key, self.cache.get(key)) for key in dict.fromkeys(keys))
+
+        missed_keys = [key for key, row in rows.items() if row is None]
+        if missed_keys:
+            missed_log_probabilities = self.predictor.tokenised_log_probabilities([list(key) for key in missed_keys])
+            for key, row in zip(missed_keys, missed_log_probabilities):
+                # rows are cloned, so the cache does not keep whole batches alive
+                rows[key] = row.clone()
+                self.cache.put(key, rows[key])
+
+        return torch.stack([rows[key] for key in keys])
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+
+import torch
+from torch.utils.data import DataLoader
+
+from typing import Optional, Tuple
+
+from sentence_classifier.models.bagofwords import BagOfWords, EmbeddingBagOfWords
+from sentence_classifier.models.model import Model
+from sentence_classifier.preprocessing.dataloading import DatasetQuestions
+from sentence_classifier.preprocessing.tokenisation.tokeniser import fill_rules
+
+
+"""
+This module precomputes the sentence representations of a training file for models whose sentence embedding cannot
+change during training.
+
+With frozen word embeddings and a bag-of-words sentence embedder, everything before the classifier is a fixed
+function of the question, so it is computed once for the whole file (and optionally saved to disk) and only the
+classifier is trained on the resulting matrix.
+
+Usage:
+    if can_precompute_sentence_features(model):
+        features, label_idxs = load_sentence_features(model, "../data/train.txt", cache_dir="../data/cache")
+        yhat = model.classifier(features)
+"""
+
+
+def can_precompute_sentence_features(model: Model) -> bool:
+    """
+    :return: whether the model's sentence representations stay fixed while training, i.e. it uses frozen word
+    embeddings with a bag-of-words sentence embedder
+    """
+    return isinstance(model.sentence_embeddings, (BagOfWords, EmbeddingBagOfWords)) and \
+        not model.word_embeddings.embedding_layer.weight.requires_grad
+
+
+def sentence_features_cache_key(model: Model, training_data_file_path: str, tokenisation_rules: Optional[dict],
+                                labels_json_file_path: str) -> str:
+    """
+    :return: a hex digest of everything the sentence features depend on; the training file's contents, the
+    tokenisation rules, the vocab and embedding table of the word embeddings, and the label ids. The table is
+    identified by its source (e.g. the seed it was drawn with) rather than hashed, unless its source is unknown
+    """
+    digest = hashlib.sha256()
+
+    with open(training_data_file_path, "rb") as training_data_file:
+        for chunk in iter(lambda: training_data_file.read(1 << 20), b""):
+            digest.update(chunk)
+
+    digest.update(json.dumps(fill_rules(dict(tokenisation_rules or {})), sort_keys=True).encode())
+    digest.update("\n".join(model.word_embeddings.vocab).encode())
+    if model.word_embeddings.source is not None:
+        digest.update(model.word_embeddings.source.encode())
+    else:
+        digest.update(model.word_embeddings.embedding_layer.weight.detach().cpu().numpy().tobytes())
+
+    with open(labels_json_file_path, "rb") as labels_json_file:
+        digest.update(labels_json_file.read())
+
+    return digest.hexdigest()
+
+
+def compute_sentence_features(model: Model, dataset: DatasetQuestions,
+                              batch_size: Optional[int] = 256) -> Tuple[torch.FloatTensor, torch.LongTensor]:
+    """
+    :return: the (num_questions, sentence_embedding_dim) sentence representations of every question in the dataset,
+    in dataset order, and the (num_questions,) label ids
+    """
+    data_loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, collate_fn=dataset.collate_fn)
+    features, label_idxs = [], []
+
+    with torch.no_grad():
+        for question_idxs, lengths, batch_label_idxs in data_loader:
+            features.append(model.sentence_representation(question_idxs, lengths))
+            label_idxs.append(batch_label_idxs)
+
+    return torch.cat(features), torch.cat(label_idxs)
+
+
+def load_sentence_features(model: Model, training_data_file_path: str, tokenisation_rules: Optional[dict] = None,
+                           cache_dir: Optional[str] = None,
+                           labels_json_file_path: Optional[str] = "../data/labels.json"
+                           ) -> Tuple[torch.FloatTensor, torch.LongTensor]:
+    """
+    Returns the sentence features of a training file, reading them from cache_dir when they have already been
+    computed for the same inputs and writing them there otherwise.
+    :param model: a model for which can_precompute_sentence_features holds
+    :param training_data_file_path:
+    :param tokenisation_rules: the rules passed to parse_tokens (None for the default rules)
+    :param cache_dir: where cached features are kept; None disables the on-disk cache
+    :param labels_json_file_path:
+    :return: the sentence features and label ids, as returned by compute_sentence_features
+    """
+    cache_file_path = None
+    if cache_dir is not None:
+        cache_key = sentence_features_cache_key(model, training_data_file_path, tokenisation_rules,
+                                                labels_json_file_path)
+        cache_file_path = os.path.join(cache_dir, f"sentence-features-{cache_key}.pt")
+
+        if os.path.exists(cache_file_path):
+            cached = torch.load(cache_file_path)
+            return cached["features"], cached["label_idxs"]
+
+    dataset = DatasetQuestions(training_data_file_path, tokenisation_rules, model.word_embeddings.word_idx_dict,
+                               labels_json_file_path)
+    features, label_idxs = compute_sentence_features(model, dataset)
+
+    if cache_file_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # write then rename, so concurrent runs never read a partially written cache file
+        partial_file_path = f"{cache_file_path}.{os.getpid()}.partial"
+        torch.save({"features": features, "label_idxs": label_idxs}, partial_file_path)
+        os.replace(partial_file_path, cache_file_path)
+
+    return features, label_idxs
@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from sentence_classifier.models.ensemble import Ensemble
+from sentence_classifier.models.prediction import ModelPredictor, PREDICTION_TOP_K
+from sentence_classifier.models.prediction_cache import CachedPredictor, PredictionCache
+
+
+SAVED_MODEL_DIR = "../data/saved_models/model"
+
+# The most questions run in one forward pass, and the longest the first question of a batch waits for others to join.
+MAX_BATCH_SIZE = 64
+MAX_WAIT_SECONDS = 0.005
+
+# Latency percentiles are computed over this many of the most recent questions.
+LATENCY_WINDOW = 10000
+
+# The largest request body accepted.
+MAX_BODY_SIZE = 1 << 20
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                413: "Payload Too Large", 500: "Internal Server Error"}
+
+Predictor = Union[ModelPredictor, Ensemble, CachedPredictor]
+
+
+class ServerMetrics:
+    """
+    Latency, throughput and batching statistics of an InferenceServer
+    """
+
+    def __init__(self, latency_window: Optional[int] = LATENCY_WINDOW):
+        self.latencies = deque(maxlen=latency_window)
+        self.batch_sizes = Counter()
+        self.num_questions = 0
+        self.num_errors = 0
+
+    def record_batch(self, latencies: List[float], failed: Optional[bool] = False):
+        """
+        :param latencies: the seconds each question of the batch spent between being queued and being answered
+        """
+        self.latencies.extend(latencies)
+        self.batch_sizes[len(latencies)] += 1
+        self.num_questions += len(latencies)
+        if failed:
+            self.num_errors += len(latencies)
+
+    def report(self, queue_depth: int) -> Dict[str, Any]:
+        latencies_ms = np.array(self.latencies, dtype=np.float64) * 1000
+        p50, p99 = np.percentile(latencies_ms, [50, 99]).tolist() if len(latencies_ms) > 0 else (None, None)
+        return {
+            "questions": self.num_questions,
+            "errors": self.num_errors,
+            "queue_depth": queue_depth,
+            "latency_ms": {"p50": p50, "p99": p99},
+            "batch_sizes": dict((str(batch_size), count) for batch_size, count in sorted(self.batch_sizes.items())),
+        }
+
+
+class MicroBatcher:
+    """
+    Collects items submitted concurrently into batches of at most max_batch_size, waiting at most max_wait seconds
+    after the first item of a batch for more to arrive, runs each batch through predict_batch on a worker thread, so
+    the event loop keeps accepting items meanwhile, and hands each caller its own result
+    """
+
+    def __init__(self, predict_batch: Callable[[List[Any]], List[Any]], max_batch_size: Optional[int] = MAX_BATCH_SIZE,
+                 max_wait: Optional[float] = MAX_WAIT_SECONDS, metrics: Optional[ServerMetrics] = None):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.metrics = metrics if metrics is not None else ServerMetrics()
+        self.queue: Optional[asyncio.Queue] = None
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        # the queue is created here, on the running loop, rather than in __init__
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.executor.shutdown()
+
+    def queue_depth(self) -> int:
+        return self.queue.qsize() if self.queue is not None else 0
+
+    async def submit(self, item: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future, time.perf_counter()))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.next_batch()
+            items = [item for item, _, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.predict_batch, items)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                self.metrics.record_batch([time.perf_counter() - queued for _, _, queued in batch], failed=True)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            self.metrics.record_batch([time.perf_counter() - queued for _, _, queued in batch])
+
+    async def next_batch(self) -> List[Tuple[Any, asyncio.Future, float]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+
+class InferenceServer:
+    """
+    A small HTTP/1.1 server answering, on localhost by default:
+
+        POST /predict   {"question": "What is ..."} or {"questions": ["What is ...", ...]}, answered with the predicted
+                        label and the top_k labels and log-probabilities of each question
+        GET /metrics    the ServerMetrics report: p50/p99 latency, queue depth and a histogram of batch sizes, and
+                        the statistics of the prediction cache, if there is one
+
+    Questions from concurrent requests are micro-batched, so each forward pass of the model serves many of them.
+
+    Usage:
+        server = InferenceServer(ModelPredictor.from_bundle(load_model_bundle("../data/saved_models/model")))
+        asyncio.run(server.serve_forever("127.0.0.1", 8080))
+    """
+
+    def __init__(self, predictor: Predictor, max_batch_size: Optional[int] = MAX_BATCH_SIZE,
+                 max_wait: Optional[float] = MAX_WAIT_SECONDS, top_k: Optional[int] = PREDICTION_TOP_K,
+                 cache: Optional[PredictionCache] = None):
+        """
+        :param predictor: a ModelPredictor or an Ensemble
+        :param cache: a cache to put in front of the predictor, None for no cache
+        """
+        self.cache = cache
+        self.predictor = CachedPredictor(predictor, cache) if cache is not None else predictor
+        self.top_k = min(top_k, len(predictor.one_hot_labels.label_dict))
+        self.metrics = ServerMetrics()
+        self.batcher = MicroBatcher(self.predict_batch, max_batch_size, max_wait, self.metrics)
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: Optional[str] = "127.0.0.1", port: Optional[int] = 8080) -> int:
+        """
+        :param port: the port to listen on, 0 for any free one
+        :return: the port listened on
+        """
+        self.batcher.start()
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        await self.batcher.stop()
+
+    async def serve_forever(self, host: Optional[str] = "127.0.0.1", port: Optional[int] = 8080):
+        port = await self.start(host, port)
+        print(f'Serving on http://{host}:{port}')
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    def predict_batch(self, questions: List[List[str]]) -> List[Dict[str, Any]]:
+        top_log_probabilities, top_label_idxs = torch.topk(self.predictor.log_probabilities(questions), self.top_k,
+                                                           dim=1)
+        one_hot_labels = self.predictor.one_hot_labels
+        return [{"label": one_hot_labels.label_for_idx(label_idxs[0]),
+                 "top_k": [[one_hot_labels.label_for_idx(idx), log_probability]
+                           for idx, log_probability in zip(label_idxs, log_probabilities)]}
+                for label_idxs, log_probabilities in zip(top_label_idxs.tolist(), top_log_probabilities.tolist())]
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    header_line = await reader.readline()
+                    if header_line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header_line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                content_length = int(headers.get("content-length", 0))
+                if content_length > MAX_BODY_SIZE:
+                    write_response(writer, 413, {"error": "request body too large"}, False)
+                    break
+                body = await reader.readexactly(content_length)
+
+                status, response = await self.route(method, path, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                write_response(writer, status, response, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # the client went away or sent something that is not HTTP, so there is nobody to answer
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method: str, path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        if path == "/metrics":
+            if method != "GET":
+                return 405, {"error": "use GET"}
+            report = self.metrics.report(self.batcher.queue_depth())
+            if self.cache is not None:
+                report["cache"] = self.cache.stats()
+            return 200, report
+
+        if path == "/predict":
+            if method != "POST":
+                return 405, {"error": "use POST"}
+            try:
+                request = json.loads(body)
+                single = "question" in request
+                questions = [request["question"]] if single else request["questions"]
+                if not all(isinstance(question, str) for question in questions):
+                    raise TypeError()
+            except (ValueError, KeyError, TypeError):
+                return 400, {"error": 'expected {"question": "..."} or {"questions": ["...", ...]}'}
+
+            # questions are split into tokens as reader.load splits the lines of a questions file
+            questions = [question.split() for question in questions]
+            # an empty question cannot be run, and would fail the whole micro-batch it joined, not just this request
+            if not all(questions):
+                return 400, {"error": "questions must not be empty"}
+
+            try:
+                predictions = await asyncio.gather(*[self.batcher.submit(question) for question in questions])
+            except Exception as e:
+                return 500, {"error": str(e)}
+            return 200, predictions[0] if single else {"predictions": predictions}
+
+        return 404, {"error": f"no such endpoint {path}"}
+
+
+def write_response(writer: asyncio.StreamWriter, status: int, response: Dict[str, Any], keep_alive: bool):
+    body = json.dumps(response).encode()
+    writer.write(f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                 f"Content-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n"
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default=SAVED_MODEL_DIR, help='The model bundle to serve')
+    parser.add_argument('--ensemble', type=int, metavar='MEMBERS', help='Serve the ensemble of this many members instead')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--max-batch-size', type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT_SECONDS * 1000)
+    parser.add_argument('--top-k', type=int, default=PREDICTION_TOP_K)
+    parser.add_argument('--cache-size', type=int, default=0, help='The most predictions cached, 0 for no cache')
+    parser.add_argument('--cache-ttl', type=float, help='The seconds a cached prediction is kept for')
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.ensemble is not None:
+        predictor = Ensemble.from_bundles(num_members=args.ensemble)
+    else:
+        from sentence_classifier.models.bundle import load_model_bundle
+
+        predictor = ModelPredictor.from_bundle(load_model_bundle(args.model))
+
+    server = InferenceServer(predictor, args.max_batch_size, args.max_wait_ms / 1000, args.top_k,
+                             PredictionCache(args.cache_size, args.cache_ttl) if args.cache_size > 0 else None)
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
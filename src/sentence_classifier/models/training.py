@@ -0,0 +1,195 @@
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from sentence_classifier.analysis.roc import StreamingMetrics
+from sentence_classifier.models.model import Model
+from sentence_classifier.models.sentence_features import can_precompute_sentence_features, load_sentence_features
+from sentence_classifier.preprocessing.dataloading import DatasetQuestions, StreamingDatasetQuestions, \
+    BucketBatchSampler
+from sentence_classifier.utils.config import Config
+
+
+# Evaluation holds no gradients, so it can use much bigger batches than training.
+EVALUATION_BATCH_SIZE = 256
+
+
+def train_model(model: Model, training_data_file_path: str, loss_fn: Callable,
+                num_epochs: int, optimizer: torch.optim.Optimizer, batch_size: Optional[int] = 1,
+                sentence_features_cache_dir: Optional[str] = None, corpus_cache_dir: Optional[str] = None,
+                preprocessing_workers: Optional[int] = 1, bucket_by_length: Optional[bool] = False,
+                validation_data_file_path: Optional[str] = None, early_stopping: Optional[int] = None,
+                validation_interval: Optional[int] = None) -> Optional[float]:
+    """
+    Trains the model. If a validation file is given, the model is evaluated on it every validation_interval batches
+    (once per epoch by default); training stops once early_stopping evaluations in a row have not improved on the best
+    validation accuracy, and the model is left with the weights that scored it
+    :return: the best validation accuracy, or None without a validation file
+    """
+
+    torch.manual_seed(42)
+    model.train()
+
+    validation_data_loader = None
+    if can_precompute_sentence_features(model):
+        # nothing before the classifier can change, so train the classifier alone on precomputed sentence vectors
+        features, label_idxs = load_sentence_features(model, training_data_file_path, None,
+                                                      sentence_features_cache_dir)
+        data_loader = DataLoader(TensorDataset(features, label_idxs), batch_size=batch_size, shuffle=True)
+        forward = model.classifier
+
+        if validation_data_file_path is not None:
+            validation_features, validation_label_idxs = load_sentence_features(model, validation_data_file_path,
+                                                                                None, sentence_features_cache_dir)
+            validation_data_loader = DataLoader(TensorDataset(validation_features, validation_label_idxs),
+                                                batch_size=EVALUATION_BATCH_SIZE)
+    else:
+        dataset = DatasetQuestions(training_data_file_path, None, model.word_embeddings.word_idx_dict,
+                                   cache_dir=corpus_cache_dir, num_workers=preprocessing_workers)
+        if bucket_by_length:
+            # batch questions of similar length together so less of each batch is padding
+            data_loader = DataLoader(dataset, batch_sampler=BucketBatchSampler(dataset.corpus.lengths, batch_size),
+                                     collate_fn=dataset.collate_fn)
+        else:
+            data_loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, collate_fn=dataset.collate_fn)
+        forward = model
+
+        if validation_data_file_path is not None:
+            validation_dataset = DatasetQuestions(validation_data_file_path, None, model.word_embeddings.word_idx_dict,
+                                                  cache_dir=corpus_cache_dir, num_workers=preprocessing_workers)
+            validation_data_loader = DataLoader(validation_dataset, batch_size=EVALUATION_BATCH_SIZE,
+                                                collate_fn=validation_dataset.collate_fn)
+
+    validation_interval = validation_interval if validation_interval is not None else len(data_loader)
+    best_accuracy, best_parameters, evaluations_without_improvement = None, None, 0
+    step = 0
+
+    for epoch in range(num_epochs):
+        for *inputs, label_idxs in data_loader:
+            yhat = forward(*inputs)
+
+            loss = loss_fn(yhat, label_idxs)
+            loss.backward()
+            optimizer.step()
+            optimizer.zero_grad()
+
+            step += 1
+            if validation_data_loader is None or step % validation_interval != 0:
+                continue
+
+            accuracy = evaluate_accuracy(model, forward, validation_data_loader)
+            if best_accuracy is None or accuracy > best_accuracy:
+                best_accuracy, best_parameters = accuracy, trainable_parameters(model)
+                evaluations_without_improvement = 0
+            else:
+                evaluations_without_improvement += 1
+
+            if early_stopping is not None and evaluations_without_improvement >= early_stopping:
+                break
+        else:
+            continue
+        print(f'Early stopping after epoch {epoch + 1}, best validation accuracy: {best_accuracy * 100}%')
+        break
+
+    if best_parameters is not None:
+        restore_parameters(model, best_parameters)
+
+    model.train(False)
+    return best_accuracy
+
+
+def evaluate_accuracy(model: Model, forward: Callable, data_loader: DataLoader) -> float:
+    """
+    Evaluates forward (the model, or its classifier when training on precomputed features) over a labelled data
+    loader in eval mode and without gradients, leaving the model back in training mode
+    :return: the accuracy
+    """
+    model.train(False)
+    correct_predictions, num_questions = 0, 0
+
+    with torch.no_grad():
+        for *inputs, label_idxs in data_loader:
+            predicted_label_idxs = torch.argmax(forward(*inputs), dim=1)
+            correct_predictions += int(torch.sum(predicted_label_idxs == label_idxs))
+            num_questions += len(label_idxs)
+
+    model.train()
+    return correct_predictions / num_questions
+
+
+def trainable_parameters(model: Model) -> Dict[str, torch.Tensor]:
+    """
+    :return: a copy of the model's trainable parameters; frozen ones, like a frozen embedding table, never change
+    and so are not copied
+    """
+    return dict((name, parameter.detach().clone())
+                for name, parameter in model.named_parameters() if parameter.requires_grad)
+
+
+def restore_parameters(model: Model, parameters: Dict[str, torch.Tensor]):
+    with torch.no_grad():
+        for name, parameter in model.named_parameters():
+            if name in parameters:
+                parameter.copy_(parameters[name])
+
+
+def train_model_from_config(model: Model, config: Config,
+                            optimizer: Optional[torch.optim.Optimizer] = None) -> Optional[float]:
+    """
+    Trains the model with the optimiser, loss and training options of a config
+    :param optimizer: an optimiser to carry on with, e.g. one restored from a checkpoint; a new Adam optimiser with
+    the config's learning rate when None
+    :return: the best validation accuracy, or None if the config has no path_dev
+    """
+    optimizer = optimizer if optimizer is not None else torch.optim.Adam(model.parameters(), lr=config.lr)
+    return train_model(model, config.path_train, torch.nn.NLLLoss(reduction="mean"),
+                       config.epochs, optimizer, config.batch_size,
+                       config.path_sentence_features_cache, config.path_corpus_cache, config.preprocessing_workers,
+                       config.bucket_by_length, config.path_dev, config.early_stopping, config.validation_interval)
+
+
+def training_padding_efficiency(model: Model, config: Config) -> Optional[float]:
+    """
+    :return: the fraction of the padded tokens of each training epoch that are real tokens when the config buckets by
+        length, else None; also None if the model trains on precomputed sentence vectors, which are never padded
+    """
+    if not config.bucket_by_length or can_precompute_sentence_features(model):
+        return None
+
+    dataset = DatasetQuestions(config.path_train, None, model.word_embeddings.word_idx_dict,
+                               cache_dir=config.path_corpus_cache, num_workers=config.preprocessing_workers)
+    return BucketBatchSampler(dataset.corpus.lengths, config.batch_size).padding_efficiency()
+
+
+def evaluate_log_probabilities(model: Model, data_file_path: str, corpus_cache_dir: Optional[str] = None,
+                               batch_size: Optional[int] = EVALUATION_BATCH_SIZE) \
+        -> Iterator[Tuple[torch.LongTensor, torch.FloatTensor]]:
+    """
+    Runs the model in batches, without gradients, over a labelled questions file. The file is streamed unless it is
+    read from the corpus cache, which is memory-mapped
+    :return: the true label ids and label log-probabilities of each batch
+    """
+    word_idx_dict = model.word_embeddings.word_idx_dict
+    dataset = DatasetQuestions(data_file_path, None, word_idx_dict, cache_dir=corpus_cache_dir) \
+        if corpus_cache_dir is not None else StreamingDatasetQuestions(data_file_path, None, word_idx_dict)
+    data_loader = DataLoader(dataset, batch_size=batch_size, collate_fn=dataset.collate_fn)
+
+    with torch.no_grad():
+        for question_idxs, lengths, label_idxs in data_loader:
+            yield label_idxs, model(question_idxs, lengths)
+
+
+def evaluate_metrics(model: Model, data_file_path: str, corpus_cache_dir: Optional[str] = None,
+                     batch_size: Optional[int] = EVALUATION_BATCH_SIZE) -> StreamingMetrics:
+    """
+    Accumulates the confusion matrix of the model's predictions over a labelled questions file batch by batch, as
+    evaluate_log_probabilities runs them, so neither the questions nor the predictions are ever all held in memory
+    :return: the metrics of the model's predictions, merged with others' by StreamingMetrics.merge
+    """
+    metrics = StreamingMetrics(model.classifier.output_dim)
+    for label_idxs, log_probabilities in evaluate_log_probabilities(model, data_file_path, corpus_cache_dir,
+                                                                    batch_size):
+        metrics.update(label_idxs, log_probabilities)
+
+    return metrics
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from typing import Dict, Optional, Tuple
+
+from sentence_classifier.preprocessing.reader import load
+from sentence_classifier.preprocessing.tokenisation.tokeniser import Tokeniser, fill_rules
+from sentence_classifier.utils.one_hot_labels import OneHotLabels
+
+
+"""
+This module stores tokenised, id-mapped corpora on disk so they are only ever tokenised once.
+
+A corpus file is a small header followed by three flat arrays; the int64 offsets of each question into the token ids,
+the int32 token ids of every question back to back, and the int32 label id of each question. Cached corpora are
+memory-mapped rather than parsed, and are keyed on everything the ids depend on, so a changed corpus, rule set, vocab
+or label set is simply a cache miss.
+
+Usage:
+    corpus = TokenisedCorpus.load_or_build("../data/train.txt", rules, word_idx_dict, "../data/labels.json",
+                                           cache_dir="../data/cache")
+    token_ids, label_id = corpus[0]
+"""
+
+
+CORPUS_FILE_MAGIC = b"QCORPUS1"
+UNKNOWN_TOKEN = "#UNK#"
+
+
+class TokenisedCorpus:
+    def __init__(self, offsets: np.ndarray, token_ids: np.ndarray, label_ids: np.ndarray):
+        """
+        Initialise a corpus from its flat arrays.
+
+        Args:
+            offsets: The (num_questions + 1,) offsets; question i is token_ids[offsets[i]:offsets[i + 1]].
+            token_ids: The token ids of every question back to back.
+            label_ids: The (num_questions,) label ids.
+        """
+        self.offsets = offsets
+        self.token_ids = token_ids
+        self.label_ids = label_ids
+
+    def __len__(self):
+        return len(self.label_ids)
+
+    def __getitem__(self, index: int) -> Tuple[np.ndarray, int]:
+        return self.token_ids[self.offsets[index]:self.offsets[index + 1]], int(self.label_ids[index])
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """
+        The number of tokens in each question.
+        """
+        return np.diff(self.offsets)
+
+    @staticmethod
+    def build(corpus_file_path: str, tokenisation_rules: Optional[dict], word_idx_dict: Dict[str, int],
+              one_hot_labels: OneHotLabels, num_workers: int = 1) -> 'TokenisedCorpus':
+        """
+        Tokenise and id-map a corpus file.
+
+        Args:
+            corpus_file_path: A path to a questions file in the format read by reader.load.
+            tokenisation_rules: The rules passed to parse_tokens (None for the default rules).
+            word_idx_dict: The word -> id mapping; words missing from it map to the id of #UNK#.
+            one_hot_labels: The label -> id mapping.
+            num_workers: The number of processes to tokenise with, see Tokeniser.tokenise_batch.
+
+        Returns:
+            The tokenised corpus, held in memory.
+        """
+        questions, labels = load(corpus_file_path)
+        tokenised_questions = Tokeniser.for_rules(tokenisation_rules).tokenise_batch(questions, num_workers)
+
+        unknown_idx = word_idx_dict[UNKNOWN_TOKEN]
+        offsets = np.zeros(len(tokenised_questions) + 1, dtype=np.int64)
+        np.cumsum([len(question) for question in tokenised_questions], out=offsets[1:])
+        token_ids = np.fromiter((word_idx_dict.get(word, unknown_idx)
+                                 for question in tokenised_questions for word in question),
+                                dtype=np.int32, count=int(offsets[-1]))
+        label_ids = np.array([one_hot_labels.idx_for_label(label) for label in labels], dtype=np.int32)
+
+        return TokenisedCorpus(offsets, token_ids, label_ids)
+
+    def save(self, corpus_cache_file_path: str) -> str:
+        """
+        Write the corpus to a file that TokenisedCorpus.load can memory-map.
+
+        The file is written under a temporary name and then renamed, so concurrent runs never read a partial file.
+
+        Args:
+            corpus_cache_file_path: The path to write.
+
+        Returns:
+            The written path.
+        """
+        partial_file_path = f"{corpus_cache_file_path}.{os.getpid()}.partial"
+        with open(partial_file_path, "wb") as corpus_file:
+            corpus_file.write(CORPUS_FILE_MAGIC)
+            np.array([len(self), len(self.token_ids)], dtype=np.int64).tofile(corpus_file)
+            np.ascontiguousarray(self.offsets, dtype=np.int64).tofile(corpus_file)
+            np.ascontiguousarray(self.token_ids, dtype=np.int32).tofile(corpus_file)
+            np.ascontiguousarray(self.label_ids, dtype=np.int32).tofile(corpus_file)
+
+        os.replace(partial_file_path, corpus_cache_file_path)
+        return corpus_cache_file_path
+
+    @staticmethod
+    def load(corpus_cache_file_path: str) -> 'TokenisedCorpus':
+        """
+        Memory-map a corpus file written by TokenisedCorpus.save.
+
+        Args:
+            corpus_cache_file_path: The path of the corpus file.
+
+        Returns:
+            The tokenised corpus, backed by read-only maps of the file.
+        """
+        with open(corpus_cache_file_path, "rb") as corpus_file:
+            if corpus_file.read(len(CORPUS_FILE_MAGIC)) != CORPUS_FILE_MAGIC:
+                raise ValueError(f'{corpus_cache_file_path} is not a tokenised corpus file')
+            num_questions, num_tokens = np.fromfile(corpus_file, dtype=np.int64, count=2)
+
+        offset = len(CORPUS_FILE_MAGIC) + 2 * 8
+        offsets = np.memmap(corpus_cache_file_path, dtype=np.int64, mode="r", offset=offset,
+                            shape=(num_questions + 1,))
+        offset += offsets.nbytes
+        # np.memmap refuses zero-length maps, so an empty section is just an empty array
+        token_ids = np.memmap(corpus_cache_file_path, dtype=np.int32, mode="r", offset=offset,
+                              shape=(num_tokens,)) if num_tokens > 0 else np.zeros(0, dtype=np.int32)
+        offset += 4 * num_tokens
+        label_ids = np.memmap(corpus_cache_file_path, dtype=np.int32, mode="r", offset=offset,
+                              shape=(num_questions,)) if num_questions > 0 else np.zeros(0, dtype=np.int32)
+
+        return TokenisedCorpus(offsets, token_ids, label_ids)
+
+    @staticmethod
+    def load_or_build(corpus_file_path: str, tokenisation_rules: Optional[dict], word_idx_dict: Dict[str, int],
+                      labels_json_file_path: str, cache_dir: Optional[str] = None,
+                      num_workers: int = 1) -> 'TokenisedCorpus':
+        """
+        Get a tokenised corpus, from cache_dir if it has been built for the same inputs before.
+
+        Args:
+            corpus_file_path: A path to a questions file in the format read by reader.load.
+            tokenisation_rules: The rules passed to parse_tokens (None for the default rules).
+            word_idx_dict: The word -> id mapping; words missing from it map to the id of #UNK#.
+            labels_json_file_path: A path to the label -> id json file.
+            cache_dir: Where corpus files are kept. None disables the on-disk cache.
+            num_workers: The number of processes to tokenise with when the corpus has to be built.
+
+        Returns:
+            The tokenised corpus.
+        """
+        one_hot_labels = OneHotLabels.from_labels_json_file(labels_json_file_path)
+        if cache_dir is None:
+            return TokenisedCorpus.build(corpus_file_path, tokenisation_rules, word_idx_dict, one_hot_labels,
+                                         num_workers)
+
+        cache_key = corpus_cache_key(corpus_file_path, tokenisation_rules, word_idx_dict, one_hot_labels)
+        corpus_cache_file_path = os.path.join(cache_dir, f"corpus-{cache_key}.bin")
+        if os.path.exists(corpus_cache_file_path):
+            return TokenisedCorpus.load(corpus_cache_file_path)
+
+        os.makedirs(cache_dir, exist_ok=True)
+        TokenisedCorpus.build(corpus_file_path, tokenisation_rules, word_idx_dict, one_hot_labels,
+                              num_workers).save(corpus_cache_file_path)
+        return TokenisedCorpus.load(corpus_cache_file_path)
+
+
+def corpus_cache_key(corpus_file_path: str, tokenisation_rules: Optional[dict], word_idx_dict: Dict[str, int],
+                     one_hot_labels: OneHotLabels) -> str:
+    """
+    Hash everything the ids of a tokenised corpus depend on.
+
+    Args:
+        corpus_file_path: A path to the questions file, whose contents are hashed.
+        tokenisation_rules: The tokenisation rules, hashed after filling in the defaults.
+        word_idx_dict: The word -> id mapping.
+        one_hot_labels: The label -> id mapping.
+
+    Returns:
+        A hex digest identifying the tokenised corpus.
+    """
+    digest = hashlib.sha256()
+
+    with open(corpus_file_path, "rb") as corpus_file:
+        for chunk in iter(lambda: corpus_file.read(1 << 20), b""):
+            digest.update(chunk)
+
+    digest.update(json.dumps(fill_rules(dict(tokenisation_rules or {})), sort_keys=True).encode())
+    digest.update(json.dumps(word_idx_dict).encode())
+    digest.update(json.dumps(one_hot_labels.label_dict).encode())
+
+    return digest.hexdigest()
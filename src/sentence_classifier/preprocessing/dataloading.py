@@ -1,62 +1,172 @@
-from torch.utils.data import Dataset
-from torch.nn.functional import pad
-from sentence_classifier.preprocessing.reader import load
-from sentence_classifier.preprocessing.tokenisation.tokeniser import parse_tokens
+from torch.utils.data import Dataset, IterableDataset, Sampler, get_worker_info
+from sentence_classifier.preprocessing.corpus_cache import TokenisedCorpus, UNKNOWN_TOKEN
+from sentence_classifier.preprocessing.reader import stream, STREAM_CHUNK_SIZE
+from sentence_classifier.preprocessing.tokenisation.tokeniser import Tokeniser
+from sentence_classifier.utils.one_hot_labels import OneHotLabels
+import numpy as np
 import torch
-import json
 
-from test.test_end_to_end import OneHotLabels
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
 
 class DatasetQuestions(Dataset):
     """
     This extended class of Dataset facilitates the work of DataLoader for managing (eg. batching) the questions dataset.
     """
 
-    def __init__(self, filepath, tokenisation_rules, vocab_path):
-        self.questions, self.classifications = load(filepath)
+    def __init__(self, filepath: str, tokenisation_rules: Optional[dict], word_idx_dict: Dict[str, int],
+                 labels_json_file_path: Optional[str] = "../data/labels.json", cache_dir: Optional[str] = None,
+                 num_workers: Optional[int] = 1):
+        """
+        :param filepath: the questions file to load
+        :param tokenisation_rules: the rules passed to parse_tokens (None for the default rules)
+        :param word_idx_dict: word -> embedding row mapping, normally model.word_embeddings.word_idx_dict, so the ids
+        produced here line up with the model's embedding layer
+        :param labels_json_file_path:
+        :param cache_dir: where tokenised corpora are cached between runs; None tokenises the file every time
+        :param num_workers: the number of processes the file is tokenised with
+        """
+        # questions are tokenised and mapped to word ids once, up front, rather than on every batch
+        self.corpus = TokenisedCorpus.load_or_build(filepath, tokenisation_rules, word_idx_dict,
+                                                    labels_json_file_path, cache_dir, num_workers)
 
-        # Map questions to tokenised questions
-        self.tokenised_questions = list(map(lambda x: parse_tokens(x, tokenisation_rules), self.questions))
-        self.one_hot_labels = {}
-        f = open('../data/labels.json')
-        data = json.load(f)
-        for i in data:
-            self.one_hot_labels[i] = data[i]
+    def __len__(self):
+        return len(self.corpus)
 
-        self.embedding_map = {}
-        idx = 1
-        with open(vocab_path) as file:
-            for line in file:
-                self.embedding_map[line.split()[0]] = idx
-                idx += 1
-        self.longest_sequence = 0
+    def __getitem__(self, index: int) -> Tuple[np.ndarray, int]:
+        return self.corpus[index]
 
-    def __len__(self):
-        return len(self.tokenised_questions)
-
-    def __getitem__(self, index: int):
-        return self.tokenised_questions[index], self.classifications[index]
-        # return self.transform(self.embedding[index]), self.classifications[index]
-    
-    def transform(self, question):
-        dim = len(question)
-        mapped_question = []
-        for w in question:
-            try:
-                mapped_question.append(self.embedding_map[w])
-            except KeyError:
-                mapped_question.append(self.embedding_map["#UNK#"])   
-        return pad(input=torch.LongTensor(mapped_question), pad=(0, self.longest_sequence-dim), mode='constant', value=0)
+    # this method is passed to DataLoader class for making the size of the sequences in a batch consistent
+    def collate_fn(self, batch) -> Tuple[torch.LongTensor, torch.LongTensor, torch.LongTensor]:
+        return collate_questions(batch)
+
+
+class StreamingDatasetQuestions(IterableDataset):
+    """
+    A questions dataset that streams its file instead of loading it, so it can be larger than memory. Each question
+    is tokenised and mapped to word ids as it is read. With a multi-worker DataLoader, each worker reads the file and
+    keeps every num_workers-th question, so every question is still yielded exactly once.
+    """
+
+    def __init__(self, filepath: str, tokenisation_rules: Optional[dict], word_idx_dict: Dict[str, int],
+                 labels_json_file_path: Optional[str] = "../data/labels.json",
+                 chunk_size: Optional[int] = STREAM_CHUNK_SIZE):
+        """
+        :param filepath: the questions file to stream
+        :param tokenisation_rules: the rules passed to parse_tokens (None for the default rules)
+        :param word_idx_dict: word -> embedding row mapping, normally model.word_embeddings.word_idx_dict
+        :param labels_json_file_path:
+        :param chunk_size: the approximate number of bytes read from the file at a time
+        """
+        self.filepath = filepath
+        self.tokeniser = Tokeniser.for_rules(tokenisation_rules)
+        self.word_idx_dict = word_idx_dict
+        self.one_hot_labels = OneHotLabels.from_labels_json_file(labels_json_file_path)
+        self.chunk_size = chunk_size
+
+    def __iter__(self) -> Iterator[Tuple[np.ndarray, int]]:
+        worker_info = get_worker_info()
+        worker_id, num_workers = (worker_info.id, worker_info.num_workers) if worker_info is not None else (0, 1)
+        unknown_idx = self.word_idx_dict[UNKNOWN_TOKEN]
+
+        for count, (label, question) in enumerate(stream(self.filepath, self.chunk_size)):
+            if count % num_workers != worker_id:
+                continue
+
+            question_idxs = np.array([self.word_idx_dict.get(word, unknown_idx)
+                                      for word in self.tokeniser.tokenise(question)], dtype=np.int64)
+            yield question_idxs, self.one_hot_labels.idx_for_label(label)
 
     # this method is passed to DataLoader class for making the size of the sequences in a batch consistent
-    def collate_fn(self, batch):
-        self.longest_sequence = 0
-        # save the max length of the sequences in the batch
-        for q, l in batch:
-            self.longest_sequence = max(self.longest_sequence, len(q))
-        qs, ls = [], []
-        # modify the batch by padding the sequences to match the size of the longest sequence
-        for q, l in batch:
-            qs.append(self.transform(q))
-            ls.append(self.one_hot_labels[l])
-        return (qs, torch.LongTensor(ls))
+    def collate_fn(self, batch) -> Tuple[torch.LongTensor, torch.LongTensor, torch.LongTensor]:
+        return collate_questions(batch)
+
+
+def collate_questions(batch: List[Tuple[np.ndarray, int]]) -> Tuple[torch.LongTensor, torch.LongTensor,
+                                                                    torch.LongTensor]:
+    """
+    Pads a batch of (word ids, label id) questions
+    :return: a (batch_size, longest_sequence) tensor of word ids padded with 0, the (batch_size,) tensor of the
+    unpadded sentence lengths and the (batch_size,) tensor of label ids
+    """
+    lengths = np.array([len(q) for q, l in batch], dtype=np.int64)
+    # pad the sequences in the batch to match the size of the longest sequence
+    qs = np.zeros((len(batch), lengths.max() if len(batch) > 0 else 0), dtype=np.int64)
+    for row, (q, l) in enumerate(batch):
+        qs[row, :len(q)] = q
+    ls = np.array([l for q, l in batch], dtype=np.int64)
+    return torch.from_numpy(qs), torch.from_numpy(lengths), torch.from_numpy(ls)
+
+
+class BucketBatchSampler(Sampler):
+    """
+    A batch sampler that batches questions of similar length together, so little of each padded batch is padding.
+
+    Each epoch the questions are sorted by length, with ties broken randomly (shuffling within each length bucket),
+    cut into batches, and the order of the batches is shuffled (shuffling across buckets). Pass it to a DataLoader as
+    its batch_sampler.
+    """
+
+    def __init__(self, lengths: Sequence[int], batch_size: int, shuffle: Optional[bool] = True,
+                 drop_last: Optional[bool] = False, generator: Optional[torch.Generator] = None):
+        """
+        :param lengths: the number of tokens in each question of the dataset, e.g. DatasetQuestions.corpus.lengths
+        :param batch_size:
+        :param shuffle: whether to shuffle within and across buckets; otherwise batches are in length order
+        :param drop_last: whether to drop the final batch if it is smaller than batch_size
+        :param generator: the random generator to shuffle with; torch's default one when None
+        """
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.generator = generator
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.lengths) // self.batch_size
+        return -(-len(self.lengths) // self.batch_size)
+
+    def __iter__(self) -> Iterator[List[int]]:
+        yield from self.batches()
+
+    def batches(self) -> List[List[int]]:
+        """
+        :return: one epoch's batches of question indices
+        """
+        if self.shuffle:
+            permutation = torch.randperm(len(self.lengths), generator=self.generator).numpy()
+            batches = self._cut_batches(permutation[np.argsort(self.lengths[permutation], kind="stable")])
+            return [batches[idx] for idx in torch.randperm(len(batches), generator=self.generator).tolist()]
+
+        return self._cut_batches(np.argsort(self.lengths, kind="stable"))
+
+    def _cut_batches(self, order: np.ndarray) -> List[List[int]]:
+        batches = [order[start:start + self.batch_size].tolist() for start in range(0, len(order), self.batch_size)]
+        if self.drop_last and len(batches) > 0 and len(batches[-1]) < self.batch_size:
+            batches.pop()
+        return batches
+
+    def padding_efficiency(self) -> float:
+        """
+        Shuffling only swaps questions of the same length and reorders the batches, so every epoch pads the same and
+        this is worked out from the length-sorted batches, without drawing from the random generator
+        :return: the fraction of the padded tokens of an epoch's batches that are real tokens
+        """
+        return padding_efficiency(self.lengths, self._cut_batches(np.argsort(self.lengths, kind="stable")))
+
+
+def padding_efficiency(lengths: Sequence[int], batches: Sequence[Sequence[int]]) -> float:
+    """
+    :param lengths: the number of tokens in each question
+    :param batches: batches of question indices
+    :return: real tokens / padded tokens, where each batch is padded to its longest question
+    """
+    lengths = np.asarray(lengths)
+    real_tokens, padded_tokens = 0, 0
+    for batch in batches:
+        batch_lengths = lengths[list(batch)]
+        real_tokens += int(batch_lengths.sum())
+        padded_tokens += int(batch_lengths.max()) * len(batch) if len(batch) > 0 else 0
+
+    return real_tokens / padded_tokens if padded_tokens > 0 else 1.0
@@ -1,3 +1,10 @@
+from typing import Iterator, List, Sequence, Tuple, Union
+
+
+# The default number of bytes of whole lines read from the file at a time by stream.
+STREAM_CHUNK_SIZE = 1 << 20
+
+
 def load(path: str):
     """
     Load questions and questions types from a path.
@@ -16,12 +23,86 @@ def load(path: str):
 
     # Read and split data
     questions, types = [], []
-    with open(path) as file:
-        for line in file.readlines():
-            tokens = line.split()
-            types.append(tokens[0])
-            questions.append(tokens[1:])
+    for qtype, question in stream(path):
+        types.append(qtype)
+        questions.append(question)
 
     return questions, types
 
 
+def stream(path: str, chunk_size: int = STREAM_CHUNK_SIZE,
+           split_labels: bool = False) -> Iterator[Tuple[Union[str, Tuple[str, str]], List[str]]]:
+    """
+    Lazily stream questions and question types from a path.
+
+    This function reads the same format as load, but yields one (qtype, question) record at a time instead of
+    building lists, reading whole lines roughly chunk_size bytes at a time. Memory use is therefore independent of the
+    size of the file and records are available as soon as the first chunk is read. Blank lines are skipped.
+
+    Args:
+        path: A path in the format of the string to the document file.
+        chunk_size: The approximate number of bytes read from the file at a time.
+        split_labels: If true, each qtype such as DESC:manner is yielded split into its coarse and fine labels, as
+            ("DESC", "manner"). A qtype with no fine label gets "" as its fine label.
+
+    Returns:
+        A generator of (qtype, [token1, token2, ... tokenn]) tuples, in file order.
+    """
+    with open(path) as file:
+        for lines in iter(lambda: file.readlines(chunk_size), []):
+            for line in lines:
+                tokens = line.split()
+                if not tokens:
+                    continue
+
+                qtype = tokens[0]
+                if split_labels:
+                    coarse, _, fine = qtype.partition(":")
+                    qtype = (coarse, fine)
+
+                yield qtype, tokens[1:]
+
+
+def stream_questions(path: str, chunk_size: int = STREAM_CHUNK_SIZE, labelled: bool = False) -> Iterator[List[str]]:
+    """
+    Lazily stream the questions of a file of questions to classify.
+
+    Each non-blank line is one question, read like stream reads them, but without a question type unless labelled is
+    set, in which case the question type is dropped.
+
+    Args:
+        path: A path in the format of the string to the document file.
+        chunk_size: The approximate number of bytes read from the file at a time.
+        labelled: If true, the first token of each line is a question type, as in the files read by load.
+
+    Returns:
+        A generator of [token1, token2, ... tokenn] lists, in file order.
+    """
+    with open(path) as file:
+        for lines in iter(lambda: file.readlines(chunk_size), []):
+            for line in lines:
+                tokens = line.split()
+                if not tokens:
+                    continue
+
+                yield tokens[1:] if labelled else tokens
+
+
+def write_questions_subset(questions_file_path: str, idxs: Sequence[int], subset_file_path: str) -> str:
+    """
+    Write some of the questions of a questions file to a new one.
+
+    Args:
+        questions_file_path: A path to the questions file, in the format read by load.
+        idxs: The positions of the questions to write, counting as load does, in the order to write them. Positions
+            may repeat, e.g. in a bootstrap resample.
+        subset_file_path: The path of the file to write.
+
+    Returns:
+        The path of the written file.
+    """
+    questions, labels = load(questions_file_path)
+    with open(subset_file_path, "w") as subset_file:
+        subset_file.writelines(f"{labels[idx]} {' '.join(questions[idx])}\n" for idx in idxs)
+
+    return subset_file_path
@@ -1 +1 @@
-from .tokeniser import parse_tokens
+from .tokeniser import parse_tokens, Tokeniser
@@ -1,5 +1,6 @@
-from typing import List
-from .stopwords import replace_stopwords
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Optional
+from .stopwords import replace_stopwords, stopwords
 
 
 TOKEN_CHAR_NUM = "#NUM#"
@@ -74,7 +75,7 @@ def parse_tokens(tokens, rules: dict = None) -> List[str]:
     Parse a list of given tokens and rules to remove excessive tokens.
 
     This function will parse and replace tokens with specific tokens which allow us to reduce the amount of dimensoins
-    and unique words encoded.
+    and unique words encoded. The rules are compiled into a Tokeniser once per distinct rule set and reused.
 
     Args:
         tokens: List of all tokens in a sentence.
@@ -86,51 +87,226 @@ def parse_tokens(tokens, rules: dict = None) -> List[str]:
     # Populate rules for tokenisation
     rules = fill_rules(rules)
 
-    # Lower all chars
-    tokens = [token.lower() for token in tokens]
+    return Tokeniser.for_rules(rules).tokenise(tokens)
 
-    if rules["TOKENISE_STOPWORDS"]:
-        tokens = replace_stopwords(tokens, TOKEN_STOPWORDS)
 
-    if rules["TOKENISE_QUOTES"]:
-        tokens = parse_quotes(tokens)
+class Tokeniser:
+    """
+    A set of tokenisation rules compiled for repeated use.
+
+    parse_tokens checks every rule against every token. A Tokeniser instead resolves the rules once, and remembers the
+    result of the per-token rules for each distinct token it sees, so tokenising a sentence is a single pass of dict
+    lookups plus the quote and comma-seperated number merging. Its output is identical to parse_tokens with the same
+    rules.
+
+    Usage:
+        tokeniser = Tokeniser(rules)
+        tokenised_questions = tokeniser.tokenise_batch(questions)
+    """
+
+    # The per-token memo is cleared once it holds this many tokens, to bound memory on unbounded corpora.
+    MAX_MEMO_SIZE = 1 << 20
+
+    # The number of shards per worker process used by tokenise_batch.
+    SHARDS_PER_WORKER = 4
+
+    __compiled = {}
+
+    def __init__(self, rules: dict = None):
+        """
+        Compile the given rules.
+
+        Args:
+            rules: The tokenisation rules, as accepted by parse_tokens. Missing rules take their default values.
+        """
+        self.rules = dict(fill_rules(dict(rules) if rules is not None else None))
+
+        self.__stopwords = stopwords if self.rules["TOKENISE_STOPWORDS"] else frozenset()
+        self.__tokenise_quotes = self.rules["TOKENISE_QUOTES"]
+        self.__merge_numbers = self.rules["TOKENISE_COMMA_SEPERATED_NUMBERS"]
+        self.__memo = {}
+
+    @staticmethod
+    def for_rules(rules: dict = None) -> 'Tokeniser':
+        """
+        Get the shared compiled Tokeniser for the given rules, compiling it on first use.
+
+        Args:
+            rules: The tokenisation rules, as accepted by parse_tokens.
+
+        Returns:
+            A Tokeniser for the rules.
+        """
+        key = tuple(sorted(fill_rules(dict(rules) if rules is not None else None).items()))
+        if key not in Tokeniser.__compiled:
+            Tokeniser.__compiled[key] = Tokeniser(dict(key))
+        return Tokeniser.__compiled[key]
+
+    def tokenise(self, tokens: List[str]) -> List[str]:
+        """
+        Tokenise one sentence.
+
+        Args:
+            tokens: List of all tokens in a sentence.
+
+        Returns:
+            The parsed tokens, identical to parse_tokens(tokens, rules).
+        """
+        memo = self.__memo
+        if len(memo) > Tokeniser.MAX_MEMO_SIZE:
+            memo.clear()
+
+        parsed_tokens = []
+        # Tokens from an opening `` up to the current token, while a quote is open.
+        quote = None
+
+        for token in tokens:
+            entry = memo.get(token)
+            if entry is None:
+                entry = memo[token] = self.__compile_token(token)
+            normalised_token, parsed_token = entry
+
+            if self.__tokenise_quotes:
+                if normalised_token == "``":
+                    # A second opening quote abandons the first, whose tokens are kept as they are.
+                    if quote is not None:
+                        self.__append_all(parsed_tokens, quote)
+                    quote = [parsed_token]
+                    continue
+                if quote is not None:
+                    if normalised_token == "''":
+                        quote = None
+                        self.__append(parsed_tokens, TOKEN_CHAR_QUOTE)
+                    else:
+                        quote.append(parsed_token)
+                    continue
+
+            self.__append(parsed_tokens, parsed_token)
+
+        if quote is not None:
+            self.__append_all(parsed_tokens, quote)
+
+        if self.__merge_numbers:
+            self.__merge_wrapped_numbers(parsed_tokens)
+
+        return parsed_tokens
+
+    def tokenise_batch(self, sentences: Iterable[List[str]], num_workers: int = 1) -> List[List[str]]:
+        """
+        Tokenise a whole corpus.
+
+        With more than one worker, the corpus is split into contiguous shards which are tokenised in a pool of worker
+        processes and joined back together in order, so the output is identical to the serial one.
+
+        Args:
+            sentences: The sentences to tokenise, each a list of tokens.
+            num_workers: The number of worker processes to tokenise with. 1 tokenises in this process.
+
+        Returns:
+            The parsed tokens of every sentence, in order.
+        """
+        if num_workers <= 1:
+            return [self.tokenise(sentence) for sentence in sentences]
+
+        sentences = list(sentences)
+        # a few shards per worker evens out the load when some shards tokenise faster than others
+        num_shards = min(len(sentences), num_workers * Tokeniser.SHARDS_PER_WORKER)
+        if num_shards <= 1:
+            return self.tokenise_batch(sentences)
+
+        shard_size = -(-len(sentences) // num_shards)
+        shards = [sentences[start:start + shard_size] for start in range(0, len(sentences), shard_size)]
+
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            tokenised_shards = executor.map(self.tokenise_batch, shards)
+            return [sentence for tokenised_shard in tokenised_shards for sentence in tokenised_shard]
+
+    def __getstate__(self) -> dict:
+        # workers build their own memo, so don't send this one to them
+        state = self.__dict__.copy()
+        state["_Tokeniser__memo"] = {}
+        return state
+
+    def __compile_token(self, token: str) -> tuple:
+        """
+        Apply the lowercasing, stop word and per-token rules to one token.
+
+        Returns:
+            A tuple of the token after lowercasing and stop word replacement (which is what quotes are matched on) and
+            the token after every per-token rule, or None if the token is removed.
+        """
+        token = token.lower()
+        if token in self.__stopwords:
+            token = TOKEN_STOPWORDS
+
+        return token, self.__apply_token_rules(token)
+
+    def __apply_token_rules(self, token: str) -> Optional[str]:
+        rules = self.rules
 
-    parsed_tokens = []
-    for token in tokens:
         if token == "?" and rules["REMOVE_QUESTION_MARKS"]:
-            continue
+            return None
 
+        # Rules are applied in the same order as they always have been. Every replacement is a #TAG# that no later
+        # rule matches, so the first rule to match decides the token.
         if token in months_tokens and rules["TOKENISE_MONTH"]:
-            token = TOKEN_CHAR_MONTH
+            return TOKEN_CHAR_MONTH
 
         if ".com" in token and rules["TOKENISE_URLS"]:
-            token = TOKEN_CHAR_URL
+            return TOKEN_CHAR_URL
 
         if token[0] in {"$", "£"} and rules["TOKENISE_MONEY"]:
-            token = TOKEN_CHAR_MONEY
-
-        if token[-1] == "%" and is_num(token[:-1]) and rules["TOKENISE_PERCENTAGES"]:
-            token = TOKEN_CHAR_PERCENTAGE
+            return TOKEN_CHAR_MONEY
 
-        if is_num(token) and "." not in token and len(token) == 4 and rules["TOKENISE_YEAR"]:
-            token = TOKEN_YEAR
+        if token[-1] == "%" and rules["TOKENISE_PERCENTAGES"] and is_num(token[:-1]):
+            return TOKEN_CHAR_PERCENTAGE
 
-        if is_num(token) and rules["TOKENISE_NUMBERS"]:
-            token = TOKEN_CHAR_NUM
+        if (rules["TOKENISE_YEAR"] or rules["TOKENISE_NUMBERS"]) and is_num(token):
+            if "." not in token and len(token) == 4 and rules["TOKENISE_YEAR"]:
+                return TOKEN_YEAR
+            if rules["TOKENISE_NUMBERS"]:
+                return TOKEN_CHAR_NUM
 
-        # This is not toggle-able since '&' and 'and' have the same meaning, so no
-        # meaning is lost, however fewer dimensions are required using this.
         if token == "&":
-            token = "and"
+            return "and"
 
-        # Add the converted tokens to the list
-        parsed_tokens.append(token)
+        return token
+
+    def __append(self, parsed_tokens: List[str], token: Optional[str]):
+        """
+        Append a parsed token, merging comma seperated numbers as they arrive: a #NUM# following a comma that follows
+        a number or money token is absorbed, along with the comma, into that token.
+        """
+        if token is None:
+            return
 
-    # Convert any num,num to just num. e.g. 1 , 000 -> num rather than num,num
-    if rules["TOKENISE_COMMA_SEPERATED_NUMBERS"]:
-        parsed_tokens = merge_comma_seperated_numers(parsed_tokens)
+        if self.__merge_numbers and token == TOKEN_CHAR_NUM and len(parsed_tokens) >= 2 and \
+                parsed_tokens[-1] == "," and parsed_tokens[-2] in {TOKEN_CHAR_MONEY, TOKEN_CHAR_NUM}:
+            parsed_tokens.pop()
+            return
 
-    return parsed_tokens
+        parsed_tokens.append(token)
+
+    def __append_all(self, parsed_tokens: List[str], tokens: List[Optional[str]]):
+        for token in tokens:
+            self.__append(parsed_tokens, token)
+
+    @staticmethod
+    def __merge_wrapped_numbers(tokens: List[str]):
+        """
+        merge_comma_seperated_numers walks the list backwards with plain indexing, so its last two steps (i = 1 and
+        i = 0) look at tokens[-1] and tokens[-2], wrapping around to the end of the sentence. Repeat those two steps
+        exactly so the output stays identical.
+        """
+        if TOKEN_CHAR_NUM not in tokens:
+            return
+
+        for i in (1, 0):
+            if i < len(tokens):
+                if tokens[i] == TOKEN_CHAR_NUM and tokens[i - 1] == "," and \
+                        tokens[i - 2] in {TOKEN_CHAR_MONEY, TOKEN_CHAR_NUM}:
+                    del tokens[i]
+                    del tokens[i - 1]
 
 
 def fill_rules(rules: dict) -> dict:
@@ -1,8 +1,10 @@
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import List, Optional, TYPE_CHECKING
 from typing import Literal  # TODO: requires python3.8+
 from configparser import ConfigParser
-from sentence_classifier.models.model import Model
+
+if TYPE_CHECKING:
+    from sentence_classifier.models.model import Model
 
 
 class MissingConfigurationParam(Exception):
@@ -22,19 +24,29 @@ class Config:
     # TODO: add more config params as required and parse them
     path_train: str
     path_test: str
+    path_dev: Optional[str]
     epochs: int
     early_stopping: int
+    validation_interval: Optional[int]
     lr: float
+    batch_size: int
     path_eval_result: Optional[str]
+    path_sentence_features_cache: Optional[str]
+    path_corpus_cache: Optional[str]
+    preprocessing_workers: int
+    bucket_by_length: bool
 
     word_embeddings: Literal["random", "glove"]  # TODO: requires python3.8+, remove if Kilburn VMs don't support it
     tune_word_embeddings: Literal["freeze", "tune"]
     path_word_embeddings: Optional[str]
+    path_vocab: Optional[str]
     word_embedding_dim: Optional[int]
 
     sentence_embedder: Literal["bow", "bilstm"]  # TODO: requires python3.8+
     bilstm_input_dim: Optional[int]
     bilstm_hidden_dim: Optional[int]
+    bilstm_num_layers: int
+    bilstm_combine_hidden: Literal["sum", "concat"]
 
     classifier_input_dim: int
     ensemble_configs: List['Config']
@@ -57,6 +69,8 @@ class Config:
             raise MissingConfigurationParam('path_word_embeddings must be set when word_embeddings is set to glove')
         elif word_embeddings == "glove" and config.get("word_embedding_dim") is None:
             raise MissingConfigurationParam('word_embedding_dim must be set when word_embeddings is set to random')
+        elif word_embeddings == "random" and config.get("path_vocab") is None:
+            raise MissingConfigurationParam('path_vocab must be set when word_embeddings is set to random')
         else:
             pass
 
@@ -76,17 +90,27 @@ class Config:
         try:
             return Config(config["path_train"],
                           config["path_test"],
+                          config.get("path_dev"),
                           int(config["epochs"]),
                           int(config["early_stopping"]),
+                          int(config["validation_interval"]) if "validation_interval" in config else None,
                           float(config["lr"]),
+                          int(config.get("batch_size", 1)),
                           config.get("path_eval_result"),
+                          config.get("path_sentence_features_cache"),
+                          config.get("path_corpus_cache"),
+                          int(config.get("preprocessing_workers", 1)),
+                          config.getboolean("bucket_by_length", False),
                           word_embeddings,
                           train_word_embeddings,
                           config.get("path_word_embeddings"),
+                          config.get("path_vocab"),
                           int(config.get("word_embedding_dim")),
                           sentencer_embedder,
                           int(config.get("bilstm_input_dim")),
                           int(config.get("bilstm_hidden_dim")),
+                          int(config.get("bilstm_num_layers", 1)),
+                          Config.parse_bilstm_combine_hidden_config(config.get("bilstm_combine_hidden", "sum")),
                           int(config["classifier_input_dim"]),
                           ensemble_configs)
         except KeyError as e:
@@ -95,8 +119,13 @@ class Config:
             raise ConfigurationTypeMismatch(e)
 
     @staticmethod
-    def build_model_from_config(filepath: str) -> Model:
-        config = Config.from_config_file(filepath)
+    def build_model_from_config(filepath: str) -> 'Model':
+        return Config.build_model(Config.from_config_file(filepath))
+
+    @staticmethod
+    def build_model(config: 'Config') -> 'Model':
+        from sentence_classifier.models.model import Model
+
         model_builder = Model.Builder()
         fine_tune = config.tune_word_embeddings == "tune"
         freeze = not fine_tune
@@ -104,12 +133,13 @@ class Config:
         if config.word_embeddings == "glove":
             model_builder.with_glove_word_embeddings(config.path_word_embeddings, freeze=freeze)
         else:
-            model_builder.with_random_word_embeddings(config.path_train, config.word_embedding_dim, freeze=freeze)
+            model_builder.with_random_word_embeddings(config.path_vocab, config.word_embedding_dim, freeze=freeze)
 
         if config.sentence_embedder == "bow":
             model_builder.with_bow_sentence_embedder()
         else:
-            model_builder.with_bilstm_sentence_classifier(config.bilstm_input_dim, config.bilstm_hidden_dim)
+            model_builder.with_bilstm_sentence_embedder(config.bilstm_input_dim, config.bilstm_hidden_dim,
+                                                        config.bilstm_num_layers, config.bilstm_combine_hidden)
 
         model_builder.with_classifier(config.classifier_input_dim)
 
@@ -142,3 +172,12 @@ class Config:
             return "bilstm"
         else:
             raise ConfigurationException(f'sentence_embedder must be "bow" or "bilstm"')
+
+    @staticmethod
+    def parse_bilstm_combine_hidden_config(bilstm_combine_hidden_config_str: str) -> Literal["sum", "concat"]:
+        if bilstm_combine_hidden_config_str == "sum":
+            return "sum"
+        elif bilstm_combine_hidden_config_str == "concat":
+            return "concat"
+        else:
+            raise ConfigurationException(f'bilstm_combine_hidden must be "sum" or "concat"')
@@ -1,7 +1,13 @@
+import numpy as np
+
+from typing import Iterator, Optional, Sequence, Tuple
+
+
 """
 KFold Implementation.
 
-This module contains the KFold class which can be used for validation testings.
+This module contains the KFold class which can be used for validation testings, and the StratifiedKFold class whose
+shuffled folds keep the label proportions of the whole dataset.
 
 Usage:
     from preprocessing import KFold
@@ -14,6 +20,9 @@ Usage:
         normalise....
         train...
 
+    for train_idxs, val_idxs in StratifiedKFold(y, 5, seed=0):
+        ...
+
 Created by Sam Garlick. 23/02/2021
 """
 
@@ -66,16 +75,53 @@ class KFold:
         if self.__iter_n < self.__k:
             fold_len = self.__n // self.__k
 
-            all_idxs = [i for i in range(self.__n)]
-
             val_start_idx = self.__iter_n * fold_len
             val_end_idx = (self.__iter_n + 1) * fold_len if self.__iter_n < self.__k - 1 else self.__n
-            val_idxs = all_idxs[val_start_idx:val_end_idx]
+            val_idxs = list(range(val_start_idx, val_end_idx))
 
-            train_idxs = all_idxs[:val_start_idx] + all_idxs[val_end_idx:]
+            train_idxs = list(range(val_start_idx)) + list(range(val_end_idx, self.__n))
 
             self.__iter_n += 1
 
             return train_idxs, val_idxs
         else:
             raise StopIteration
+
+
+class StratifiedKFold:
+    def __init__(self, labels: Sequence, k: int, shuffle: bool = True, seed: Optional[int] = None):
+        """
+        Initiate the StratifiedKFold class.
+
+        Every item is assigned to a fold up front. The items are grouped by label, shuffled within each label if
+        shuffle is set, and dealt out to the folds in turn, carrying on from one label to the next. Each fold therefore
+        gets within one item of its share of every label, and the fold sizes differ by at most one.
+
+        Args:
+            labels: The label of each item in the dataset.
+            k: The number of folds.
+            shuffle: Whether to shuffle the items of each label before they are dealt out.
+            seed: The seed of the shuffle.
+        """
+        labels = np.asarray(labels)
+        self.k = k
+
+        order = np.random.default_rng(seed).permutation(len(labels)) if shuffle else np.arange(len(labels))
+        # a stable sort groups the items by label while keeping each label's items in shuffled order
+        order = order[np.argsort(labels[order], kind="stable")]
+
+        self.folds = np.empty(len(labels), dtype=np.int64)
+        self.folds[order] = np.arange(len(labels)) % k
+
+    def __len__(self):
+        return self.k
+
+    def __iter__(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Iterate through the folds.
+
+        Returns:
+            A generator of (train_idxs, val_idxs) NumPy index arrays, one per fold, each in ascending order.
+        """
+        for fold in range(self.k):
+            yield np.flatnonzero(self.folds != fold), np.flatnonzero(self.folds == fold)
@@ -1,11 +1,17 @@
+import itertools
+
 import numpy as np
-from typing import List, Optional, Dict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 
 """
 This module contains the one hot encoder class used to encode text.
 
 This module's class allows the list of sentences to be encoded as a one hot vector for each token in the sentence.
+As a one hot vector is as long as the whole corpus, the same encoding can also be had in compact forms that only hold
+the index of each token's '1': a CSR-style flat array of ids with the offset of each sentence, a padded matrix of ids,
+or the sparse bag-of-words counts of each sentence. These are built in a single pass over the sentences, which may be
+streamed, e.g. from reader.stream_questions, adding new words to the corpus as they go.
 
 
 Usage:
@@ -13,6 +19,11 @@ Usage:
     X = encoder.encode(train_x, update_corpus=True)
     test_X = encoder.encode(test_x)
 
+    encoder.add_to_corpus(reader.stream_questions(train_path, labelled=True))
+    indices, offsets = encoder.encode_csr(train_x)
+    ids, lengths = encoder.encode_ids(test_x)
+    bow_ids, bow_counts, bow_offsets = encoder.encode_bag_of_words(test_x)
+
 """
 
 
@@ -49,7 +60,9 @@ class OneHotEncoder:
         One hot encode the data.
 
         This function, given a list of sentences, will convert said sentences to a one hot encoding. If the
-        update_corpus bool is enabled then any new words will be added to the corpus.
+        update_corpus bool is enabled then any new words will be added to the corpus. Every token takes a whole
+        corpus-length vector, so for more than a few sentences the compact encode_csr, encode_ids or
+        encode_bag_of_words should be used instead.
 
         Args:
             data: List of all sentences made up of a list of tokens. This data will be one hot encoded.
@@ -68,43 +81,133 @@ class OneHotEncoder:
                 ])
             ]
         """
-        if update_corpus:
-            self.__populate_dictionary(data)
+        indices, offsets = self.encode_csr(data, update_corpus)
 
         vector_length = len(self.corpus)
 
         one_hot_questions = []
-        for question in data:
-            one_hot_tokens = []
-            for token in question:
-                # If not in corpus, set to unknown token.
-                token = token if token in self.corpus else UNKNOWN_TOKEN
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            # Set the '1' of every token of the question at once
+            one_hot_tokens = np.zeros((end - start, vector_length))
+            one_hot_tokens[np.arange(end - start), indices[start:end]] = 1
+            one_hot_questions.append(one_hot_tokens)
 
-                # Create and update one hot vector
-                one_hot_vector = np.zeros(vector_length)
-                one_hot_vector[self.corpus[token]] = 1
-                one_hot_tokens.append(one_hot_vector)
+        return one_hot_questions
 
-            one_hot_questions.append(np.concatenate(
-                np.expand_dims(one_hot_tokens, axis=0)
-            ))
+    def encode_csr(self, data: Iterable[Iterable[str]], update_corpus=False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Encode the data as the corpus indexes of its tokens, in a CSR-style layout.
 
-        return one_hot_questions
+        The sentences are read once, so they can be streamed. If the update_corpus bool is enabled then new words are
+        added to the corpus as they are met.
+
+        Args:
+            data: The sentences, each an iterable of tokens.
+            update_corpus: Should new words be added to the corpus.
+
+        Returns:
+            The int64 corpus indexes of every token of every sentence, one after the other, and the (sentences + 1,)
+            int64 offsets of each sentence's first token in them, so sentence i is indices[offsets[i]:offsets[i + 1]].
+        """
+        lengths = []
 
-    def __populate_dictionary(self, data: List[List[str]]):
+        def token_indexes() -> Iterator[int]:
+            for question_indexes in self.__index_questions(data, update_corpus):
+                lengths.append(len(question_indexes))
+                yield from question_indexes
+
+        indices = np.fromiter(token_indexes(), dtype=np.int64)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return indices, offsets
+
+    def encode_ids(self, data: Iterable[Iterable[str]], update_corpus=False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Encode the data as a padded matrix of the corpus indexes of its tokens.
+
+        Args:
+            data: The sentences, each an iterable of tokens.
+            update_corpus: Should new words be added to the corpus.
+
+        Returns:
+            A (sentences, longest sentence) int64 matrix of corpus indexes, padded with 0, and the (sentences,) int64
+            unpadded length of each sentence.
+        """
+        indices, offsets = self.encode_csr(data, update_corpus)
+        lengths = np.diff(offsets)
+
+        ids = np.zeros((len(lengths), lengths.max(initial=0)), dtype=np.int64)
+        ids[np.arange(ids.shape[1]) < lengths[:, None]] = indices
+        return ids, lengths
+
+    def encode_bag_of_words(self, data: Iterable[Iterable[str]], update_corpus=False) \
+            -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Encode the data as the sparse bag-of-words count vector of each sentence: the sum of its tokens' one hot
+        vectors.
+
+        Args:
+            data: The sentences, each an iterable of tokens.
+            update_corpus: Should new words be added to the corpus.
+
+        Returns:
+            The int64 corpus indexes of the distinct tokens of every sentence, ascending within each sentence, their
+            int64 counts, and the (sentences + 1,) int64 offsets of each sentence's first distinct token, in the
+            layout of encode_csr.
+        """
+        indices, offsets = self.encode_csr(data, update_corpus)
+        vector_length = len(self.corpus)
+
+        # key each token by its sentence and corpus index, so one sort counts the tokens of every sentence
+        question_idxs = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        keys, counts = np.unique(question_idxs * vector_length + indices, return_counts=True)
+        bow_offsets = np.searchsorted(keys, np.arange(len(offsets)) * vector_length)
+        return keys % vector_length, counts.astype(np.int64, copy=False), bow_offsets
+
+    def add_to_corpus(self, data: Iterable[Iterable[str]]):
+        """
+        Add the new words of the data to the corpus without encoding it, e.g. to build the corpus from a stream of
+        sentences too big to encode at once.
+
+        Args:
+            data: The sentences, each an iterable of tokens.
+        """
+        self.__populate_dictionary(data)
+
+    def __index_questions(self, data: Iterable[Iterable[str]], update_corpus: bool) -> Iterator[List[int]]:
+        """
+        Map each token of each sentence to its corpus index, reading the sentences once.
+
+        Args:
+            data: The sentences, each an iterable of tokens.
+            update_corpus: Should new words be added to the corpus, else they are mapped to the unknown token.
+
+        Returns:
+            The list of corpus indexes of each sentence.
+        """
+        corpus = self.corpus
+        unknown_index = corpus[UNKNOWN_TOKEN]
+        for question in data:
+            if update_corpus:
+                # A new token's index is the size of the corpus before it is added
+                yield [corpus.setdefault(token, len(corpus)) for token in question]
+            else:
+                yield [corpus.get(token, unknown_index) for token in question]
+
+    def __populate_dictionary(self, data: Iterable[Iterable[str]]):
         """
         Populate the dictionary with new terms.
 
         For each token in each sentence in the data, if the token is new it shall be added to the mapping vocabulary.
         This mapping converts a given token and maps it to a specific integer which represents which index in the one
-        hot encoding should be a '1'.
+        hot encoding should be a '1'. The data is read in a single pass, so it can be streamed.
 
         Args:
-            data: The list of sentences to add new words from.
+            data: The sentences to add new words from.
         """
-        for question in data:
-            for token in question:
-                if token not in self.corpus:
-                    # We can get the new index simply by choosing the current length of the mapping dictionary
-                    #     e.g. If we have no items in the dict, then the first item will be at index 0.
-                    self.corpus[token] = len(self.corpus)
+        corpus = self.corpus
+        for token in itertools.chain.from_iterable(data):
+            if token not in corpus:
+                # We can get the new index simply by choosing the current length of the mapping dictionary
+                #     e.g. If we have no items in the dict, then the first item will be at index 0.
+                corpus[token] = len(corpus)
@@ -0,0 +1,75 @@
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+from typing import Dict, List
+
+
+"""
+This module benchmarks how long the project's command line entry points take to start.
+
+Each command is run in a fresh interpreter, so nothing is already imported or cached in the process, and the median
+wall time over several runs is reported. Run it from the src directory, as the entry points themselves are run.
+
+Importing torch, and with it the model stack, takes seconds, which would dominate every one of these commands. So the
+entry points and the modules they import at start-up (question_classifier, ensemble, hyper_tuning, config) only import
+torch and the models inside the functions that use them, with type-only imports under TYPE_CHECKING; test_startup
+checks that none of them imports torch.
+
+Usage:
+    python -m sentence_classifier.utils.startup_benchmark --repeats 10
+"""
+
+
+STARTUP_COMMANDS = {
+    "python question_classifier.py --help": [sys.executable, "question_classifier.py", "--help"],
+    "import sentence_classifier.models.ensemble": [sys.executable, "-c",
+                                                    "import sentence_classifier.models.ensemble"],
+    "import sentence_classifier.models.hyper_tuning": [sys.executable, "-c",
+                                                        "import sentence_classifier.models.hyper_tuning"],
+}
+
+
+def time_command(command: List[str], repeats: int) -> List[float]:
+    """
+    Time a command.
+
+    Args:
+        command: The command and its arguments, as passed to subprocess.run.
+        repeats: The number of times to run the command.
+
+    Returns:
+        The wall time in seconds of each run.
+    """
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start_time)
+
+    return times
+
+
+def benchmark_startup(repeats: int = 5) -> Dict[str, float]:
+    """
+    Time every command in STARTUP_COMMANDS.
+
+    Args:
+        repeats: The number of times to run each command.
+
+    Returns:
+        A dictionary of each command's description to its median wall time in seconds.
+    """
+    return dict((description, statistics.median(time_command(command, repeats)))
+                for description, command in STARTUP_COMMANDS.items())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args(sys.argv[1:])
+
+    for description, median_time in benchmark_startup(args.repeats).items():
+        print(f'{description}: {median_time * 1000:.0f}ms')
@@ -2,7 +2,7 @@ from typing import Set, List
 from collections.abc import Iterable
 
 from sentence_classifier.preprocessing.reader import load
-from sentence_classifier.preprocessing.tokenisation.tokeniser import parse_tokens
+from sentence_classifier.preprocessing.tokenisation.tokeniser import Tokeniser
 
 
 class VocabUtils:
@@ -13,14 +13,19 @@ class VocabUtils:
             return list([line.split()[0] for line in vocab_file.readlines()])
 
     @staticmethod
-    def vocab_from_training_data(training_data_file_path: str) -> Set[str]:
+    def vocab_from_training_data(training_data_file_path: str, num_workers: int = 1) -> Set[str]:
+        """
+        :param training_data_file_path:
+        :param num_workers: the number of processes the questions are tokenised with
+        :return: the set of unique words in the tokenised training data
+        """
         questions, _ = load(training_data_file_path)
-        vocab = VocabUtils.vocab_from_text_corpus([parse_tokens(question) for question in questions])
+        vocab = VocabUtils.vocab_from_text_corpus(Tokeniser.for_rules().tokenise_batch(questions, num_workers))
         return vocab
 
     @staticmethod
-    def save_vocabs(input_file, output_file):
-        vocabs = VocabUtils.vocab_from_training_data(input_file)
+    def save_vocabs(input_file, output_file, num_workers: int = 1):
+        vocabs = VocabUtils.vocab_from_training_data(input_file, num_workers)
         f = open(output_file, 'w')
         for w in vocabs:
             f.write("%s\n" % w)
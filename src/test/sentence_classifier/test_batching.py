@@ -0,0 +1,61 @@
+from unittest import TestCase
+
+import torch
+
+from sentence_classifier.models.model import Model
+from sentence_classifier.models.embedding import WordEmbeddings
+from sentence_classifier.models.bagofwords import BagOfWords, EmbeddingBagOfWords
+from sentence_classifier.models.BiLSTM import BiLSTM
+from sentence_classifier.models.classifier_nn import ClassifierNN
+
+
+class BatchingTest(TestCase):
+    vocab = ["#UNK#", "what", "is", "your", "name", "the", "capital", "of", "france", "?"]
+    sentences = [["what", "is", "your", "name", "?"],
+                 ["capital", "of", "france"],
+                 ["what", "is", "the", "capital", "of", "france", "?"]]
+
+    def build_model(self, sentence_embedder) -> Model:
+        torch.manual_seed(42)
+        word_embeddings = WordEmbeddings.from_random_embedding(self.vocab, 8)
+        return Model(word_embeddings, sentence_embedder, ClassifierNN(sentence_embedder_output_dim(sentence_embedder)))
+
+    def assert_batch_matches_single_sentences(self, model: Model):
+        model.train(False)
+        idxs, lengths = model.word_embeddings.sentences_to_padded_idx_tensor(self.sentences)
+        batched = model(idxs, lengths)
+
+        self.assertEqual(batched.size(), (len(self.sentences), 50))
+        for row, sentence in enumerate(self.sentences):
+            self.assertTrue(torch.allclose(batched[row], model(sentence)[0], atol=1e-6))
+
+    def test_bow_batch(self):
+        self.assert_batch_matches_single_sentences(self.build_model(BagOfWords()))
+
+    def test_fused_bow_batch(self):
+        torch.manual_seed(42)
+        word_embeddings = WordEmbeddings.from_random_embedding(self.vocab, 8, freeze=False)
+        model = Model(word_embeddings, EmbeddingBagOfWords(word_embeddings), ClassifierNN(8))
+        self.assert_batch_matches_single_sentences(model)
+
+        # the fused embedder shares the word embedding table rather than copying it
+        self.assertEqual(len(list(model.parameters())), 1 + len(list(model.classifier.parameters())))
+
+    def test_fused_bow_matches_bow(self):
+        model = self.build_model(BagOfWords())
+        fused_model = Model(model.word_embeddings, EmbeddingBagOfWords(model.word_embeddings), model.classifier)
+
+        idxs, lengths = model.word_embeddings.sentences_to_padded_idx_tensor(self.sentences)
+        self.assertTrue(torch.allclose(model(idxs, lengths), fused_model(idxs, lengths), atol=1e-6))
+
+    def test_bilstm_batch(self):
+        self.assert_batch_matches_single_sentences(self.build_model(BiLSTM(8, 6)))
+
+    def test_bilstm_concat_multi_layer_batch(self):
+        bilstm = BiLSTM(8, 6, combine_hidden="concat", num_layers=2)
+        self.assertEqual(bilstm.output_dim, 12)
+        self.assert_batch_matches_single_sentences(self.build_model(bilstm))
+
+
+def sentence_embedder_output_dim(sentence_embedder) -> int:
+    return sentence_embedder.output_dim if isinstance(sentence_embedder, BiLSTM) else 8
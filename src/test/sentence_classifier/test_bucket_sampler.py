@@ -0,0 +1,44 @@
+from unittest import TestCase
+
+import numpy as np
+import torch
+
+from sentence_classifier.preprocessing.dataloading import BucketBatchSampler, padding_efficiency
+
+
+class BucketBatchSamplerTest(TestCase):
+
+    def test_every_question_once_per_epoch(self):
+        lengths = np.random.RandomState(0).randint(3, 60, size=103)
+        sampler = BucketBatchSampler(lengths, 10)
+
+        batches = list(sampler)
+        self.assertEqual(len(batches), len(sampler))
+        self.assertEqual(sorted(idx for batch in batches for idx in batch), list(range(103)))
+
+        self.assertEqual(len(BucketBatchSampler(lengths, 10, drop_last=True)), 10)
+        self.assertTrue(all(len(batch) == 10 for batch in BucketBatchSampler(lengths, 10, drop_last=True)))
+
+    def test_shuffles_each_epoch(self):
+        lengths = np.random.RandomState(0).randint(3, 60, size=200)
+        sampler = BucketBatchSampler(lengths, 8, generator=torch.Generator().manual_seed(0))
+
+        self.assertNotEqual(list(sampler), list(sampler))
+
+    def test_less_padding_than_random_batches(self):
+        lengths = np.random.RandomState(0).randint(3, 60, size=1000)
+        random_batches = np.random.RandomState(1).permutation(1000).reshape(-1, 20)
+
+        bucketed_efficiency = BucketBatchSampler(lengths, 20).padding_efficiency()
+        self.assertGreater(bucketed_efficiency, 0.95)
+        self.assertGreater(bucketed_efficiency, padding_efficiency(lengths, random_batches))
+
+    def test_padding_efficiency_matches_an_epoch_without_drawing_randomness(self):
+        lengths = np.random.RandomState(0).randint(3, 60, size=205)
+        sampler = BucketBatchSampler(lengths, 20, drop_last=True)
+
+        rng_state = torch.get_rng_state()
+        efficiency = sampler.padding_efficiency()
+        self.assertTrue(torch.equal(torch.get_rng_state(), rng_state))
+
+        self.assertAlmostEqual(efficiency, padding_efficiency(lengths, list(sampler)))
@@ -0,0 +1,71 @@
+from unittest import TestCase
+import os
+import shutil
+
+import torch
+
+from sentence_classifier.models.bundle import save_model_bundle, load_model_bundle, PARAMETERS_FILE_NAME
+from sentence_classifier.models.model import Model
+from sentence_classifier.models.embedding import WordEmbeddings
+from sentence_classifier.models.bagofwords import BagOfWords, EmbeddingBagOfWords
+from sentence_classifier.models.BiLSTM import BiLSTM
+from sentence_classifier.models.classifier_nn import ClassifierNN
+from sentence_classifier.preprocessing.reader import load
+from sentence_classifier.preprocessing.tokenisation import parse_tokens
+
+
+class BundleTest(TestCase):
+
+    def setUp(self):
+        torch.manual_seed(42)
+        with open("../data/vocab.txt") as vocab_file:
+            vocab = [line.strip() for line in vocab_file]
+        self.word_embeddings = WordEmbeddings.from_random_embedding(vocab, 8)
+        self.questions = [parse_tokens(question) for question in load("../data/dev.txt")[0][:20]]
+
+    def assert_same_predictions(self, model: Model, other_model: Model):
+        model.train(False)
+        idxs, lengths = model.word_embeddings.sentences_to_padded_idx_tensor(self.questions)
+        with torch.no_grad():
+            self.assertTrue(torch.allclose(model(idxs, lengths), other_model(idxs, lengths)))
+
+    def test_round_trip(self):
+        models = [Model(self.word_embeddings, BagOfWords(), ClassifierNN(8)),
+                  Model(self.word_embeddings, EmbeddingBagOfWords(self.word_embeddings), ClassifierNN(8)),
+                  Model(self.word_embeddings, BiLSTM(8, 6, num_layers=2, combine_hidden="concat"), ClassifierNN(12))]
+
+        for idx, model in enumerate(models):
+            bundle = load_model_bundle(save_model_bundle(model, f"testfiles/models/model-{idx}"))
+            self.assertEqual(type(bundle.model.sentence_embeddings), type(model.sentence_embeddings))
+            self.assertEqual(bundle.one_hot_labels.label_for_idx(0), "NUM:perc")
+            self.assert_same_predictions(model, bundle.model)
+
+    def test_shares_embedding_table(self):
+        save_model_bundle(Model(self.word_embeddings, BagOfWords(), ClassifierNN(8)), "testfiles/models/bow")
+        save_model_bundle(Model(self.word_embeddings, BiLSTM(8, 6), ClassifierNN(6)), "testfiles/models/bilstm")
+
+        # one store for both bundles, and neither bundle's parameters hold the table
+        self.assertEqual(len([file_name for file_name in os.listdir("testfiles/models/embeddings")
+                              if file_name.endswith(".npy")]), 1)
+        parameters = torch.load(os.path.join("testfiles/models/bow", PARAMETERS_FILE_NAME))
+        self.assertFalse(any(name.startswith("word_embeddings") for name in parameters))
+
+        bow_bundle = load_model_bundle("testfiles/models/bow")
+        bilstm_bundle = load_model_bundle("testfiles/models/bilstm")
+        self.assertEqual(bow_bundle.embeddings_digest, bilstm_bundle.embeddings_digest)
+        self.assertIs(bow_bundle.model.word_embeddings, bilstm_bundle.model.word_embeddings)
+
+    def test_fine_tuned_tables_are_not_shared(self):
+        with open("../data/vocab.txt") as vocab_file:
+            vocab = [line.strip() for line in vocab_file]
+        word_embeddings = WordEmbeddings.from_random_embedding(vocab, 8, freeze=False)
+        save_model_bundle(Model(word_embeddings, BagOfWords(), ClassifierNN(8)), "testfiles/models/bow")
+
+        bundle = load_model_bundle("testfiles/models/bow")
+        other_bundle = load_model_bundle("testfiles/models/bow")
+        self.assertTrue(bundle.model.word_embeddings.embedding_layer.weight.requires_grad)
+        self.assertIsNot(bundle.model.word_embeddings, other_bundle.model.word_embeddings)
+
+    def tearDown(self):
+        if os.path.exists("testfiles"):
+            shutil.rmtree("testfiles")
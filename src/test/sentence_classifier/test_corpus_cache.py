@@ -0,0 +1,58 @@
+from unittest import TestCase
+
+import numpy as np
+import os
+import shutil
+
+from sentence_classifier.preprocessing.corpus_cache import TokenisedCorpus
+from sentence_classifier.preprocessing.tokenisation import parse_tokens
+
+
+class CorpusCacheTest(TestCase):
+    word_idx_dict = {"#UNK#": 0, "what": 1, "is": 2, "your": 3, "name": 4, "the": 5, "capital": 6, "of": 7,
+                     "france": 8, "?": 9}
+
+    def create_mock_corpus_file(self, extra_line: str = "") -> str:
+        if not os.path.exists("testfiles"):
+            os.mkdir("testfiles")
+
+        with open("testfiles/mock-train.txt", "w") as mock_corpus_file:
+            mock_corpus_file.writelines([
+                "HUM:ind What is your name ?\n",
+                "LOC:city What is the capital of France ?\n",
+                "LOC:country Where is Paris ?\n",
+                extra_line
+            ])
+
+            return mock_corpus_file.name
+
+    def test_build_maps_tokens_and_labels(self):
+        corpus = TokenisedCorpus.load_or_build(self.create_mock_corpus_file(), None, self.word_idx_dict,
+                                               "../data/labels.json")
+
+        self.assertEqual(len(corpus), 3)
+        self.assertEqual(list(corpus.lengths), [5, 7, 4])
+        token_ids, label_id = corpus[2]
+        self.assertEqual(list(token_ids), [self.word_idx_dict.get(word, 0)
+                                           for word in parse_tokens("Where is Paris ?".split())])
+
+    def test_cached_corpus_is_memory_mapped_and_invalidated(self):
+        corpus_file_path = self.create_mock_corpus_file()
+        built = TokenisedCorpus.load_or_build(corpus_file_path, None, self.word_idx_dict, "../data/labels.json",
+                                              "testfiles/cache")
+        cached = TokenisedCorpus.load_or_build(corpus_file_path, None, self.word_idx_dict, "../data/labels.json",
+                                               "testfiles/cache")
+
+        self.assertIsInstance(cached.token_ids, np.memmap)
+        self.assertTrue(np.array_equal(built.token_ids, cached.token_ids))
+        self.assertTrue(np.array_equal(built.label_ids, cached.label_ids))
+        self.assertEqual(len(os.listdir("testfiles/cache")), 1)
+
+        TokenisedCorpus.load_or_build(corpus_file_path, {"TOKENISE_STOPWORDS": True}, self.word_idx_dict,
+                                      "../data/labels.json", "testfiles/cache")
+        TokenisedCorpus.load_or_build(self.create_mock_corpus_file("HUM:ind Who ?\n"), None, self.word_idx_dict,
+                                      "../data/labels.json", "testfiles/cache")
+        self.assertEqual(len(os.listdir("testfiles/cache")), 3)
+
+    def tearDown(self):
+        shutil.rmtree("testfiles", ignore_errors=True)
@@ -0,0 +1,57 @@
+from unittest import TestCase
+import os
+import shutil
+
+import numpy as np
+
+from sentence_classifier.models.cross_validation import cross_validate
+from sentence_classifier.preprocessing.reader import load
+from sentence_classifier.utils.config import Config
+
+
+class CrossValidationTest(TestCase):
+
+    def create_config(self) -> Config:
+        if not os.path.exists("testfiles"):
+            os.mkdir("testfiles")
+
+        with open("testfiles/mock-config.ini", "w") as mock_config_file:
+            mock_config_file.writelines([
+                "[main]\n",
+                "path_train = ../data/dev.txt\n",
+                "path_test = ../data/test.txt\n",
+                "epochs = 1\n",
+                "lr = 0.01\n",
+                "batch_size = 64\n",
+                "early_stopping = 20\n",
+                "word_embeddings = random\n",
+                "train_word_embeddings = freeze\n",
+                "path_vocab = ../data/vocab.txt\n",
+                "word_embedding_dim = 16\n",
+                "sentence_embedder = bow\n",
+                "bilstm_input_dim = 16\n",
+                "bilstm_hidden_dim = 16\n",
+                "classifier_input_dim = 16\n",
+            ])
+
+        return Config.from_config_file("testfiles/mock-config.ini")
+
+    def test_cross_validate(self):
+        result = cross_validate(self.create_config(), k=3, num_workers=3, threads_per_worker=1)
+
+        self.assertEqual(len(result.fold_metrics), 3)
+        for metric in ["accuracy", "f1", "precision", "recall"]:
+            self.assertTrue(0 <= result.mean[metric] <= 1)
+            self.assertGreaterEqual(result.std[metric], 0)
+        self.assertAlmostEqual(result.mean["accuracy"],
+                               np.mean([metrics["accuracy"] for metrics in result.fold_metrics]))
+
+        # every question of the training file is scored by exactly one fold
+        _, labels = load("../data/dev.txt")
+        self.assertEqual(int(result.pooled["confusion"].sum()), len(labels))
+        self.assertTrue(np.array_equal(result.pooled["confusion"],
+                                       sum(metrics["confusion"] for metrics in result.fold_metrics)))
+
+    def tearDown(self):
+        if os.path.exists("testfiles"):
+            shutil.rmtree("testfiles")
@@ -0,0 +1,45 @@
+from unittest import TestCase
+
+import torch
+from torch import nn
+from torch.utils.data import DataLoader
+
+from sentence_classifier.models.training import train_model, evaluate_accuracy
+from sentence_classifier.models.model import Model
+from sentence_classifier.models.embedding import WordEmbeddings
+from sentence_classifier.models.BiLSTM import BiLSTM
+from sentence_classifier.models.classifier_nn import ClassifierNN
+from sentence_classifier.preprocessing.dataloading import DatasetQuestions
+
+
+class EarlyStoppingTest(TestCase):
+
+    def build_model(self) -> Model:
+        torch.manual_seed(42)
+        with open("../data/vocab.txt") as vocab_file:
+            vocab = [line.strip() for line in vocab_file]
+        word_embeddings = WordEmbeddings.from_random_embedding(vocab, 16, freeze=True)
+        return Model(word_embeddings, BiLSTM(16, 8), ClassifierNN(8))
+
+    def test_restores_best_validation_weights(self):
+        model = self.build_model()
+        # a learning rate this high makes the validation accuracy bounce around, so the last weights are not the best
+        best_accuracy = train_model(model, "../data/dev.txt", nn.CrossEntropyLoss(), 6,
+                                    torch.optim.Adam(model.parameters(), lr=0.05), 32,
+                                    validation_data_file_path="../data/dev.txt", validation_interval=5)
+        self.assertFalse(model.training)
+
+        dataset = DatasetQuestions("../data/dev.txt", None, model.word_embeddings.word_idx_dict)
+        data_loader = DataLoader(dataset, batch_size=256, collate_fn=dataset.collate_fn)
+        self.assertAlmostEqual(evaluate_accuracy(model, model, data_loader), best_accuracy)
+
+    def test_stops_without_improvement(self):
+        model = self.build_model()
+        optimizer = torch.optim.SGD(model.parameters(), lr=0.0)
+        steps = []
+        optimizer.register_step_post_hook(lambda *args: steps.append(1))
+
+        # with a learning rate of 0 nothing ever improves on the first validation
+        train_model(model, "../data/dev.txt", nn.CrossEntropyLoss(), 10, optimizer, 32,
+                    validation_data_file_path="../data/dev.txt", early_stopping=2, validation_interval=3)
+        self.assertEqual(len(steps), 9)
@@ -0,0 +1,55 @@
+from unittest import TestCase
+
+import numpy as np
+import os
+import shutil
+import torch
+
+from sentence_classifier.models.embedding import convert_embeddings_file, load_binary_embeddings
+from sentence_classifier.models.model import Model
+
+
+class EmbeddingStoreTest(TestCase):
+
+    def create_mock_embeddings_file(self) -> str:
+        if not os.path.exists("testfiles"):
+            os.mkdir("testfiles")
+
+        with open("testfiles/mock-glove.txt", "w") as mock_embeddings_file:
+            mock_embeddings_file.writelines([
+                "#UNK#\t0.0 0.0 0.0 0.0\n",
+                "what\t0.1 0.2 0.3 0.4\n",
+                "is\t-1.5 2.5 3.25 -4.0\n",
+                "france\t1e-3 2 3 4\n"
+            ])
+
+            return mock_embeddings_file.name
+
+    def test_convert_and_load(self):
+        store_path = convert_embeddings_file(self.create_mock_embeddings_file(), "testfiles/mock-glove.npy")
+        words, matrix = load_binary_embeddings(store_path)
+
+        self.assertEqual(words, ["#UNK#", "what", "is", "france"])
+        self.assertEqual(matrix.dtype, np.float32)
+        self.assertIsInstance(matrix, np.memmap)
+        self.assertTrue(np.allclose(matrix[2], [-1.5, 2.5, 3.25, -4.0]))
+
+    def test_builder_uses_store(self):
+        store_path = convert_embeddings_file(self.create_mock_embeddings_file(), "testfiles/mock-glove.npy")
+        model = (Model.Builder()
+                 .with_glove_word_embeddings(store_path)
+                 .with_bow_sentence_embedder()
+                 .with_classifier(4)
+                 .build())
+
+        text_model = (Model.Builder()
+                      .with_glove_word_embeddings("testfiles/mock-glove.txt")
+                      .with_bow_sentence_embedder()
+                      .with_classifier(4)
+                      .build())
+
+        self.assertEqual(model.word_embeddings.idx_for_word("france"), 3)
+        self.assertTrue(torch.equal(model.word_embeddings(["is", "france"]), text_model.word_embeddings(["is", "france"])))
+
+    def tearDown(self):
+        shutil.rmtree("testfiles")
@@ -0,0 +1,141 @@
+from unittest import TestCase
+import json
+import os
+import shutil
+
+import numpy as np
+import torch
+
+from sentence_classifier.models.ensemble import Ensemble, train_ensemble, bootstrap_sample, member_bundle_dir
+from sentence_classifier.models.bundle import save_model_bundle, load_model_bundle
+from sentence_classifier.models.prediction import ModelPredictor
+from sentence_classifier.models.model import Model
+from sentence_classifier.models.embedding import WordEmbeddings
+from sentence_classifier.models.bagofwords import BagOfWords, EmbeddingBagOfWords
+from sentence_classifier.models.BiLSTM import BiLSTM
+from sentence_classifier.models.classifier_nn import ClassifierNN
+from sentence_classifier.preprocessing.reader import load
+from sentence_classifier.preprocessing.tokenisation import parse_tokens
+from sentence_classifier.utils.config import Config
+
+
+class EnsembleTest(TestCase):
+
+    def build_members(self):
+        torch.manual_seed(42)
+        with open("../data/vocab.txt") as vocab_file:
+            vocab = [line.strip() for line in vocab_file]
+        word_embeddings = WordEmbeddings.from_random_embedding(vocab, 8)
+        # a copy of the same table, as members loaded from separate files would have
+        word_embeddings_copy = WordEmbeddings(vocab, word_embeddings.embedding_layer.weight.detach().clone(), True)
+        other_word_embeddings = WordEmbeddings.from_random_embedding(vocab, 8)
+
+        return [Model(word_embeddings, BagOfWords(), ClassifierNN(8)),
+                Model(word_embeddings_copy, EmbeddingBagOfWords(word_embeddings_copy), ClassifierNN(8)),
+                Model(word_embeddings, BiLSTM(8, 6), ClassifierNN(6)),
+                Model(other_word_embeddings, BiLSTM(8, 8, combine_hidden="concat"), ClassifierNN(16)),
+                Model(other_word_embeddings, BagOfWords(), ClassifierNN(8))]
+
+    def test_shares_word_embeddings(self):
+        ensemble = Ensemble(self.build_members())
+        self.assertEqual(ensemble.member_word_embeddings, [0, 0, 0, 1, 1])
+        self.assertEqual(sorted(len(members) for members, _ in ensemble.stacked_classifiers), [1, 1, 3])
+
+    def test_matches_members(self):
+        members = self.build_members()
+        ensemble = Ensemble(members)
+        questions, _ = load("../data/dev.txt")
+        questions = questions[:40]
+
+        with torch.no_grad():
+            expected = torch.stack([torch.cat([model(parse_tokens(question)) for question in questions])
+                                    for model in members]).mean(0)
+
+        self.assertTrue(torch.allclose(ensemble.log_probabilities(questions), expected, atol=1e-5))
+        self.assertEqual(ensemble.predict_batch(questions)[7], ensemble.predict(questions[7]))
+
+    def test_from_bundles_uses_members_rules(self):
+        members = self.build_members()[:2]
+        rules = {"TOKENISE_STOPWORDS": True}
+        for member, model in enumerate(members):
+            save_model_bundle(model, member_bundle_dir("testfiles/weights", member), tokenisation_rules=rules)
+
+        ensemble = Ensemble.from_bundles("testfiles/weights", 2)
+        self.assertTrue(ensemble.tokeniser.rules["TOKENISE_STOPWORDS"])
+
+        questions, _ = load("../data/dev.txt")
+        questions = questions[:20]
+        expected = torch.stack([ModelPredictor.from_bundle(load_model_bundle(member_bundle_dir("testfiles/weights",
+                                                                                               member)))
+                                .log_probabilities(questions) for member in range(2)]).mean(0)
+        self.assertTrue(torch.allclose(ensemble.log_probabilities(questions), expected, atol=1e-5))
+
+    def test_from_bundles_rejects_mismatched_members(self):
+        members = self.build_members()[:2]
+        save_model_bundle(members[0], member_bundle_dir("testfiles/weights", 0))
+        save_model_bundle(members[1], member_bundle_dir("testfiles/weights", 1),
+                          tokenisation_rules={"TOKENISE_STOPWORDS": True})
+        self.assertRaises(ValueError, lambda: Ensemble.from_bundles("testfiles/weights", 2))
+
+        with open("../data/labels.json") as labels_json_file:
+            labels = list(json.load(labels_json_file))
+        with open("testfiles/reversed-labels.json", "w") as labels_json_file:
+            json.dump(dict((label, idx) for idx, label in enumerate(reversed(labels))), labels_json_file)
+        save_model_bundle(members[1], member_bundle_dir("testfiles/weights", 1),
+                          labels_json_file_path="testfiles/reversed-labels.json")
+        self.assertRaises(ValueError, lambda: Ensemble.from_bundles("testfiles/weights", 2))
+
+    def tearDown(self):
+        if os.path.exists("testfiles"):
+            shutil.rmtree("testfiles")
+
+
+class EnsembleTrainingTest(TestCase):
+
+    def create_config(self) -> Config:
+        if not os.path.exists("testfiles"):
+            os.mkdir("testfiles")
+
+        with open("testfiles/mock-config.ini", "w") as mock_config_file:
+            mock_config_file.writelines([
+                "[main]\n",
+                "path_train = ../data/dev.txt\n",
+                "path_test = ../data/test.txt\n",
+                "epochs = 1\n",
+                "lr = 0.01\n",
+                "batch_size = 64\n",
+                "early_stopping = 20\n",
+                "word_embeddings = random\n",
+                "train_word_embeddings = freeze\n",
+                "path_vocab = ../data/vocab.txt\n",
+                "word_embedding_dim = 16\n",
+                "sentence_embedder = bilstm\n",
+                "bilstm_input_dim = 16\n",
+                "bilstm_hidden_dim = 8\n",
+                "classifier_input_dim = 8\n",
+            ])
+
+        return Config.from_config_file("testfiles/mock-config.ini")
+
+    def test_bootstrap_sample(self):
+        sample = bootstrap_sample(100, 1)
+        self.assertEqual(len(sample), 100)
+        self.assertTrue(np.array_equal(sample, bootstrap_sample(100, 1)))
+        self.assertFalse(np.array_equal(sample, bootstrap_sample(100, 2)))
+        # drawn with replacement, so some questions are repeated
+        self.assertLess(len(np.unique(sample)), 100)
+
+    def test_train_ensemble(self):
+        bundle_dirs = train_ensemble(self.create_config(), 3, "testfiles/weights", num_workers=3, threads_per_worker=1)
+        self.assertEqual(bundle_dirs, [f"testfiles/weights/member-{i + 1}" for i in range(3)])
+
+        members = Ensemble.load_members("testfiles/weights", 3)
+        # each member was trained from its own seed on its own resample
+        self.assertFalse(torch.equal(members[0].classifier.fc3.weight, members[1].classifier.fc3.weight))
+
+        questions, _ = load("../data/dev.txt")
+        self.assertEqual(len(Ensemble(members).predict_batch(questions[:10])), 10)
+
+    def tearDown(self):
+        if os.path.exists("testfiles"):
+            shutil.rmtree("testfiles")
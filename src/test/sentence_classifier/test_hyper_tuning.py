@@ -0,0 +1,133 @@
+from unittest import TestCase
+import csv
+import glob
+import os
+import shutil
+
+import torch
+
+from sentence_classifier.models.hyper_tuning import LogUniform, grid_trials, random_trials, trial_config, run_search, \
+    successive_halving, run_halving_trial
+from sentence_classifier.utils.config import Config, ConfigurationException
+
+
+class HyperTuningTest(TestCase):
+
+    def create_base_config(self, epochs: int = 1) -> Config:
+        if not os.path.exists("testfiles"):
+            os.mkdir("testfiles")
+
+        with open("testfiles/mock-config.ini", "w") as mock_config_file:
+            mock_config_file.writelines([
+                "[main]\n",
+                "path_train = ../data/dev.txt\n",
+                "path_test = ../data/test.txt\n",
+                f"epochs = {epochs}\n",
+                "lr = 0.01\n",
+                "batch_size = 64\n",
+                "early_stopping = 20\n",
+                "word_embeddings = random\n",
+                "train_word_embeddings = freeze\n",
+                "path_vocab = ../data/vocab.txt\n",
+                "word_embedding_dim = 16\n",
+                "sentence_embedder = bow\n",
+                "bilstm_input_dim = 16\n",
+                "bilstm_hidden_dim = 16\n",
+                "classifier_input_dim = 16\n",
+            ])
+
+        return Config.from_config_file("testfiles/mock-config.ini")
+
+    def test_grid_trials(self):
+        trials = grid_trials({"lr": [0.1, 0.01], "sentence_embedder": ["bow", "bilstm"], "epochs": [5]})
+        self.assertEqual(len(trials), 4)
+        self.assertIn({"lr": 0.01, "sentence_embedder": "bilstm", "epochs": 5}, trials)
+
+        self.assertRaises(ConfigurationException, lambda: grid_trials({"lr": LogUniform(1e-4, 1e-1)}))
+
+    def test_grid_trials_skip_unused_params(self):
+        # bow ignores the hidden dim, so its two hidden dims would train the same model twice
+        trials = grid_trials({"sentence_embedder": ["bow", "bilstm"], "bilstm_hidden_dim": [150, 300]})
+        self.assertEqual(trials, [{"sentence_embedder": "bow"},
+                                  {"sentence_embedder": "bilstm", "bilstm_hidden_dim": 150},
+                                  {"sentence_embedder": "bilstm", "bilstm_hidden_dim": 300}])
+
+        # without a searched sentence embedder, the base config's is used
+        trials = grid_trials({"lr": [0.1, 0.01], "bilstm_hidden_dim": [150, 300]}, self.create_base_config())
+        self.assertEqual(trials, [{"lr": 0.1}, {"lr": 0.01}])
+
+    def test_random_trials(self):
+        search_space = {"lr": LogUniform(1e-4, 1e-1), "bilstm_hidden_dim": [50, 100, 150]}
+        trials = random_trials(search_space, 20, seed=1)
+
+        self.assertEqual(trials, random_trials(search_space, 20, seed=1))
+        for trial in trials:
+            self.assertTrue(1e-4 <= trial["lr"] <= 1e-1)
+            self.assertIn(trial["bilstm_hidden_dim"], [50, 100, 150])
+
+    def test_trial_config(self):
+        base_config = self.create_base_config()
+
+        config = trial_config(base_config, {"sentence_embedder": "bilstm", "bilstm_hidden_dim": 12,
+                                            "bilstm_combine_hidden": "concat"})
+        self.assertEqual(config.classifier_input_dim, 24)
+        self.assertEqual(base_config.sentence_embedder, "bow")
+
+        self.assertRaises(ConfigurationException, lambda: trial_config(base_config, {"learning_rate": 0.1}))
+        self.assertRaises(ConfigurationException, lambda: trial_config(base_config, {"sentence_embedder": "cnn"}))
+
+    def test_run_search(self):
+        trials = grid_trials({"lr": [0.01], "sentence_embedder": ["bow", "bilstm"]})
+        results = run_search(self.create_base_config(), trials, "testfiles/results.csv", num_workers=2,
+                             threads_per_worker=1)
+
+        self.assertEqual(len(results), 2)
+        for result in results:
+            self.assertIsNone(result.error)
+            self.assertTrue(0 <= result.f1 <= 1)
+            self.assertGreater(result.peak_memory_mb, 0)
+
+        with open("testfiles/results.csv") as results_file:
+            rows = list(csv.DictReader(results_file))
+        self.assertEqual(sorted(row["sentence_embedder"] for row in rows), ["bilstm", "bow"])
+
+    def test_successive_halving(self):
+        trials = grid_trials({"lr": [0.05, 0.01], "sentence_embedder": ["bow", "bilstm"]})
+        results = successive_halving(self.create_base_config(epochs=4), trials, "testfiles/results.csv",
+                                     "testfiles/checkpoints", min_epochs=1, reduction_factor=2, num_workers=2,
+                                     threads_per_worker=1)
+
+        # 4 trials get 1 epoch, the best 2 get 2 epochs, and the best of those gets all 4
+        with open("testfiles/results.csv") as results_file:
+            rows = list(csv.DictReader(results_file))
+        self.assertEqual(sorted(int(row["epochs"]) for row in rows), [1, 1, 1, 1, 2, 2, 4])
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].epochs, 4)
+
+        checkpoint_file_paths = glob.glob(f"testfiles/checkpoints/trial-{results[0].trial}-*.pt")
+        self.assertEqual(len(checkpoint_file_paths), 1)
+        checkpoint = torch.load(checkpoint_file_paths[0])
+        self.assertEqual(checkpoint["epochs"], 4)
+        # the frozen word embeddings are rebuilt from the trial's seed rather than checkpointed
+        self.assertFalse(any(name.startswith("word_embeddings") for name in checkpoint["parameters"]))
+
+    def test_halving_trial_ignores_checkpoint_past_budget(self):
+        base_config = self.create_base_config(epochs=4)
+        params = {"lr": 0.05}
+        os.makedirs("testfiles/checkpoints")
+        os.makedirs("testfiles/fresh-checkpoints")
+        run_halving_trial(base_config, params, 0, 2, "testfiles/checkpoints")
+
+        # as if the search were rerun with a smaller budget
+        result = run_halving_trial(base_config, params, 0, 1, "testfiles/checkpoints")
+        fresh_result = run_halving_trial(base_config, params, 0, 1, "testfiles/fresh-checkpoints")
+        self.assertIsNone(result.error)
+        self.assertEqual(result.epochs, 1)
+        self.assertEqual(result.f1, fresh_result.f1)
+        # the bigger checkpoint is kept for the rung that reaches it
+        checkpoint_file_path, = glob.glob("testfiles/checkpoints/trial-0-*.pt")
+        self.assertEqual(torch.load(checkpoint_file_path)["epochs"], 2)
+
+    def tearDown(self):
+        if os.path.exists("testfiles"):
+            shutil.rmtree("testfiles")
@@ -0,0 +1,44 @@
+from unittest import TestCase
+from collections import Counter
+
+import numpy as np
+
+from sentence_classifier.preprocessing.reader import load
+from sentence_classifier.utils.kfold import KFold, StratifiedKFold
+
+
+class KFoldTest(TestCase):
+
+    def test_kfold(self):
+        folds = list(KFold(list(range(7)), 3))
+        self.assertEqual(folds, [([2, 3, 4, 5, 6], [0, 1]), ([0, 1, 4, 5, 6], [2, 3]), ([0, 1, 2, 3], [4, 5, 6])])
+
+    def test_stratified_kfold_partitions(self):
+        _, labels = load("../data/train.txt")
+        folds = list(StratifiedKFold(labels, 5, seed=0))
+
+        self.assertEqual(len(folds), 5)
+        all_val_idxs = np.concatenate([val_idxs for _, val_idxs in folds])
+        self.assertTrue(np.array_equal(np.sort(all_val_idxs), np.arange(len(labels))))
+        for train_idxs, val_idxs in folds:
+            self.assertEqual(len(train_idxs) + len(val_idxs), len(labels))
+            self.assertEqual(len(np.intersect1d(train_idxs, val_idxs)), 0)
+
+    def test_stratified_kfold_keeps_label_proportions(self):
+        _, labels = load("../data/train.txt")
+        labels = np.array(labels)
+        label_counts = Counter(labels)
+
+        for _, val_idxs in StratifiedKFold(labels, 5, seed=0):
+            fold_label_counts = Counter(labels[val_idxs])
+            for label, count in label_counts.items():
+                self.assertLessEqual(abs(fold_label_counts[label] - count / 5), 1)
+
+    def test_stratified_kfold_shuffle(self):
+        labels = ["a"] * 10 + ["b"] * 10
+        same_seed = [val_idxs for _, val_idxs in StratifiedKFold(labels, 2, seed=3)]
+        self.assertTrue(all(np.array_equal(a, b) for a, b in
+                            zip(same_seed, [val_idxs for _, val_idxs in StratifiedKFold(labels, 2, seed=3)])))
+
+        unshuffled = [val_idxs.tolist() for _, val_idxs in StratifiedKFold(labels, 2, shuffle=False)]
+        self.assertEqual(unshuffled, [[0, 2, 4, 6, 8, 10, 12, 14, 16, 18], [1, 3, 5, 7, 9, 11, 13, 15, 17, 19]])
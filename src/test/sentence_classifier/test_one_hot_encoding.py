@@ -0,0 +1,60 @@
+from unittest import TestCase
+
+import numpy as np
+
+from sentence_classifier.utils.one_hot_encoding import OneHotEncoder, UNKNOWN_TOKEN
+from sentence_classifier.preprocessing.reader import load, stream_questions
+
+
+class OneHotEncoderTest(TestCase):
+
+    def setUp(self):
+        self.questions = [["how", "far", "is", "it"], ["far", "far", "away"], []]
+
+    def test_encode_csr(self):
+        encoder = OneHotEncoder()
+        indices, offsets = encoder.encode_csr(iter(self.questions), update_corpus=True)
+
+        self.assertEqual(list(encoder.corpus), [UNKNOWN_TOKEN, "how", "far", "is", "it", "away"])
+        self.assertTrue(np.array_equal(indices, [1, 2, 3, 4, 2, 2, 5]))
+        self.assertTrue(np.array_equal(offsets, [0, 4, 7, 7]))
+        # without updating the corpus, new words are unknown
+        indices, _ = encoder.encode_csr([["how", "near", "is", "it"]])
+        self.assertTrue(np.array_equal(indices, [1, 0, 3, 4]))
+
+    def test_encode_ids(self):
+        encoder = OneHotEncoder()
+        ids, lengths = encoder.encode_ids(self.questions, update_corpus=True)
+
+        self.assertTrue(np.array_equal(ids, [[1, 2, 3, 4],
+                                             [2, 2, 5, 0],
+                                             [0, 0, 0, 0]]))
+        self.assertTrue(np.array_equal(lengths, [4, 3, 0]))
+
+    def test_encode_bag_of_words(self):
+        encoder = OneHotEncoder()
+        bow_ids, bow_counts, bow_offsets = encoder.encode_bag_of_words(self.questions, update_corpus=True)
+
+        self.assertTrue(np.array_equal(bow_ids, [1, 2, 3, 4, 2, 5]))
+        self.assertTrue(np.array_equal(bow_counts, [1, 1, 1, 1, 2, 1]))
+        self.assertTrue(np.array_equal(bow_offsets, [0, 4, 6, 6]))
+
+    def test_matches_dense_encoding(self):
+        questions, _ = load("../data/dev.txt")
+        questions = questions[:50]
+        dense = OneHotEncoder().encode(questions, update_corpus=True)
+        indices, offsets = OneHotEncoder().encode_csr(questions, update_corpus=True)
+
+        for question_idx, one_hot_tokens in enumerate(dense):
+            self.assertEqual(one_hot_tokens.sum(), len(questions[question_idx]))
+            self.assertTrue(np.array_equal(np.argmax(one_hot_tokens, axis=1),
+                                           indices[offsets[question_idx]:offsets[question_idx + 1]]))
+
+    def test_add_to_corpus_streamed(self):
+        encoder = OneHotEncoder()
+        encoder.add_to_corpus(stream_questions("../data/dev.txt", chunk_size=256, labelled=True))
+
+        questions, _ = load("../data/dev.txt")
+        self.assertEqual(len(encoder), len(set(token for question in questions for token in question)) + 1)
+        indices, _ = encoder.encode_csr(questions)
+        self.assertFalse(np.any(indices == 0))
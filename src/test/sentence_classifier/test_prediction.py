@@ -0,0 +1,78 @@
+from unittest import TestCase
+import os
+import shutil
+
+import torch
+
+from sentence_classifier.models.prediction import predict_log_probabilities, write_predictions
+from sentence_classifier.models.model import Model
+from sentence_classifier.models.embedding import WordEmbeddings
+from sentence_classifier.models.BiLSTM import BiLSTM
+from sentence_classifier.models.classifier_nn import ClassifierNN
+from sentence_classifier.preprocessing.reader import load, stream_questions
+from sentence_classifier.preprocessing.tokenisation import parse_tokens
+from sentence_classifier.utils.one_hot_labels import OneHotLabels
+
+
+class PredictionTest(TestCase):
+
+    def setUp(self):
+        torch.manual_seed(42)
+        with open("../data/vocab.txt") as vocab_file:
+            vocab = [line.strip() for line in vocab_file]
+        self.model = Model(WordEmbeddings.from_random_embedding(vocab, 8), BiLSTM(8, 6), ClassifierNN(6))
+        self.model.train(False)
+        self.one_hot_labels = OneHotLabels.from_labels_json_file("../data/labels.json")
+
+        self.questions, _ = load("../data/dev.txt")
+        self.questions = self.questions[:50]
+        if not os.path.exists("testfiles"):
+            os.mkdir("testfiles")
+        with open("testfiles/questions.txt", "w") as questions_file:
+            questions_file.writelines(f"{' '.join(question)}\n\n" for question in self.questions)
+
+    def test_predict_log_probabilities(self):
+        batches = list(predict_log_probabilities(self.model, stream_questions("testfiles/questions.txt"),
+                                                 batch_size=16))
+        self.assertEqual([len(batch) for batch in batches], [16, 16, 16, 2])
+
+        with torch.no_grad():
+            expected = torch.cat([self.model(parse_tokens(question)) for question in self.questions])
+        self.assertTrue(torch.allclose(torch.cat(batches), expected, atol=1e-5))
+
+    def test_write_predictions(self):
+        num_questions = write_predictions(self.model, "testfiles/questions.txt", "testfiles/out/eval_result.txt",
+                                          self.one_hot_labels, batch_size=16, top_k=3)
+        self.assertEqual(num_questions, 50)
+
+        with open("testfiles/out/eval_result.txt") as eval_result_file:
+            lines = [line.rstrip("\n").split("\t") for line in eval_result_file]
+        self.assertEqual(len(lines), 50)
+
+        with torch.no_grad():
+            log_probabilities = self.model(parse_tokens(self.questions[3]))[0]
+        predicted_label, *top_k = lines[3]
+        self.assertEqual(predicted_label, self.one_hot_labels.label_for_idx(int(torch.argmax(log_probabilities))))
+        self.assertEqual(len(top_k), 6)
+        self.assertEqual(top_k[0], predicted_label)
+        self.assertAlmostEqual(float(top_k[1]), float(torch.max(log_probabilities)), places=4)
+        self.assertGreaterEqual(float(top_k[1]), float(top_k[3]))
+
+    def test_write_labelled_predictions(self):
+        write_predictions(self.model, "../data/dev.txt", "testfiles/eval_result.txt", self.one_hot_labels,
+                          labelled=True)
+        _, labels = load("../data/dev.txt")
+        with open("testfiles/eval_result.txt") as eval_result_file:
+            self.assertEqual(sum(1 for _ in eval_result_file), len(labels))
+
+    def test_failed_write_leaves_no_files(self):
+        # the classifier does not fit the BiLSTM's output, so running the first batch fails
+        model = Model(self.model.word_embeddings, BiLSTM(8, 6), ClassifierNN(7))
+        self.assertRaises(RuntimeError, lambda: write_predictions(model, "testfiles/questions.txt",
+                                                                  "testfiles/out/eval_result.txt",
+                                                                  self.one_hot_labels))
+        self.assertEqual(os.listdir("testfiles/out"), [])
+
+    def tearDown(self):
+        if os.path.exists("testfiles"):
+            shutil.rmtree("testfiles")
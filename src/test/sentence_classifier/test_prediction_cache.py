@@ -0,0 +1,127 @@
+from unittest import TestCase
+import os
+import shutil
+
+import torch
+
+from sentence_classifier.models.prediction_cache import PredictionCache, CachedPredictor
+from sentence_classifier.models.prediction import ModelPredictor
+from sentence_classifier.models.bundle import save_model_bundle, load_model_bundle
+from sentence_classifier.models.ensemble import Ensemble
+from sentence_classifier.models.model import Model
+from sentence_classifier.models.embedding import WordEmbeddings
+from sentence_classifier.models.bagofwords import BagOfWords
+from sentence_classifier.models.BiLSTM import BiLSTM
+from sentence_classifier.models.classifier_nn import ClassifierNN
+from sentence_classifier.preprocessing.reader import load
+from sentence_classifier.utils.one_hot_labels import OneHotLabels
+
+
+class PredictionCacheTest(TestCase):
+
+    def test_lru_eviction(self):
+        cache = PredictionCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (3, 1))
+
+    def test_ttl(self):
+        now = [0.0]
+        cache = PredictionCache(ttl=10, clock=lambda: now[0])
+        cache.put("a", 1)
+        now[0] = 9.0
+        self.assertEqual(cache.get("a"), 1)
+        now[0] = 10.0
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["expirations"], 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_bind(self):
+        cache = PredictionCache()
+        cache.bind("model-1")
+        cache.put("a", 1)
+        cache.bind("model-1")
+        self.assertEqual(len(cache), 1)
+        cache.bind("model-2")
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats()["invalidations"], 1)
+
+
+class CachedPredictorTest(TestCase):
+
+    def setUp(self):
+        torch.manual_seed(42)
+        with open("../data/vocab.txt") as vocab_file:
+            vocab = [line.strip() for line in vocab_file]
+        self.word_embeddings = WordEmbeddings.from_random_embedding(vocab, 8)
+        self.one_hot_labels = OneHotLabels.from_labels_json_file("../data/labels.json")
+        self.predictor = ModelPredictor(Model(self.word_embeddings, BiLSTM(8, 6), ClassifierNN(6)),
+                                        self.one_hot_labels)
+        self.questions, _ = load("../data/dev.txt")
+        self.questions = self.questions[:20]
+
+    def test_matches_predictor(self):
+        predictor = CachedPredictor(self.predictor)
+        expected = self.predictor.log_probabilities(self.questions)
+
+        self.assertTrue(torch.allclose(predictor.log_probabilities(self.questions), expected))
+        # the second time round every question is a hit, and a batch's repeats are only looked up once
+        self.assertTrue(torch.allclose(predictor.log_probabilities(self.questions + self.questions[:5]),
+                                       torch.cat([expected, expected[:5]])))
+        self.assertEqual(predictor.cache.stats()["hits"], 20)
+        self.assertEqual(predictor.predict_batch(self.questions), self.predictor.predict_batch(self.questions))
+
+    def test_repeats_missed_once(self):
+        run_batches = []
+
+        class CountingPredictor(ModelPredictor):
+            def tokenised_log_probabilities(self, tokenised_questions):
+                run_batches.append(tokenised_questions)
+                return super().tokenised_log_probabilities(tokenised_questions)
+
+        predictor = CachedPredictor(CountingPredictor(self.predictor.model, self.one_hot_labels))
+        log_probabilities = predictor.log_probabilities([self.questions[0], self.questions[1], self.questions[0]])
+
+        self.assertTrue(torch.equal(log_probabilities[0], log_probabilities[2]))
+        self.assertEqual([len(batch) for batch in run_batches], [2])
+        self.assertEqual((predictor.cache.stats()["hits"], predictor.cache.stats()["misses"]), (0, 2))
+
+    def test_keyed_on_tokenised_question(self):
+        predictor = CachedPredictor(self.predictor)
+        # tokenisation lower-cases, so these share an entry
+        predictor.log_probabilities([["What", "year", "was", "1984", "published", "?"]])
+        predictor.log_probabilities([["WHAT", "YEAR", "was", "1984", "published", "?"]])
+        self.assertEqual(predictor.cache.stats()["hits"], 1)
+
+    def test_invalidated_by_another_bundle(self):
+        save_model_bundle(Model(self.word_embeddings, BagOfWords(), ClassifierNN(8)), "testfiles/bow")
+        save_model_bundle(Model(self.word_embeddings, BiLSTM(8, 6), ClassifierNN(6)), "testfiles/bilstm")
+        cache = PredictionCache()
+
+        bow_predictor = CachedPredictor(ModelPredictor.from_bundle(load_model_bundle("testfiles/bow")), cache)
+        bow_predictor.log_probabilities(self.questions)
+        # reloading the same bundle keeps the cache
+        CachedPredictor(ModelPredictor.from_bundle(load_model_bundle("testfiles/bow")), cache)
+        self.assertEqual(len(cache), 20)
+
+        bilstm_predictor = CachedPredictor(ModelPredictor.from_bundle(load_model_bundle("testfiles/bilstm")), cache)
+        self.assertEqual(len(cache), 0)
+        self.assertTrue(torch.allclose(bilstm_predictor.log_probabilities(self.questions),
+                                       bilstm_predictor.predictor.log_probabilities(self.questions)))
+
+    def test_ensemble(self):
+        ensemble = Ensemble([self.predictor.model, Model(self.word_embeddings, BagOfWords(), ClassifierNN(8))])
+        predictor = CachedPredictor(ensemble)
+        self.assertTrue(torch.allclose(predictor.log_probabilities(self.questions),
+                                       ensemble.log_probabilities(self.questions)))
+
+    def tearDown(self):
+        if os.path.exists("testfiles"):
+            shutil.rmtree("testfiles")
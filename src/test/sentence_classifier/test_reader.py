@@ -0,0 +1,49 @@
+from unittest import TestCase
+import os
+import tempfile
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+from sentence_classifier.preprocessing.dataloading import DatasetQuestions, StreamingDatasetQuestions
+from sentence_classifier.preprocessing.reader import load, stream, write_questions_subset
+from sentence_classifier.utils.vocab import VocabUtils
+
+
+class ReaderTest(TestCase):
+
+    def test_stream_matches_load(self):
+        questions, types = load("../data/dev.txt")
+        streamed = list(stream("../data/dev.txt", chunk_size=64))
+
+        self.assertEqual([qtype for qtype, question in streamed], types)
+        self.assertEqual([question for qtype, question in streamed], questions)
+
+    def test_write_questions_subset(self):
+        questions, labels = load("../data/dev.txt")
+        with tempfile.TemporaryDirectory() as subset_dir:
+            subset_file_path = write_questions_subset("../data/dev.txt", np.array([5, 0, 5]),
+                                                      os.path.join(subset_dir, "subset.txt"))
+            self.assertEqual(load(subset_file_path), ([questions[5], questions[0], questions[5]],
+                                                      [labels[5], labels[0], labels[5]]))
+
+    def test_stream_splits_labels(self):
+        qtype, question = next(stream("../data/train.txt", split_labels=True))
+        self.assertEqual(qtype, ("DESC", "manner"))
+
+    def test_streaming_dataset_matches_dataset(self):
+        vocab = VocabUtils.load_vocab("../data/vocab.txt")
+        word_idx_dict = dict((word, idx) for idx, word in enumerate(vocab))
+
+        dataset = DatasetQuestions("../data/dev.txt", None, word_idx_dict)
+        streaming_dataset = StreamingDatasetQuestions("../data/dev.txt", None, word_idx_dict, chunk_size=128)
+
+        expected = DataLoader(dataset, batch_size=len(dataset), collate_fn=dataset.collate_fn)
+        streamed = DataLoader(streaming_dataset, batch_size=len(dataset), collate_fn=streaming_dataset.collate_fn)
+        for expected_tensor, streamed_tensor in zip(next(iter(expected)), next(iter(streamed))):
+            self.assertTrue(torch.equal(expected_tensor, streamed_tensor))
+
+        sharded = DataLoader(streaming_dataset, batch_size=16, num_workers=2,
+                             collate_fn=streaming_dataset.collate_fn)
+        self.assertEqual(sum(len(label_idxs) for _, _, label_idxs in sharded), len(dataset))
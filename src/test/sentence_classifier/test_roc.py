@@ -0,0 +1,151 @@
+from unittest import TestCase
+import pickle
+
+import numpy as np
+import torch
+
+from sentence_classifier.analysis import roc
+
+
+class RocTest(TestCase):
+
+    def test_analyse(self):
+        true_labels = ["a", "a", "b", "b", "c", "c"]
+        predicted_labels = ["a", "b", "b", "b", "c", "a"]
+        analysis = roc.analyse(true_labels, predicted_labels)
+
+        self.assertEqual(analysis["labels"], ["a", "b", "c"])
+        self.assertTrue(np.array_equal(analysis["confusion"], [[1, 0, 1],
+                                                                [1, 2, 0],
+                                                                [0, 0, 1]]))
+        self.assertAlmostEqual(analysis["accuracy"], 4 / 6)
+        self.assertAlmostEqual(analysis["f1"], 4 / 6)
+
+        # a: p = 1/2, r = 1/2; b: p = 2/3, r = 1; c: p = 1, r = 1/2
+        self.assertTrue(np.allclose(analysis["per_class"]["precision"], [1 / 2, 2 / 3, 1]))
+        self.assertTrue(np.allclose(analysis["per_class"]["recall"], [1 / 2, 1, 1 / 2]))
+        self.assertTrue(np.array_equal(analysis["per_class"]["support"], [2, 2, 2]))
+        self.assertAlmostEqual(analysis["macro_precision"], (1 / 2 + 2 / 3 + 1) / 3)
+        self.assertAlmostEqual(analysis["macro_f1"], (1 / 2 + 4 / 5 + 2 / 3) / 3)
+
+    def test_analyse_idxs_matches_analyse(self):
+        rng = np.random.default_rng(0)
+        true_label_idxs = rng.integers(0, 50, 1000)
+        predicted_label_idxs = np.where(rng.random(1000) < 0.6, true_label_idxs, rng.integers(0, 50, 1000))
+
+        analysis = roc.analyse_idxs(true_label_idxs, predicted_label_idxs, 50)
+        string_analysis = roc.analyse([f"label-{idx}" for idx in true_label_idxs],
+                                      [f"label-{idx}" for idx in predicted_label_idxs])
+        for metric in ["accuracy", "f1", "precision", "recall", "macro_f1", "macro_precision", "macro_recall"]:
+            self.assertAlmostEqual(analysis[metric], string_analysis[metric])
+        self.assertEqual(int(analysis["confusion"].sum()), 1000)
+
+    def test_analyse_log_probabilities(self):
+        log_probabilities = torch.log_softmax(torch.randn(20, 5, requires_grad=True), dim=1)
+        true_label_idxs = torch.randint(0, 5, (20,))
+
+        analysis = roc.analyse_idxs(true_label_idxs, log_probabilities)
+        self.assertEqual(analysis["confusion"].shape, (5, 5))
+        self.assertAlmostEqual(analysis["accuracy"],
+                               float(torch.mean((torch.argmax(log_probabilities, dim=1) == true_label_idxs).float())))
+
+    def test_unseen_classes(self):
+        analysis = roc.analyse_idxs([0, 0, 1], [0, 1, 1], num_classes=4)
+        # classes 2 and 3 are neither true nor predicted, so they score 0 but are left out of the macro averages
+        self.assertTrue(np.array_equal(analysis["per_class"]["f1"][2:], [0, 0]))
+        self.assertAlmostEqual(analysis["macro_recall"], (1 / 2 + 1) / 2)
+
+
+class StreamingMetricsTest(TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.true_label_idxs = rng.integers(0, 10, 500)
+        self.log_probabilities = np.log(rng.dirichlet(np.ones(10), 500))
+
+    def test_matches_analyse_idxs(self):
+        metrics = roc.StreamingMetrics(10)
+        for batch_start in range(0, 500, 64):
+            metrics.update(torch.from_numpy(self.true_label_idxs[batch_start:batch_start + 64]),
+                           torch.from_numpy(self.log_probabilities[batch_start:batch_start + 64]))
+
+        analysis = roc.analyse_idxs(self.true_label_idxs, self.log_probabilities)
+        report = metrics.report()
+        self.assertEqual(len(metrics), 500)
+        self.assertTrue(np.array_equal(report["confusion"], analysis["confusion"]))
+        for metric in ["accuracy", "f1", "macro_f1"]:
+            self.assertAlmostEqual(report[metric], analysis[metric])
+
+    def test_merge(self):
+        # as if each half had been evaluated by its own worker process
+        halves = [pickle.loads(pickle.dumps(roc.StreamingMetrics(10).update(self.true_label_idxs[idxs],
+                                                                             self.log_probabilities[idxs])))
+                  for idxs in [slice(0, 250), slice(250, 500)]]
+        merged = halves[0] + halves[1]
+
+        self.assertAlmostEqual(merged.report()["f1"], roc.analyse_idxs(self.true_label_idxs,
+                                                                        self.log_probabilities)["f1"])
+        # adding makes a new accumulator, leaving both halves as they were
+        self.assertEqual(len(halves[0]), 250)
+        self.assertRaises(ValueError, lambda: merged.merge(roc.StreamingMetrics(5)))
+
+
+class RocAucTest(TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.true_label_idxs = rng.integers(0, 6, 300)
+        # rounded, so there are plenty of tied scores
+        self.log_probabilities = np.round(np.log(rng.dirichlet(np.ones(6), 300)), 1)
+
+    @staticmethod
+    def pairwise_auc(scores, positives):
+        # the chance a positive outscores a negative, ties counting half
+        positive_scores, negative_scores = scores[positives][:, None], scores[~positives][None, :]
+        return (np.sum(positive_scores > negative_scores) + np.sum(positive_scores == negative_scores) / 2) / \
+            (positive_scores.size * negative_scores.size)
+
+    def test_matches_pairwise_auc(self):
+        analysis = roc.roc_auc(torch.from_numpy(self.true_label_idxs), torch.from_numpy(self.log_probabilities))
+
+        for label_idx in range(6):
+            self.assertAlmostEqual(analysis["auc"][label_idx],
+                                   self.pairwise_auc(self.log_probabilities[:, label_idx],
+                                                     self.true_label_idxs == label_idx))
+        self.assertAlmostEqual(analysis["macro_auc"], float(np.mean(analysis["auc"])))
+        self.assertAlmostEqual(analysis["micro_auc"],
+                               self.pairwise_auc(self.log_probabilities.ravel(),
+                                                 (self.true_label_idxs[:, None] == np.arange(6)).ravel()))
+
+    def test_curves(self):
+        analysis = roc.roc_auc([0, 0, 1, 1], np.log([[0.9, 0.1], [0.4, 0.6], [0.6, 0.4], [0.2, 0.8]]))
+        curve = analysis["curves"][0]
+
+        self.assertTrue(np.allclose(curve["fpr"], [0, 0, 0.5, 0.5, 1]))
+        self.assertTrue(np.allclose(curve["tpr"], [0, 0.5, 0.5, 1, 1]))
+        self.assertTrue(np.allclose(curve["thresholds"], [np.inf] + list(np.log([0.9, 0.6, 0.4, 0.2]))))
+        self.assertAlmostEqual(analysis["auc"][0], 0.75)
+
+    def test_classes_without_curve(self):
+        analysis = roc.roc_auc([0, 1, 0, 1], np.log(np.full((4, 3), 1 / 3)), num_bootstrap=20, seed=0)
+        # class 2 is never true; every score ties, so the others are no better than chance
+        self.assertTrue(np.isnan(analysis["auc"][2]))
+        self.assertTrue(np.all(np.isnan(analysis["auc_ci"][2])))
+        self.assertAlmostEqual(analysis["macro_auc"], 0.5)
+
+    def test_bootstrap(self):
+        analysis = roc.roc_auc(self.true_label_idxs, self.log_probabilities, num_bootstrap=200, seed=3)
+
+        self.assertEqual(analysis["auc_ci"].shape, (6, 2))
+        self.assertTrue(np.all(analysis["auc_ci"][:, 0] <= analysis["auc_ci"][:, 1]))
+        low, high = analysis["micro_auc_ci"]
+        self.assertTrue(low < analysis["micro_auc"] < high)
+        low, high = analysis["macro_auc_ci"]
+        self.assertTrue(low < analysis["macro_auc"] < high)
+        # resampling is seeded, and does not depend on how many resamples are drawn at once
+        roc.BOOTSTRAP_CHUNK_ELEMENTS, chunk_elements = 1, roc.BOOTSTRAP_CHUNK_ELEMENTS
+        try:
+            self.assertEqual(roc.roc_auc(self.true_label_idxs, self.log_probabilities, num_bootstrap=200,
+                                         seed=3)["macro_auc_ci"], analysis["macro_auc_ci"])
+        finally:
+            roc.BOOTSTRAP_CHUNK_ELEMENTS = chunk_elements
@@ -0,0 +1,77 @@
+from unittest import TestCase
+
+import os
+import shutil
+import numpy as np
+import torch
+
+from sentence_classifier.models.embedding import WordEmbeddings
+from sentence_classifier.models.model import Model
+from sentence_classifier.models.bagofwords import BagOfWords
+from sentence_classifier.models.BiLSTM import BiLSTM
+from sentence_classifier.models.classifier_nn import ClassifierNN
+from sentence_classifier.models.sentence_features import can_precompute_sentence_features, load_sentence_features
+
+
+class SentenceFeaturesTest(TestCase):
+    vocab = ["#UNK#", "what", "is", "your", "name", "the", "capital", "of", "france", "?"]
+
+    def create_mock_training_file(self) -> str:
+        if not os.path.exists("testfiles"):
+            os.mkdir("testfiles")
+
+        with open("testfiles/mock-train.txt", "w") as mock_training_file:
+            mock_training_file.writelines([
+                "HUM:ind What is your name ?\n",
+                "LOC:city What is the capital of France ?\n",
+                "LOC:country What is France ?\n"
+            ])
+
+            return mock_training_file.name
+
+    def build_model(self, freeze=True, bilstm=False) -> Model:
+        torch.manual_seed(42)
+        word_embeddings = WordEmbeddings.from_random_embedding(self.vocab, 8, freeze=freeze)
+        sentence_embedder = BiLSTM(8, 8) if bilstm else BagOfWords()
+        return Model(word_embeddings, sentence_embedder, ClassifierNN(8))
+
+    def test_only_frozen_bow_models_are_precomputed(self):
+        self.assertTrue(can_precompute_sentence_features(self.build_model()))
+        self.assertFalse(can_precompute_sentence_features(self.build_model(freeze=False)))
+        self.assertFalse(can_precompute_sentence_features(self.build_model(bilstm=True)))
+
+    def test_features_match_model_and_are_cached(self):
+        model = self.build_model()
+        training_file_path = self.create_mock_training_file()
+
+        features, label_idxs = load_sentence_features(model, training_file_path, cache_dir="testfiles/cache")
+        self.assertEqual(features.size(), (3, 8))
+        self.assertEqual(len(os.listdir("testfiles/cache")), 1)
+
+        expected = model.sentence_embeddings(model.word_embeddings(["what", "is", "france", "?"]))
+        self.assertTrue(torch.allclose(features[2], expected[0]))
+
+        cached_features, cached_label_idxs = load_sentence_features(model, training_file_path,
+                                                                    cache_dir="testfiles/cache")
+        self.assertTrue(torch.equal(features, cached_features))
+        self.assertTrue(torch.equal(label_idxs, cached_label_idxs))
+
+        load_sentence_features(model, training_file_path, {"TOKENISE_STOPWORDS": True}, cache_dir="testfiles/cache")
+        self.assertEqual(len(os.listdir("testfiles/cache")), 2)
+
+    def test_seeded_random_embeddings_share_cache(self):
+        training_file_path = self.create_mock_training_file()
+
+        def seeded_model(seed: int) -> Model:
+            np.random.seed(seed)
+            return self.build_model()
+
+        load_sentence_features(seeded_model(1), training_file_path, cache_dir="testfiles/cache")
+        # rebuilding with the same seed, as every --train run does, reuses the cached features
+        load_sentence_features(seeded_model(1), training_file_path, cache_dir="testfiles/cache")
+        self.assertEqual(len(os.listdir("testfiles/cache")), 1)
+        load_sentence_features(seeded_model(2), training_file_path, cache_dir="testfiles/cache")
+        self.assertEqual(len(os.listdir("testfiles/cache")), 2)
+
+    def tearDown(self):
+        shutil.rmtree("testfiles", ignore_errors=True)
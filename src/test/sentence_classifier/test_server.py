@@ -0,0 +1,144 @@
+from unittest import TestCase
+import asyncio
+import json
+
+import torch
+
+from sentence_classifier.models.server import InferenceServer, MicroBatcher
+from sentence_classifier.models.prediction import ModelPredictor
+from sentence_classifier.models.prediction_cache import PredictionCache
+from sentence_classifier.models.model import Model
+from sentence_classifier.models.embedding import WordEmbeddings
+from sentence_classifier.models.BiLSTM import BiLSTM
+from sentence_classifier.models.classifier_nn import ClassifierNN
+from sentence_classifier.preprocessing.reader import load
+from sentence_classifier.utils.one_hot_labels import OneHotLabels
+
+
+async def http_request(port: int, method: str, path: str, body: dict = None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    encoded_body = json.dumps(body).encode() if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(encoded_body)}\r\n"
+                 f"Connection: close\r\n\r\n".encode() + encoded_body)
+    await writer.drain()
+
+    response = await reader.read()
+    writer.close()
+    head, _, response_body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(response_body)
+
+
+class MicroBatcherTest(TestCase):
+
+    def test_batches_concurrent_items(self):
+        batches = []
+
+        def predict_batch(items):
+            batches.append(items)
+            return [item * 2 for item in items]
+
+        async def submit_all():
+            batcher = MicroBatcher(predict_batch, max_batch_size=8, max_wait=0.05)
+            batcher.start()
+            results = await asyncio.gather(*[batcher.submit(item) for item in range(20)])
+            await batcher.stop()
+            return results, batcher.metrics
+
+        results, metrics = asyncio.run(submit_all())
+        self.assertEqual(results, [item * 2 for item in range(20)])
+        self.assertEqual([len(batch) for batch in batches], [8, 8, 4])
+        self.assertEqual(metrics.report(0)["batch_sizes"], {"4": 1, "8": 2})
+
+    def test_failed_batch(self):
+        def predict_batch(items):
+            raise RuntimeError("out of memory")
+
+        async def submit():
+            batcher = MicroBatcher(predict_batch)
+            batcher.start()
+            try:
+                await batcher.submit(1)
+            finally:
+                await batcher.stop()
+
+        self.assertRaises(RuntimeError, lambda: asyncio.run(submit()))
+
+
+class InferenceServerTest(TestCase):
+
+    def setUp(self):
+        torch.manual_seed(42)
+        with open("../data/vocab.txt") as vocab_file:
+            vocab = [line.strip() for line in vocab_file]
+        model = Model(WordEmbeddings.from_random_embedding(vocab, 8), BiLSTM(8, 6), ClassifierNN(6))
+        self.predictor = ModelPredictor(model, OneHotLabels.from_labels_json_file("../data/labels.json"))
+        questions, _ = load("../data/dev.txt")
+        self.questions = [" ".join(question) for question in questions[:30]]
+
+    def test_serves_predictions(self):
+        async def run_requests():
+            server = InferenceServer(self.predictor, max_batch_size=16, max_wait=0.05, top_k=2)
+            port = await server.start(port=0)
+            try:
+                single_responses = await asyncio.gather(*[http_request(port, "POST", "/predict",
+                                                                       {"question": question})
+                                                          for question in self.questions])
+                batch_response = await http_request(port, "POST", "/predict", {"questions": self.questions[:3]})
+                bad_response = await http_request(port, "POST", "/predict", {"text": "hello"})
+                metrics_response = await http_request(port, "GET", "/metrics")
+            finally:
+                await server.stop()
+            return single_responses, batch_response, bad_response, metrics_response
+
+        single_responses, batch_response, bad_response, metrics_response = asyncio.run(run_requests())
+
+        expected_labels = self.predictor.predict_batch([question.split() for question in self.questions])
+        self.assertEqual([status for status, _ in single_responses], [200] * 30)
+        self.assertEqual([prediction["label"] for _, prediction in single_responses], expected_labels)
+        self.assertEqual(len(single_responses[0][1]["top_k"]), 2)
+        self.assertEqual([prediction["label"] for prediction in batch_response[1]["predictions"]],
+                         expected_labels[:3])
+        self.assertEqual(bad_response[0], 400)
+
+        status, metrics = metrics_response
+        self.assertEqual(status, 200)
+        self.assertEqual(metrics["questions"], 33)
+        self.assertEqual(metrics["queue_depth"], 0)
+        self.assertLessEqual(metrics["latency_ms"]["p50"], metrics["latency_ms"]["p99"])
+        # the concurrent requests were answered by fewer forward passes than questions
+        self.assertLess(sum(metrics["batch_sizes"].values()), 33)
+        self.assertTrue(all(int(batch_size) <= 16 for batch_size in metrics["batch_sizes"]))
+
+    def test_rejects_empty_question(self):
+        async def run_requests():
+            server = InferenceServer(self.predictor, max_batch_size=16, max_wait=0.05)
+            port = await server.start(port=0)
+            try:
+                return await asyncio.gather(http_request(port, "POST", "/predict", {"question": "  "}),
+                                            http_request(port, "POST", "/predict", {"question": self.questions[0]}),
+                                            http_request(port, "POST", "/predict",
+                                                         {"questions": [self.questions[1], ""]}))
+            finally:
+                await server.stop()
+
+        empty_response, valid_response, mixed_response = asyncio.run(run_requests())
+        self.assertEqual(empty_response[0], 400)
+        self.assertEqual(mixed_response[0], 400)
+        # the concurrent valid question is unaffected
+        self.assertEqual(valid_response[0], 200)
+        self.assertEqual(valid_response[1]["label"], self.predictor.predict_batch([self.questions[0].split()])[0])
+
+    def test_caches_predictions(self):
+        async def run_requests():
+            server = InferenceServer(self.predictor, cache=PredictionCache(max_size=100))
+            port = await server.start(port=0)
+            try:
+                for _ in range(2):
+                    await http_request(port, "POST", "/predict", {"questions": self.questions[:10]})
+                return await http_request(port, "GET", "/metrics")
+            finally:
+                await server.stop()
+
+        _, metrics = asyncio.run(run_requests())
+        self.assertEqual(metrics["cache"]["hits"], 10)
+        self.assertEqual(metrics["cache"]["misses"], 10)
@@ -0,0 +1,42 @@
+from unittest import TestCase
+import subprocess
+import sys
+
+from sentence_classifier.utils.startup_benchmark import time_command
+
+
+class StartupTest(TestCase):
+
+    def run_python(self, code: str) -> str:
+        return subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+
+    def test_help_does_not_import_torch(self):
+        output = self.run_python("import runpy, sys\n"
+                                 "sys.argv = ['question_classifier.py', '--help']\n"
+                                 "try:\n"
+                                 "    runpy.run_path('question_classifier.py', run_name='__main__')\n"
+                                 "except SystemExit:\n"
+                                 "    pass\n"
+                                 "print('torch' in sys.modules)")
+        self.assertIn("usage:", output)
+        self.assertEqual(output.split()[-1], "False")
+
+    def test_importing_ensemble_is_cheap(self):
+        output = self.run_python("import sys\n"
+                                 "opened = []\n"
+                                 "sys.addaudithook(lambda event, args: event == 'open' and opened.append(str(args[0])))\n"
+                                 "import sentence_classifier.models.ensemble\n"
+                                 "print('torch' in sys.modules)\n"
+                                 "print(any(path.endswith('.txt') for path in opened))")
+        self.assertEqual(output.split(), ["False", "False"])
+
+    def test_importing_hyper_tuning_is_cheap(self):
+        output = self.run_python("import sys\n"
+                                 "import sentence_classifier.models.hyper_tuning\n"
+                                 "print('torch' in sys.modules)")
+        self.assertEqual(output.split(), ["False"])
+
+    def test_time_command(self):
+        times = time_command([sys.executable, "-c", "pass"], 2)
+        self.assertEqual(len(times), 2)
+        self.assertTrue(all(t > 0 for t in times))
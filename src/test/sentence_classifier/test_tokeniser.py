@@ -0,0 +1,87 @@
+from unittest import TestCase
+from itertools import product
+from typing import List
+
+from sentence_classifier.preprocessing.reader import load
+from sentence_classifier.preprocessing.tokenisation.stopwords import replace_stopwords
+from sentence_classifier.preprocessing.tokenisation.tokeniser import Tokeniser, DEFAULT_RULES, TOKEN_STOPWORDS, \
+    TOKEN_CHAR_MONTH, TOKEN_CHAR_URL, TOKEN_CHAR_MONEY, TOKEN_CHAR_PERCENTAGE, TOKEN_YEAR, TOKEN_CHAR_NUM, \
+    months_tokens, is_num, parse_quotes, merge_comma_seperated_numers
+
+
+def reference_parse_tokens(tokens: List[str], rules: dict) -> List[str]:
+    """
+    The rule-by-rule parse_tokens implementation that Tokeniser replaces, kept here as the reference it must match
+    """
+    tokens = [token.lower() for token in tokens]
+
+    if rules["TOKENISE_STOPWORDS"]:
+        tokens = replace_stopwords(tokens, TOKEN_STOPWORDS)
+
+    if rules["TOKENISE_QUOTES"]:
+        tokens = parse_quotes(tokens)
+
+    parsed_tokens = []
+    for token in tokens:
+        if token == "?" and rules["REMOVE_QUESTION_MARKS"]:
+            continue
+        if token in months_tokens and rules["TOKENISE_MONTH"]:
+            token = TOKEN_CHAR_MONTH
+        if ".com" in token and rules["TOKENISE_URLS"]:
+            token = TOKEN_CHAR_URL
+        if token[0] in {"$", "£"} and rules["TOKENISE_MONEY"]:
+            token = TOKEN_CHAR_MONEY
+        if token[-1] == "%" and is_num(token[:-1]) and rules["TOKENISE_PERCENTAGES"]:
+            token = TOKEN_CHAR_PERCENTAGE
+        if is_num(token) and "." not in token and len(token) == 4 and rules["TOKENISE_YEAR"]:
+            token = TOKEN_YEAR
+        if is_num(token) and rules["TOKENISE_NUMBERS"]:
+            token = TOKEN_CHAR_NUM
+        if token == "&":
+            token = "and"
+        parsed_tokens.append(token)
+
+    if rules["TOKENISE_COMMA_SEPERATED_NUMBERS"]:
+        parsed_tokens = merge_comma_seperated_numers(parsed_tokens)
+
+    return parsed_tokens
+
+
+class TokeniserTest(TestCase):
+    sentences = [
+        "What is the population of Canada in 1999 ?".split(),
+        "How much did it cost , $ 1 , 000 , 000 or $5.99 ?".split(),
+        "Who said `` To be or not to be '' in May ?".split(),
+        "`` Open quote `` nested `` quote '' and '' stray ''".split(),
+        "`` Never closed quote 1 , 2".split(),
+        ", 5 what 1 , 000 NaN inf 1e10 1_000 +12 -3.5 50% .5% 12.5% %".split(),
+        "5 was the answer , 7 ,".split(),
+        ", 3 a 4".split(),
+        "Visit WWW.Example.COM & Jan or September for £ 20".split(),
+        "1 , , 2 , 3 , , 4 5 , 6".split(),
+        ["?"],
+        [],
+    ]
+
+    def test_matches_reference_for_every_rule_combination(self):
+        for values in product([False, True], repeat=len(DEFAULT_RULES)):
+            rules = dict(zip(DEFAULT_RULES.keys(), values))
+            tokeniser = Tokeniser(rules)
+
+            for sentence in self.sentences:
+                self.assertEqual(tokeniser.tokenise(sentence), reference_parse_tokens(list(sentence), rules),
+                                 msg=f'{rules} {sentence}')
+
+    def test_matches_reference_on_training_data(self):
+        questions, _ = load("../data/train.txt")
+        all_rules = dict((rule, True) for rule in DEFAULT_RULES)
+
+        for rules in [dict(DEFAULT_RULES), all_rules]:
+            self.assertEqual(Tokeniser(rules).tokenise_batch(questions),
+                             [reference_parse_tokens(list(question), rules) for question in questions])
+
+    def test_parallel_matches_serial(self):
+        questions, _ = load("../data/dev.txt")
+        tokeniser = Tokeniser(dict((rule, True) for rule in DEFAULT_RULES))
+
+        self.assertEqual(tokeniser.tokenise_batch(questions, num_workers=3), tokeniser.tokenise_batch(questions))